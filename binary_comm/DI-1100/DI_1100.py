@@ -14,10 +14,11 @@ Such attempts will fail.
 
 While the DI-1100's protocol is similar to model DI-2108, it doesn't support
 a decimation function. Therefore, its minimum sample rate of ~915 Hz is 
-too fast for this program to work properly because of its heavy
-use of print statements. The program overcomes that problem 
-through use of a 'decimation_factor' variable to slow scan rate to an 
-acceptable level. 
+faster than a useful console readout. The program uses a
+'decimation_factor' variable to average scans down to an acceptable rate.
+The readout itself is refreshed at a fixed rate by dataq/display.py
+whatever the scan rate, so decimation is for noise reduction and
+readability rather than to keep up with print statements.
 
 The DI-1100 used with this program MUST be placed in its CDC communication mode. 
 Follow this link for guidance:
@@ -29,11 +30,21 @@ https://www.dataq.com/resources/pdfs/misc/di-1100-protocol.pdf
 """
 
 
+import os
+import sys
 import serial
 import serial.tools.list_ports
 import keyboard
 import time
 
+# The shared dataq package lives in the binary_comm folder, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dataq import di_1100, tuning
+from dataq.commands import CommandEngine
+from dataq.display import Display
+from dataq.manager import AcquisitionConfig
+from dataq.reader import ScanReader
+
 """ 
 Example slist for model DI-1100
 0x0000 = Analog channel 0, ±10 V range
@@ -45,6 +56,8 @@ Example slist for model DI-1100
 slist = [0x0000,0x0001,0x0002,0x0003]
 
 ser=serial.Serial()
+# Matches command echoes to commands, with per-command timeouts instead of fixed sleeps
+engine = CommandEngine(ser)
 
 """
 Since model DI-1100 cannot scan slower that 915 Hz at the protocol level, 
@@ -62,8 +75,16 @@ every nth value, but is recommended since it reduces noise by a factor of n^0.5
 # Define a decimation factor variable
 decimation_factor = 1000
 
-# Contains accumulated values for each analog channel used for the average calculation
-achan_accumulation_table = list(())
+"""
+Longest time in seconds from a scan being sampled to its display. The
+packet size ('ps') and host read size are chosen for it by dataq.tuning,
+as dataq.manager.configure() does, instead of a fixed 'ps 0' that sends
+a USB packet every few scans however fast the instrument scans.
+"""
+latency_budget = 0.1
+
+# Averages whole blocks of scans, carrying a partial window between reads
+decoder = di_1100.Decoder(slist, decimation_factor)
 
 # Define flag to indicate if acquiring is active 
 acquiring = False
@@ -97,34 +118,23 @@ def discovery():
 
 # Sends a passed command string after appending <cr>
 def send_cmd(command):
-    ser.write((command+'\r').encode())
-    time.sleep(.1)
-    if not(acquiring):
-        # Echo commands if not acquiring
-        while True:
-            if(ser.inWaiting() > 0):
-                while True:
-                    try:
-                        s = ser.readline().decode()
-                        s = s.strip('\n')
-                        s = s.strip('\r')
-                        s = s.strip(chr(0))
-                        break
-                    except:
-                        continue
-                if s != "":
-                    print (s)
-                    break
+    if acquiring:
+        # The background reader owns the port, so don't wait for the echo
+        ser.write((command+'\r').encode())
+        return
+    # Echo commands if not acquiring
+    response = engine.execute([command])[0]
+    if response:
+        print (response)
 
 # Configure the instrment's scan list
 def config_scn_lst():
-    # Scan list position must start with 0 and increment sequentially
-    position = 0
-    for item in slist:
-        send_cmd("slist "+ str(position ) + " " + str(item))
-        # Add the channel to the logical list.
-        achan_accumulation_table.append(0)
-        position += 1
+    # Scan list position must start with 0 and increment sequentially. The
+    # commands are sent back to back and each echo is matched to its command
+    commands = ["slist " + str(position) + " " + str(item) for position, item in enumerate(slist)]
+    for response in engine.execute(commands):
+        if response:
+            print (response)
 
 while discovery() == False:
     discovery()
@@ -132,8 +142,11 @@ while discovery() == False:
 send_cmd("stop")
 # Define binary output mode
 send_cmd("encode 0")
-# Keep the packet size small for responsiveness
-send_cmd("ps 0")
+# Packet and read sizes that deliver scans within the latency budget at
+# the srate sent below
+config = AcquisitionConfig(slist, srate=60000, latency_budget=latency_budget)
+tuned = tuning.for_config("DI-1100", config)
+send_cmd("ps " + str(tuned.ps))
 # Configure the instrument's scan list
 config_scn_lst()
 
@@ -145,105 +158,65 @@ print("Ready to acquire...")
 print ("")
 print("Press <g> to go, <s> to stop, and <q> to quit:")
 
-# This is the slist position pointer. Ranges from 0 (first position)
-# to len(slist)
-slist_pointer = 0
-
-# Init a decimation counter:
-dec_count = decimation_factor
+# The decoder's compiled scan plan knows the number of bytes in one scan
+scan_bytes = decoder.plan.scan_bytes
 
-# Init the logical channel number for enabled analog channels
-achan_number = 0
+# Background reader that drains the serial port while acquiring
+reader = None
 
-# This is the constructed output string
-output_string = ""
+# Shows the latest scan at a fixed refresh rate, however fast scans arrive
+display = Display(decoder.plan)
+display.start()
 
 # This is the main program loop, broken only by typing a command key as defined
 while True:
     # If key 'G' start scanning
     if keyboard.is_pressed('g' or  'G'):
          keyboard.read_key()
-         acquiring = True
-         send_cmd("start")
+         # Ignored while acquiring, since only one reader may drain the port
+         if reader is None:
+             acquiring = True
+             send_cmd("start")
+             # Hand reading over to a background thread until stopped
+             reader = ScanReader(ser, scan_bytes, read_size=tuned.read_size)
+             reader.start()
     # If key 'S' stop scanning
     if keyboard.is_pressed('s' or 'S'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          time.sleep(1)
          ser.flushInput()
+         # Start the next run with an empty decimation window
+         decoder.reset()
+         # Drop the last snapshot so it cannot overwrite the messages below
+         display.clear()
          print ("")
          print ("stopped")
          acquiring = False
     # If key 'Q' exit 
     if keyboard.is_pressed('q' or 'Q'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          ser.flushInput()
          break
-    while (ser.inWaiting() > (2 * len(slist))):
-         for i in range(len(slist)):
-            # Always two bytes per sample...read them
-            bytes = ser.read(2)
-            # Only analog channels for a DI-1100, with dig_in states appearing in the two LSBs of ONLY the first slist position
-            result = int.from_bytes(bytes,byteorder='little', signed=True)
-
-            # Since digital input states are embedded into the analog data stream there are four possibilities:
-            if (dec_count == 1) and (slist_pointer == 0):
-                # Decimation loop finished and first slist position
-                # Two LSBs carry information only for first slist posiiton. So, ...
-                # Preserve lower two bits representing digital input states
-                dig_in = result & 0x3
-                # Strip two LSBs from value to be added to the analog channel accumulation, preserving sign
-                result = result >> 2
-                result = result << 2
-                # Add the value to the accumulator
-                achan_accumulation_table[achan_number] = result + achan_accumulation_table[achan_number]
-                achan_number += 1
-                # End of a decimation loop. So, append accumulator value / decimation_factor  to the output string
-                output_string = output_string + "{: 3.3f}, ".format(achan_accumulation_table[achan_number-1] * 10 / 32768 / decimation_factor)
-
-            elif (dec_count == 1) and (slist_pointer != 0):
-                # Decimation loop finished and NOT the first slist position
-                # Two LSBs carry information only for first slist posiiton, which this isn't. So, ...
-                # Just add value to the accumulator
-                achan_accumulation_table[achan_number] = result + achan_accumulation_table[achan_number]
-                achan_number += 1
-                # End of a decimation loop. So, append accumulator value / decimation_factor  to the output string
-                output_string = output_string + "{: 3.3f}, ".format(achan_accumulation_table[achan_number-1] * 10 / 32768 / decimation_factor)
-
-            elif (dec_count != 1) and (slist_pointer == 0):
-                # Decimation loop NOT finished and first slist position
-                # Not the end of a decimation loop, but this is the first position in slist. So, ...
-                # Just strip two LSBs, preserving sign...
-                result = result >> 2
-                result = result << 2
-                # ...and add the value to the accumulator
-                achan_accumulation_table[achan_number] = result + achan_accumulation_table[achan_number]
-                achan_number += 1
-            else:
-                # Decimation loop NOT finished and NOT first slist position
-                # Nothing to do except add the value to the accumlator
-                achan_accumulation_table[achan_number] = result + achan_accumulation_table[achan_number]
-                achan_number += 1
-
-            # Get the next position in slist
-            slist_pointer += 1
-
-            if (slist_pointer + 1) > (len(slist)):
-                # End of a pass through slist items
-                if dec_count == 1:
-                    # Get here if decimation loop has finished
-                    dec_count = decimation_factor
-                    # Reset analog channel accumulators to zero
-                    achan_accumulation_table = [0] * len(achan_accumulation_table)
-                    # Append digital inputs to output string
-                    output_string = output_string + "{: 3d}, ".format(dig_in)
-                    print(output_string.rstrip(", ") + "           ", end="\r") 
-                    output_string = ""
-                else:
-                    dec_count -= 1             
-                slist_pointer = 0
-                achan_number = 0
+    if reader is not None:
+         # Wait briefly for whole scans so the keys are still checked regularly
+         block = reader.get(timeout=0.05)
+         if len(block):
+             # Average the whole block and show the most recent completed window
+             block = decoder.decode(block)
+             display.show(block)
+    else:
+         time.sleep(0.05)
+display.stop()
 ser.close()
 SystemExit
 
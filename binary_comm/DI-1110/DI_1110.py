@@ -14,10 +14,11 @@ Such attempts will fail.
 
 While the DI-1110's protocol is similar to model DI-2108, it doesn't support
 a decimation function. Therefore, its minimum sample rate of ~915 Hz is 
-too fast for this program to work properly because of its heavy
-use of print statements. This program overcomes that problem 
-through use of a 'decimation_factor' variable to slow scan rate to an 
-acceptable level. 
+faster than a useful console readout. The program uses a
+'decimation_factor' variable to average scans down to an acceptable rate.
+The readout itself is refreshed at a fixed rate by dataq/display.py
+whatever the scan rate, so decimation is for noise reduction and
+readability rather than to keep up with print statements.
 
 The DI-1110 used with this program MUST be placed in its CDC communication mode. 
 Follow this link for guidance:
@@ -29,11 +30,21 @@ https://www.dataq.com/resources/pdfs/misc/di-1110-protocol.pdf
 """
 
 
+import os
+import sys
 import serial
 import serial.tools.list_ports
 import keyboard
 import time
 
+# The shared dataq package lives in the binary_comm folder, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dataq import di_1110, tuning
+from dataq.commands import CommandEngine
+from dataq.display import Display
+from dataq.manager import AcquisitionConfig
+from dataq.reader import ScanReader
+
 """ 
 Example slist for model DI-1110
 0x0000 = Analog channel 0, ±10 V range
@@ -44,13 +55,9 @@ Example slist for model DI-1110
 """
 slist = [0x0000,0x0001,0x0709,0x0008,0x000A]
 
-"""
-Define a tuple that contains an ordered list of rate measurement ranges supported by the DI-1110. 
-The first item in the list is the lowest gain code (e.g. 50 kHz range = gain code 1).
-"""
-rate_ranges = tuple((50000,20000,10000,5000,2000,1000,500,200,100,50,20,10))
-
 ser=serial.Serial()
+# Matches command echoes to commands, with per-command timeouts instead of fixed sleeps
+engine = CommandEngine(ser)
 
 """
 Since model DI-1110 cannot scan slower that 915 Hz at the protocol level, 
@@ -68,11 +75,19 @@ every nth value, but is recommended since it reduces noise by a factor of n^0.5
 # Define a decimation factor variable
 decimation_factor = 1000
 
-# Contains accumulated values for each analog channel used for the average calculation
-achan_accumulation_table = list(())
+"""
+Longest time in seconds from a scan being sampled to its display. The
+packet size ('ps') and host read size are chosen for it by dataq.tuning,
+as dataq.manager.configure() does, instead of a fixed 'ps 0' that sends
+a USB packet every few scans however fast the instrument scans.
+"""
+latency_budget = 0.1
 
-# Init variable to contain accumulated rate channel reading for an average calculation. 
-rate_accum = 0 
+"""
+Averages whole blocks of scans, carrying a partial window between reads.
+Rate ranges are defined in dataq/di_1110.py.
+"""
+decoder = di_1110.Decoder(slist, decimation_factor)
 
 # Define flag to indicate if acquiring is active 
 acquiring = False
@@ -106,44 +121,23 @@ def discovery():
 
 # Sends a passed command string after appending <cr>
 def send_cmd(command):
-    ser.write((command+'\r').encode())
-    time.sleep(.1)
-    if not(acquiring):
-        # Echo commands if not acquiring
-        while True:
-            if(ser.inWaiting() > 0):
-                while True:
-                    try:
-                        s = ser.readline().decode()
-                        s = s.strip('\n')
-                        s = s.strip('\r')
-                        s = s.strip(chr(0))
-                        break
-                    except:
-                        continue
-                if s != "":
-                    print (s)
-                    break
+    if acquiring:
+        # The background reader owns the port, so don't wait for the echo
+        ser.write((command+'\r').encode())
+        return
+    # Echo commands if not acquiring
+    response = engine.execute([command])[0]
+    if response:
+        print (response)
 
 # Configure the instrment's scan list
 def config_scn_lst():
-    # Scan list position must start with 0 and increment sequentially
-    position = 0
-    # Define rate_range globally, since we need it to scale the rate channel while scanning
-    global rate_range
-    for item in slist:
-        send_cmd("slist "+ str(position ) + " " + str(item))
-        
-        if ((item) & (0xf)) < 8:
-            # This is an analog channel. Refer to the slist DI-1110 prototype
-            # as defined in its protocol. Add the channel to the logical list.
-            achan_accumulation_table.append(0)
-
-        if ((item) & (0xf)) == 9:
-            # This is a Rate channel. Set rate_range to the defined range.
-            # Refer to the protocol document for details. 
-            rate_range = rate_ranges[(slist[position] >> 8)-1]
-        position += 1
+    # Scan list position must start with 0 and increment sequentially. The
+    # commands are sent back to back and each echo is matched to its command
+    commands = ["slist " + str(position) + " " + str(item) for position, item in enumerate(slist)]
+    for response in engine.execute(commands):
+        if response:
+            print (response)
 
 while discovery() == False:
     discovery()
@@ -151,8 +145,11 @@ while discovery() == False:
 send_cmd("stop")
 # Define binary output mode
 send_cmd("encode 0")
-# Keep the packet size small for responsiveness
-send_cmd("ps 0")
+# Packet and read sizes that deliver scans within the latency budget at
+# the srate sent below
+config = AcquisitionConfig(slist, srate=60000, latency_budget=latency_budget)
+tuned = tuning.for_config("DI-1110", config)
+send_cmd("ps " + str(tuned.ps))
 # Configure the instrument's scan list
 config_scn_lst()
 
@@ -164,26 +161,28 @@ print("Ready to acquire...")
 print ("")
 print("Press <g> to go, <s> to stop, <r> to reset counter, and <q> to quit:")
 
-# This is the slist position pointer. Ranges from 0 (first position)
-# to len(slist)
-slist_pointer = 0
+# The decoder's compiled scan plan knows the number of bytes in one scan
+scan_bytes = decoder.plan.scan_bytes
 
-# Init a decimation counter:
-dec_count = decimation_factor
+# Background reader that drains the serial port while acquiring
+reader = None
 
-# Init the logical channel number for enabled analog channels
-achan_number = 0
-
-# This is the constructed output string
-output_string = ""
+# Shows the latest scan at a fixed refresh rate, however fast scans arrive
+display = Display(decoder.plan)
+display.start()
 
 # This is the main program loop, broken only by typing a command key as defined
 while True:
     # If key 'G' start scanning
     if keyboard.is_pressed('g' or  'G'):
          keyboard.read_key()
-         acquiring = True
-         send_cmd("start")
+         # Ignored while acquiring, since only one reader may drain the port
+         if reader is None:
+             acquiring = True
+             send_cmd("start")
+             # Hand reading over to a background thread until stopped
+             reader = ScanReader(ser, scan_bytes, read_size=tuned.read_size)
+             reader.start()
     # If key 'r' reset counter
     if keyboard.is_pressed('r' or  'R'):
          keyboard.read_key()
@@ -191,71 +190,40 @@ while True:
     # If key 'S' stop scanning
     if keyboard.is_pressed('s' or 'S'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          time.sleep(1)
          ser.flushInput()
+         # Start the next run with an empty decimation window
+         decoder.reset()
+         # Drop the last snapshot so it cannot overwrite the messages below
+         display.clear()
          print ("")
          print ("stopped")
          acquiring = False
     # If key 'Q' exit 
     if keyboard.is_pressed('q' or 'Q'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          ser.flushInput()
          break
-    while (ser.inWaiting() > (2 * len(slist))):
-         for i in range(len(slist)):
-            # The four LSBs of slist determine measurement function
-            function = (slist[slist_pointer]) & (0xf)
-            # Always two bytes per sample...read them
-            bytes = ser.read(2)
-            if function < 8:
-                # Working with an Analog input channel
-                result = int.from_bytes(bytes,byteorder='little', signed=True)
-                achan_accumulation_table[achan_number] = result + achan_accumulation_table[achan_number]
-                achan_number += 1
-                if dec_count == 1:
-                    # Get here if decimation count has expired. Scale & output the average of 'decimation_factor' number of values
-                    output_string = output_string + "{: 3.3f}, ".format(achan_accumulation_table[achan_number-1] * 10 / 32768 / decimation_factor)
-
-            elif function == 8:
-                # Working with the Digital input channel 
-                if dec_count == 1:
-                    result = (int.from_bytes(bytes,byteorder='big', signed=False)) & (0x007f)
-                    output_string = output_string + "{: 3d}, ".format(result)
-
-            elif function == 9:
-                # Working with the Rate input channel
-                result = (int.from_bytes(bytes,byteorder='little', signed=True) + 32768)
-                rate_accum = rate_accum + result
-                if dec_count == 1:
-                    # Get here if decimation count has expired. Scale & output the average of 'decimation_factor' number of values
-                    output_string = output_string + "{: 3.1f}, ".format(rate_accum / 65535 * rate_range / decimation_factor)              
-
-            else:
-                # Working with the Counter input channel
-                if dec_count == 1:
-                    result = (int.from_bytes(bytes,byteorder='little', signed=True)) + 32768
-                    output_string = output_string + "{: 1d}, ".format(result)
-
-            # Get the next position in slist
-            slist_pointer += 1
-
-            if (slist_pointer + 1) > (len(slist)):
-                # End of a pass through slist items
-                if dec_count == 1:
-                    # Get here if decimation loop has expired
-                    dec_count = decimation_factor
-                    # Reset the Rate channel accumulator
-                    rate_accum = 0
-                    # Reset analog channel accumulators to zero
-                    achan_accumulation_table = [0] * len(achan_accumulation_table)
-                    print(output_string.rstrip(", ") + "           ", end="\r") 
-                    output_string = ""
-                else:
-                    dec_count -= 1             
-                slist_pointer = 0
-                achan_number = 0
+    if reader is not None:
+         # Wait briefly for whole scans so the keys are still checked regularly
+         block = reader.get(timeout=0.05)
+         if len(block):
+             # Average the whole block and show the most recent completed window
+             block = decoder.decode(block)
+             display.show(block)
+    else:
+         time.sleep(0.05)
+display.stop()
 ser.close()
 SystemExit
 
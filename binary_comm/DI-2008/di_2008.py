@@ -24,11 +24,22 @@ https://www.dataq.com/resources/pdfs/misc/di-2008%20protocol.pdf
 """
 
 
+import os
+import sys
 import serial
 import serial.tools.list_ports
 import keyboard
 import time
 
+# The shared dataq package lives in the binary_comm folder, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dataq import di_2008, tuning
+from dataq.commands import CommandEngine
+from dataq.display import Display
+from dataq.manager import AcquisitionConfig
+from dataq.metrics import Metrics, MetricsFile, render
+from dataq.reader import ScanReader
+
 """
 Change slist tuple to vary analog channel configuration.
 Refer to the protocol for details.
@@ -43,39 +54,30 @@ slist = [0x0A00,0x0B01,0x1702,0x1303,0x0709,0x000A,0x0008]
 0x000A = Count channel
 0x0008 = Digital inputs
 
-
-Define analog_ranges tuple to contain an ordered list of analog measurement ranges supported by the DI-2008. 
-This tuple begins with gain code 0 (±500 mV) and ends gain code 0xD (±1 V) and is padded with 0 values
-as place holders for undefined codes (see protocol.)
-"""
-analog_ranges = [.5, 0.25, 0.1, .05, .025, .01, 0, 0, 50 ,25, 10, 5, 2.5, 1, 0, 0]
-
-"""
-Define a tuple that contains an ordered list of rate measurement ranges supported by the DI-2008. 
-The first item in the list is the lowest gain code (e.g. 50 kHz range = gain code 1).
+Analog and rate ranges and the TC scaling constants are defined in
+dataq/di_2008.py, which scales whole blocks of scans according to slist.
 """
-rate_ranges = tuple((50000,20000,10000,5000,2000,1000,500,200,100,50,20,10))
 
 """
-m and b TC scaling constants in TC type order: B, E, J, K, N, R, S, T
-See protocol
+Set metrics_path to a file name to have the read, decode and print
+statistics written there every second in the Prometheus text format.
 """
-tc_m = [0.023956,0.018311,0.021515,0.023987,0.022888,0.02774,0.02774,0.009155]
-tc_b = [1035,400,495,586,550,859,859,100]
-
+metrics_path = None
 
 """
-Define a list of analog voltage and rate ranges to apply in slist order.
-Value 0 is appended as a placeholder for enabled TC and dig-in channels. 
-This list is populated in the config_scn_lst() routine based upon 
-slist contents.
+Longest time in seconds from a scan being sampled to its display. The
+packet size ('ps') and host read size are chosen for it by dataq.tuning,
+as dataq.manager.configure() does, instead of a fixed 'ps 0' that sends
+a USB packet every few scans however fast the instrument scans.
 """
-range_table = list(())
+latency_budget = 0.1
 
 # Define flag to indicate if acquiring is active 
 acquiring = False
 
 ser=serial.Serial()
+# Matches command echoes to commands, with per-command timeouts instead of fixed sleeps
+engine = CommandEngine(ser)
 
 
 """ Discover DATAQ Instruments devices and models.  Note that if multiple devices are connected, only the 
@@ -107,67 +109,33 @@ def discovery():
 
 # Sends a passed command string after appending <cr>
 def send_cmd(command):
-    ser.write((command+'\r').encode())
-    time.sleep(.1)
-    if not(acquiring):
-        # Echo commands if not acquiring
-        while True:
-            if(ser.inWaiting() > 0):
-                while True:
-                    try:
-                        s = ser.readline().decode()
-                        s = s.strip('\n')
-                        s = s.strip('\r')
-                        s = s.strip(chr(0))
-                        break
-                    except:
-                        continue
-                if s != "":
-                    print (s)
-                    break
+    if acquiring:
+        # The background reader owns the port, so don't wait for the echo
+        ser.write((command+'\r').encode())
+        return
+    # Echo commands if not acquiring
+    response = engine.execute([command])[0]
+    if response:
+        print (response)
 
 # Configure the instrment's scan list
 def config_scn_lst():
-    # Scan list position must start with 0 and increment sequentially
-    position = 0 
-    for item in slist:
-        send_cmd("slist "+ str(position ) + " " + str(item))
-        position += 1
-        # Update the Range table
-        if (item & 0xf < 8) and (item & 0x1000 == 0):
-            # This is a voltage channel.
-            range_table.append(analog_ranges[item >> 8])
-
-        elif (item & 0xf < 8) and (item & 0x1000 != 0):
-            # This is a TC channel. Append 0 as a placeholder
-            range_table.append(0)
-
-        elif item & 0xf == 8:
-            # This is a dig in channel. No measurement range support. 
-            # Append 0 as a placeholder
-            range_table.append(0) 
-
-        elif item & 0xf == 9:
-            """
-            This is a rate channel
-            Rate ranges begin with 1, so subtract 1 to maintain zero-based index
-            in the rate_ranges tuple
-            """
-            range_table.append(rate_ranges[(item >> 8)-1]) 
-
-        else:
-            """
-            This is a count channel. No measurement range support. 
-            Append 0 as a placeholder
-            """
-            range_table.append(0)
+    # Scan list position must start with 0 and increment sequentially. The
+    # commands are sent back to back and each echo is matched to its command
+    commands = ["slist " + str(position) + " " + str(item) for position, item in enumerate(slist)]
+    for response in engine.execute(commands):
+        if response:
+            print (response)
 
 while discovery() == False:
     discovery()
 # Stop in case Device was left running
 send_cmd("stop")
-# Keep the packet size small for responsiveness
-send_cmd("ps 0")
+# Packet and read sizes that deliver scans within the latency budget at
+# the srate and dec sent below
+config = AcquisitionConfig(slist, srate=4, dec=20, latency_budget=latency_budget)
+tuned = tuning.for_config("DI-2008", config)
+send_cmd("ps " + str(tuned.ps))
 # Configure the instrument's scan list
 config_scn_lst()
 # Define sample rate = 10 Hz (refer to protocol:)
@@ -179,91 +147,83 @@ print("Ready to acquire...")
 print ("")
 print("Press <g> to go, <s> to stop, <r> resets counter channel, and <q> to quit:")
 
-# This is the slist position pointer. Ranges from 0 (first position)
-# to len(slist)
-slist_pointer = 0
-# This is the constructed output string
-output_string = ""
+# Compile slist once: per-column scaling, TC constants, units and display formats
+plan = di_2008.compile_plan(slist)
+scan_bytes = plan.scan_bytes
+
+# Background reader that drains the serial port while acquiring
+reader = None
+
+# Read sizes and times, backlog and per-stage times, to see if acquisition keeps up
+metrics = Metrics()
+metrics_file = None
+if metrics_path:
+    metrics_file = MetricsFile(metrics_path, lambda: render({None: metrics.snapshot()}))
+    metrics_file.start()
+
+# Shows the latest scan at a fixed refresh rate, however fast scans arrive
+display = Display(plan, metrics=metrics)
+display.start()
 
 while True:
     # If key 'SPACE' start scanning
     if keyboard.is_pressed('g' or  'G'):
          keyboard.read_key()
-         acquiring = True
-         send_cmd("start")
+         # Ignored while acquiring, since only one reader may drain the port
+         if reader is None:
+             acquiring = True
+             send_cmd("start")
+             # Hand reading over to a background thread until stopped
+             reader = ScanReader(ser, scan_bytes, read_size=tuned.read_size, metrics=metrics)
+             reader.start()
     # If key 'esc' stop scanning
     if keyboard.is_pressed('s' or 'S'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          time.sleep(1)
          #ser.flushInput()
+         # Drop the last snapshot so it cannot overwrite the messages below
+         display.clear()
          print ("")
          print ("stopped")
+         stats = metrics.snapshot()
+         if stats["peaks"].get("backlog_bytes"):
+             print ("Peak backlog", stats["peaks"]["backlog_bytes"], "of",
+                    stats["gauges"]["backlog_capacity_bytes"], "bytes,",
+                    round(stats["rates"].get("scans_read", 0), 1), "scans/s")
          ser.flushInput()
          acquiring = False
     # If key 'q' exit 
     if keyboard.is_pressed('q' or 'Q'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          break
         # If key 'r' reset counter 
     if keyboard.is_pressed('r' or 'R'):
          keyboard.read_key()
          send_cmd("reset 1")
-    while (ser.inWaiting() > (2 * len(slist))):
-         for i in range(len(slist)):
-            # The four LSBs of slist determine measurement function
-            function = slist[slist_pointer] & 0xf
-            mode_bit = slist[slist_pointer] & 0x1000
-            # Always two bytes per sample...read them
-            bytes = ser.read(2)
-            if (function < 8) and (not(mode_bit)):
-                # Working with a Voltage input channel. Scale accordingly.
-                result = range_table[slist_pointer] * int.from_bytes(bytes,byteorder='little', signed=True) / 32768
-                output_string = output_string + "{: 3.3f}, ".format(result)
-            elif (function < 8) and (mode_bit):
-                """
-                Working with a TC channel.
-                Convert to temperature if no errors.
-                First, test for TC error conditions.
-                """
-                result = int.from_bytes(bytes,byteorder='little', signed=True)
-                if result == 32767:
-                    output_string = output_string + "cjc error, "
-                        
-                elif result == -32768:
-                    output_string = output_string + "open, "
-                        
-                else:
-                    # Get here if no errors, so isolate TC type
-                    tc_type = slist[slist_pointer] & 0x0700
-                    # Move TC type into 3 LSBs to form an index we'll use to select m & b scaling constants
-                    tc_type = tc_type >> 8
-                    result = tc_m[tc_type] * result + tc_b[tc_type]
-                    output_string = output_string + "{: 3.3f}, ".format(result)
-
-            elif function == 8:
-                # Working with the Digital input channel 
-                result = (int.from_bytes(bytes,byteorder='big', signed=False)) & (0x007f)
-                output_string = output_string + "{: 3d}, ".format(result)
-
-            elif function == 9:
-                # Working with the Rate input channel
-                result = (int.from_bytes(bytes,byteorder='little', signed=True) + 32768) / 65535 * (range_table[slist_pointer])
-                output_string = output_string + "{: 3.1f}, ".format(result)
-
-            else:
-                # Working with the Counter input channel
-                result = (int.from_bytes(bytes,byteorder='little', signed=True)) + 32768
-                output_string = output_string + "{: 1d}, ".format(result)
-
-            # Get the next position in slist
-            slist_pointer += 1
-
-            if (slist_pointer + 1) > (len(slist)):
-                # End of a pass through slist items...output, reset, continue
-                print(output_string.rstrip(", ") + "             ", end="\r") 
-                output_string = ""
-                slist_pointer = 0
+    if reader is not None:
+         # Wait briefly for whole scans so the keys are still checked regularly
+         block = reader.get(timeout=0.05)
+         if len(block):
+             # Decode the whole block; only the latest scan is shown since
+             # the output line is overwritten in place
+             started = time.perf_counter()
+             block = plan.decode(block)
+             metrics.stage("decode", time.perf_counter() - started, len(block))
+             display.show(block)
+    else:
+         time.sleep(0.05)
+display.stop()
+if metrics_file is not None:
+    metrics_file.stop()
 SystemExit
 
@@ -0,0 +1,222 @@
+"""
+Throughput benchmarks for the block decoders in the dataq package.
+
+Each decode path is measured on in-memory byte buffers and, optionally, on a
+simulated serial stream (dataq.simulator over a pty, read by
+dataq.reader.ScanReader.) Results are written as one JSON object per line
+so runs can be compared across versions:
+
+    python bench_decoders.py --source memory serial --widths 4 8 --output results.jsonl
+
+Fields: path, source, width, block_scans, samples, seconds, samples_per_s,
+cpu_ns_per_sample, peak_bytes, plus python, numpy and platform versions.
+'legacy-di-2008' is the original per-sample loop from di_2008.py, kept as a
+reference point.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import serial
+
+# The shared dataq package lives in the binary_comm folder, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dataq import di_1100, di_1110, di_2008, di_245, manager, models, starter_kit
+from dataq.reader import ScanReader
+from dataq.simulator import Simulator
+
+
+def mixed_slist(kinds, width):
+    # Repeat the slist entry kinds, numbering analog channels, up to width positions
+    return [kinds[i % len(kinds)] | (i % 8 if kinds[i % len(kinds)] & 0xf < 8 else 0)
+            for i in range(width)]
+
+
+def legacy_di_2008(raw, slist):
+    # The per-sample loop of the original di_2008.py, without printing
+    results = []
+    for position in range(len(raw) // 2):
+        item = slist[position % len(slist)]
+        function = item & 0xf
+        data = raw[2 * position:2 * position + 2]
+        if (function < 8) and not (item & 0x1000):
+            result = di_2008.analog_ranges[item >> 8] * int.from_bytes(data, byteorder='little', signed=True) / 32768
+        elif function < 8:
+            result = int.from_bytes(data, byteorder='little', signed=True)
+            if result != 32767 and result != -32768:
+                tc_type = (item & 0x0700) >> 8
+                result = di_2008.tc_m[tc_type] * result + di_2008.tc_b[tc_type]
+        elif function == 8:
+            result = int.from_bytes(data, byteorder='big', signed=False) & 0x007f
+        elif function == 9:
+            result = (int.from_bytes(data, byteorder='little', signed=True) + 32768) / 65535 * di_2008.rate_ranges[(item >> 8) - 1]
+        else:
+            result = int.from_bytes(data, byteorder='little', signed=True) + 32768
+        results.append(result)
+    return results
+
+
+"""
+Decode paths: name -> (simulated model, slist builder, decoder factory, dig_inputs).
+A decoder factory takes slist and returns a function of raw bytes.
+"""
+PATHS = {
+    "di-2008": ("DI-2008", lambda w: mixed_slist([0x0A00, 0x1702, 0x0709, 0x000A, 0x0008], w),
+                lambda slist: lambda raw: di_2008.decode_block(raw, slist), False),
+    "legacy-di-2008": ("DI-2008", lambda w: mixed_slist([0x0A00, 0x1702, 0x0709, 0x000A, 0x0008], w),
+                       lambda slist: lambda raw: legacy_di_2008(raw, slist), False),
+    "di-245": ("DI-245", lambda w: mixed_slist([0x0A00, 0x1302], w),
+               lambda slist: lambda raw: di_245.decode_block(raw, slist), False),
+    "di-245-dchn": ("DI-245", lambda w: mixed_slist([0x0A00, 0x1302], w),
+                    lambda slist: lambda raw: di_245.decode_block(raw, slist, True), True),
+    "di-1100": ("DI-1100", lambda w: mixed_slist([0x0000], w),
+                lambda slist: di_1100.Decoder(slist, 100).decode, False),
+    "di-1110": ("DI-1110", lambda w: mixed_slist([0x0000, 0x0709, 0x0008, 0x000A], w),
+                lambda slist: di_1110.Decoder(slist, 100).decode, False),
+    "starter-kit": ("DI-2108", lambda w: mixed_slist([0x0000, 0x0709, 0x000A], w),
+                    lambda slist: lambda raw: starter_kit.decode_block(raw, slist), False),
+}
+
+
+def bench_memory(path, width, block_scans, seconds):
+    model, build_slist, build_decoder, dig_inputs = PATHS[path]
+    slist = build_slist(width)
+    scan_bytes = models.scan_bytes(model, slist, dig_inputs)
+    raw = np.random.default_rng(0).integers(0, 256, block_scans * scan_bytes, dtype=np.uint8).tobytes()
+    decode = build_decoder(slist)
+
+    # Timed run without tracemalloc, which would slow allocation down
+    blocks = 0
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    while time.perf_counter() - wall < seconds or not blocks:
+        decode(raw)
+        blocks += 1
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    tracemalloc.start()
+    decode(raw)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    samples = blocks * block_scans * scan_bytes // 2
+    return samples, wall, cpu, peak
+
+
+def _start_simulator(sim, model, slist, dig_inputs):
+    ser = serial.Serial(sim.port, 115200, timeout=0.5)
+    if model == "DI-245":
+        manager.send_cmd(ser, "stop")
+        for position, item in enumerate(slist):
+            manager.send_cmd(ser, "chn " + str(position) + " " + str(item))
+        manager.send_cmd(ser, "xrate 4451 1000")
+        manager.send_cmd(ser, "dchn " + ("1" if dig_inputs else "0"))
+        start = b"S1\r"
+    else:
+        # Fastest settings the rate formulas allow, scaled up by the simulator
+        srate = {"DI-2008": 4, "DI-1100": 375, "DI-1110": 375}.get(model, 375)
+        dec = None if model in ("DI-1100", "DI-1110") else 1
+        manager.configure(ser, model, manager.AcquisitionConfig(slist, srate, dec, 6))
+        start = b"start\r"
+    ser.write(start)
+    return ser
+
+
+def bench_serial(path, width, block_scans, seconds):
+    model, build_slist, build_decoder, dig_inputs = PATHS[path]
+    slist = build_slist(width)
+    scan_bytes = models.scan_bytes(model, slist, dig_inputs)
+    decode = build_decoder(slist)
+    # Enough simulated scans per second to keep the decoder busy
+    multiplier = {"DI-2008": 2000, "DI-245": 400}.get(model, 4)
+
+    with Simulator(model, rate_multiplier=multiplier) as sim:
+        ser = _start_simulator(sim, model, slist, dig_inputs)
+        reader = ScanReader(ser, scan_bytes, read_size=block_scans * scan_bytes)
+        reader.start()
+        samples = 0
+        # Timed run without tracemalloc, which would slow allocation down
+        wall = time.perf_counter()
+        # Only the consuming thread's CPU time counts; the simulator shares the process
+        cpu = time.thread_time()
+        while time.perf_counter() - wall < seconds:
+            raw = reader.get(max_scans=block_scans, timeout=0.1)
+            if len(raw):
+                decode(raw)
+                samples += len(raw) // 2
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+
+        # Copies of a few more blocks, decoded once the reader and simulator
+        # have stopped so that only the consumer's allocations are traced
+        blocks = []
+        deadline = time.perf_counter() + 1.0
+        while len(blocks) < 8 and time.perf_counter() < deadline:
+            raw = reader.get(max_scans=block_scans, timeout=0.1)
+            if len(raw):
+                blocks.append(bytes(raw))
+        reader.stop()
+        ser.close()
+
+    peak = 0
+    tracemalloc.start()
+    for raw in blocks:
+        tracemalloc.reset_peak()
+        decode(raw)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    return samples, wall, cpu, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dataq block decoders")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--source", nargs="+", choices=("memory", "serial"), default=["memory"])
+    parser.add_argument("--widths", nargs="+", type=int, default=[4, 8])
+    parser.add_argument("--block-scans", nargs="+", type=int, default=[64, 4096])
+    parser.add_argument("--seconds", type=float, default=1.0, help="duration of each case")
+    parser.add_argument("--output", help="append results to this file instead of stdout")
+    arguments = parser.parse_args(argv)
+
+    environment = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    output = open(arguments.output, "a") if arguments.output else sys.stdout
+    try:
+        for source in arguments.source:
+            bench = bench_memory if source == "memory" else bench_serial
+            for path in arguments.paths:
+                for width in arguments.widths:
+                    for block_scans in arguments.block_scans:
+                        samples, wall, cpu, peak = bench(path, width, block_scans, arguments.seconds)
+                        result = {
+                            "path": path,
+                            "source": source,
+                            "width": width,
+                            "block_scans": block_scans,
+                            "samples": samples,
+                            "seconds": wall,
+                            "samples_per_s": samples / wall,
+                            "cpu_ns_per_sample": 1e9 * cpu / samples if samples else None,
+                            "peak_bytes": peak,
+                        }
+                        result.update(environment)
+                        output.write(json.dumps(result) + "\n")
+                        output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""
+Shared support code for the binary-mode DATAQ Instruments example programs.
+
+The example programs in the model folders (DI-2008, DI-245, ...) import this
+package by adding the binary_comm folder to sys.path. Each instrument family
+has its own module containing the protocol constants and a block decoder that
+converts the raw binary stream for any number of whole scans in one call.
+
+This package requires NumPy.
+"""
@@ -0,0 +1,215 @@
+"""
+asyncio interface for the CDC-mode instruments: model DI-2008, models
+DI-1100 and DI-1110, and the DI-2108 family used by DataqStarterKit.py.
+
+AsyncDevice registers the serial port's file descriptor with the event loop
+(loop.add_reader), so command echoes and scan data are handled as the bytes
+arrive instead of with fixed sleeps and inWaiting() polling. One event loop
+can serve many instruments without a thread per port. add_reader() needs a
+selector event loop on a POSIX system (Linux, macOS.)
+
+Example:
+
+    async with AsyncDevice("/dev/ttyACM0", "DI-2008", slist) as device:
+        await device.configure(srate=4, dec=20)
+        await device.start()
+        async for block in device:
+            print(block[-1])
+"""
+
+import asyncio
+import os
+
+import serial
+
+from . import commands, models
+
+
+class AsyncDevice:
+    """
+    One instrument driven from an asyncio event loop.
+
+    model is a name from dataq.models.MODELS other than the DI-245, which
+    uses a different command set. decimation_factor is the software
+    decimation applied by the DI-1100 and DI-1110 decoders. Up to
+    queue_size decoded blocks are held for the consumer; when it falls
+    further behind, the oldest block is discarded and counted in
+    'overrun_blocks'.
+    """
+
+    def __init__(self, port, model, slist, decimation_factor=1, queue_size=256):
+        if model == "DI-245":
+            raise ValueError("the DI-245 is not supported by AsyncDevice")
+        self.port = port
+        self.model = model
+        self.slist = list(slist)
+        self.decimation_factor = decimation_factor
+        self.scan_bytes = models.scan_bytes(model, self.slist)
+        self.acquiring = False
+        self.overrun_blocks = 0
+
+        self.ser = None
+        self._loop = None
+        self._decode = None
+        self._buffer = bytearray()
+        self._response = None
+        self._response_command = None
+        # The error that ended the connection, if one did
+        self._error = None
+        self._command_lock = asyncio.Lock()
+        self._blocks = asyncio.Queue(queue_size)
+
+    async def open(self):
+        """Open the port and start watching it on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self.ser = serial.Serial(self.port, 115200, timeout=0)
+        self._loop.add_reader(self.ser.fileno(), self._on_readable)
+
+    async def close(self):
+        """Stop acquiring if needed, then release the port."""
+        if self.ser is None:
+            return
+        # A failed port can't take the stop command
+        if self.acquiring and self._error is None:
+            await self.stop()
+        self._loop.remove_reader(self.ser.fileno())
+        self.ser.close()
+        self.ser = None
+        self._put_block(None)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.ser.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._fail(e)
+            return
+        if not data:
+            self._fail(serial.SerialException("device disconnected: " + self.port))
+            return
+        self._buffer += data
+        if self.acquiring:
+            self._deliver_scans()
+        else:
+            self._deliver_lines()
+
+    def _fail(self, error):
+        # Stop watching a dead port and hand the error to whoever is waiting
+        self._error = error
+        self._loop.remove_reader(self.ser.fileno())
+        if self._response is not None and not self._response.done():
+            self._response.set_exception(error)
+        self._put_block(error)
+
+    def _deliver_lines(self):
+        # Command responses are <cr> terminated text lines
+        while True:
+            end = self._buffer.find(b"\r")
+            if end < 0:
+                return
+            line = bytes(self._buffer[:end]).decode(errors="replace").strip("\n\r\x00 ")
+            del self._buffer[:end + 1]
+            if self._response is None or self._response.done():
+                continue
+            # Matched as by the command engine; a 'stop' echo can follow
+            # leftover scan data
+            start = commands.echo_start(line, self._response_command)
+            if start >= 0:
+                self._response.set_result(line[start:])
+
+    def _deliver_scans(self):
+        count = len(self._buffer) // self.scan_bytes * self.scan_bytes
+        if not count:
+            return
+        block = self._decode(bytes(self._buffer[:count]))
+        del self._buffer[:count]
+        # Decimating decoders return no rows until a window completes
+        if len(block):
+            self._put_block(block)
+
+    def _put_block(self, block):
+        if self._blocks.full():
+            self._blocks.get_nowait()
+            self.overrun_blocks += 1
+        self._blocks.put_nowait(block)
+
+    async def send_cmd(self, command, timeout=1.0):
+        """
+        Send a command and return the instrument's response line.
+
+        Commands are not echoed while acquiring, so None is returned then.
+        Raises asyncio.TimeoutError if no response arrives within timeout,
+        or the port's error once it has failed.
+        """
+        async with self._command_lock:
+            if self._error is not None:
+                raise self._error
+            if self.acquiring:
+                self.ser.write((command + "\r").encode())
+                return None
+            self._response = self._loop.create_future()
+            self._response_command = command
+            self.ser.write((command + "\r").encode())
+            try:
+                return await asyncio.wait_for(self._response, timeout)
+            finally:
+                self._response = None
+
+    async def configure(self, srate, dec=None, ps=0):
+        """
+        Stop the instrument and configure its scan list and sample rate.
+
+        dec is sent only if given (the DI-1100 and DI-1110 have no 'dec'
+        command.) ps selects the protocol packet size. Raises
+        dataq.commands.CommandError if a command isn't echoed back as sent.
+        """
+        sequence = ["stop"]
+        if self.model != "DI-2008":
+            # Define binary output mode
+            sequence.append("encode 0")
+        sequence.append("ps " + str(ps))
+        # Scan list position must start with 0 and increment sequentially
+        for position, item in enumerate(self.slist):
+            sequence.append("slist " + str(position) + " " + str(item))
+        if dec is not None:
+            sequence.append("dec " + str(dec))
+        sequence.append("srate " + str(srate))
+        for command in sequence:
+            commands.check_echo(command, await self.send_cmd(command))
+
+    async def start(self):
+        """Start scanning; decoded blocks are then available by iterating."""
+        # A new decoder per run starts with an empty decimation window
+        self._decode = models.decoder_for(self.model, self.slist, self.decimation_factor)
+        self._buffer.clear()
+        self.acquiring = True
+        await self.send_cmd("start")
+
+    async def stop(self, settle=0.5):
+        """Stop scanning and discard what arrives within 'settle' seconds."""
+        await self.send_cmd("stop")
+        await asyncio.sleep(settle)
+        self.acquiring = False
+        self.ser.reset_input_buffer()
+        self._buffer.clear()
+
+    async def blocks(self):
+        """Yield decoded scan blocks until the device is closed."""
+        while True:
+            block = await self._blocks.get()
+            if block is None:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield block
+
+    def __aiter__(self):
+        return self.blocks()
@@ -0,0 +1,310 @@
+"""
+Raw capture of the binary stream to a memory-mapped file, decoded later.
+
+For the highest sustained rates nothing but bulk reads and memory copies
+should happen while acquiring. Recorder is a thread that reads the serial
+port and appends the raw bytes to a CaptureWriter: a file preallocated to
+its maximum size and mapped into memory, so each write is a copy into the
+page cache. Scaling is deferred until the capture is opened again with
+open_capture(), which maps the file read-only and decodes only the scans
+that are sliced out of it, through the model's scan plan. A capture many
+times larger than RAM can be browsed this way.
+
+File layout: a HEADER_SIZE byte header followed by the raw stream. The
+header starts with the fixed fields
+
+    magic       8 bytes, MAGIC
+    version     uint32
+    header_size uint32
+    data_bytes  uint64, bytes of raw stream written so far
+    start_time  float64, time.time() of the first data (0 until then)
+
+(little-endian), followed by UTF-8 JSON with the model, slist, dig_inputs,
+srate, dec, xrate and ps settings, padded with spaces. data_bytes is updated
+in the mapping after every write, so a capture that was never closed can
+still be opened up to the last write.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from . import models
+
+MAGIC = b"DATAQRAW"
+VERSION = 1
+HEADER_SIZE = 4096
+
+# magic, version, header_size, data_bytes, start_time
+_FIXED = struct.Struct("<8sIIQd")
+_DATA_BYTES_OFFSET = 16
+_START_TIME_OFFSET = 24
+
+
+class CaptureFull(Exception):
+    """Raised by CaptureWriter.write() when the preallocated file is full."""
+
+
+class CaptureWriter:
+    """
+    Append raw stream bytes to a preallocated, memory-mapped capture file.
+
+    max_bytes is the largest amount of raw data the file can hold; the file
+    is created at that size and truncated to what was written by close().
+    srate, dec, xrate and ps are the instrument settings recorded in the
+    header (xrate as the (arg0, arg1) pair of the DI-245 'xrate' command.)
+    """
+
+    def __init__(self, path, model, slist, max_bytes, srate=None, dec=None, xrate=None,
+                 ps=None, dig_inputs=False):
+        self.path = path
+        self.plan = models.plan_for(model, slist, dig_inputs)
+        self.max_bytes = max_bytes
+        self.data_bytes = 0
+
+        settings = {
+            "model": model,
+            "slist": list(slist),
+            "dig_inputs": bool(dig_inputs),
+            "srate": srate,
+            "dec": dec,
+            "xrate": list(xrate) if xrate is not None else None,
+            "ps": ps,
+            "scan_bytes": self.plan.scan_bytes,
+        }
+        header = bytearray(HEADER_SIZE)
+        _FIXED.pack_into(header, 0, MAGIC, VERSION, HEADER_SIZE, 0, 0.0)
+        text = json.dumps(settings).encode()
+        if _FIXED.size + len(text) > HEADER_SIZE:
+            raise ValueError("capture settings do not fit in the header")
+        header[_FIXED.size:] = text.ljust(HEADER_SIZE - _FIXED.size)
+
+        self._file = open(path, "w+b")
+        try:
+            self._file.write(header)
+            self._file.truncate(HEADER_SIZE + max_bytes)
+            self._map = mmap.mmap(self._file.fileno(), HEADER_SIZE + max_bytes)
+        except Exception:
+            self._file.close()
+            raise
+
+    def remaining(self):
+        """Return the number of bytes that still fit in the file."""
+        return self.max_bytes - self.data_bytes
+
+    def mark_start(self, start_time=None):
+        """Record the acquisition start time (default: now) in the header."""
+        struct.pack_into("<d", self._map, _START_TIME_OFFSET,
+                         time.time() if start_time is None else start_time)
+
+    def write(self, data):
+        """
+        Append raw bytes. Raises CaptureFull, after writing what fits, if
+        the data does not fit in the file.
+        """
+        data = memoryview(data).cast("B")
+        count = min(len(data), self.remaining())
+        position = HEADER_SIZE + self.data_bytes
+        self._map[position:position + count] = data[:count]
+        self.data_bytes += count
+        struct.pack_into("<Q", self._map, _DATA_BYTES_OFFSET, self.data_bytes)
+        if count < len(data):
+            raise CaptureFull(self.path)
+
+    def close(self):
+        """Unmap the file and truncate it to the data written."""
+        if self._file.closed:
+            return
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(HEADER_SIZE + self.data_bytes)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Recorder(threading.Thread):
+    """
+    Read a serial port into a CaptureWriter until stopped or the file fills.
+
+    ser is an open serial.Serial, configured but not yet started. Start the
+    recorder before sending 'start' so no data is missed; the header's
+    start time is taken when the first bytes arrive. read_size and timeout
+    are as for dataq.reader.ScanReader. The writer is not closed here.
+    """
+
+    def __init__(self, ser, writer, read_size=65536, timeout=0.05):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.writer = writer
+        self.read_size = read_size
+        self.timeout = timeout
+        self._stopping = threading.Event()
+
+        # Exception that ended the thread, re-raised by stop()
+        self.error = None
+        self.full = False
+        self.bytes_read = 0
+        self.reads = 0
+
+    def run(self):
+        saved_timeout = self.ser.timeout
+        self.ser.timeout = self.timeout
+        try:
+            while not self._stopping.is_set():
+                data = self.ser.read(max(self.read_size, self.ser.in_waiting))
+                if data:
+                    if not self.bytes_read:
+                        self.writer.mark_start()
+                    self.reads += 1
+                    self.bytes_read += len(data)
+                    self.writer.write(data)
+        except CaptureFull:
+            self.full = True
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self.ser.timeout = saved_timeout
+            except Exception:
+                # The port is gone (e.g. the unit was unplugged); nothing to restore
+                pass
+
+    def stop(self):
+        """Stop the thread and re-raise any exception that ended it."""
+        self._stopping.set()
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class Capture:
+    """
+    A capture file opened read-only as a lazy array of scans.
+
+    len() is the number of whole scans. Indexing with an integer or a slice
+    (optionally followed by a column index, e.g. capture[1000:2000, 3])
+    decodes just those scans into engineering units with the model's scan
+    plan. The undecoded scans are available as 'raw', a read-only uint8
+    numpy.memmap shaped (scans, scan_bytes).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, header_size, data_bytes, start_time = _FIXED.unpack(f.read(_FIXED.size))
+            if magic != MAGIC:
+                raise ValueError(str(path) + " is not a capture file")
+            if version != VERSION:
+                raise ValueError("unsupported capture file version: " + str(version))
+            settings = json.loads(f.read(header_size - _FIXED.size).decode())
+
+        self.model = settings["model"]
+        self.slist = tuple(settings["slist"])
+        self.dig_inputs = settings["dig_inputs"]
+        self.srate = settings["srate"]
+        self.dec = settings["dec"]
+        self.xrate = tuple(settings["xrate"]) if settings["xrate"] is not None else None
+        self.ps = settings["ps"]
+        self.start_time = start_time or None
+        self.data_bytes = min(data_bytes, os.path.getsize(path) - header_size)
+        self.plan = models.plan_for(self.model, self.slist, self.dig_inputs)
+
+        scans = self.data_bytes // self.plan.scan_bytes
+        if scans:
+            self.raw = np.memmap(path, dtype=np.uint8, mode="r", offset=header_size,
+                                 shape=(scans, self.plan.scan_bytes))
+        else:
+            self.raw = np.zeros((0, self.plan.scan_bytes), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, index):
+        columns = None
+        if isinstance(index, tuple):
+            index, columns = index[0], index[1:]
+        if isinstance(index, slice):
+            result = self.plan.decode(np.ascontiguousarray(self.raw[index]))
+        else:
+            result = self.plan.decode(np.ascontiguousarray(self.raw[index:index + 1 or None]))[0]
+        if columns:
+            result = result[(Ellipsis,) + columns]
+        return result
+
+    def scan_rate(self):
+        """Return the nominal scan rate in Hz from the recorded settings."""
+        return models.scan_rate(self.model, self.srate, self.dec or 1, self.xrate)
+
+    def blocks(self, block_scans=65536, start=0, stop=None):
+        """Yield the decoded scans from start to stop in blocks of block_scans."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for first in range(start, stop, block_scans):
+            yield self[first:min(first + block_scans, stop)]
+
+    def close(self):
+        """
+        Drop the memory mapping. It is released once no array sliced from
+        'raw' is left referring to it.
+        """
+        self.raw = np.zeros((0, self.plan.scan_bytes), dtype=np.uint8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_capture(path):
+    """Open a capture file as a lazy, sliceable Capture."""
+    return Capture(path)
+
+
+if __name__ == "__main__":
+    # Record a CDC-mode instrument until the time is up or the file is full, e.g.
+    #   python -m dataq.capture /dev/ttyACM0 DI-2008 run.dqr --slist 0x0A00 0x0B01 --srate 4 --dec 1
+    import argparse
+
+    import serial
+
+    from . import manager
+
+    parser = argparse.ArgumentParser(description="Capture the raw binary stream to a file")
+    parser.add_argument("port")
+    parser.add_argument("model", choices=[m for m in models.MODELS if m != "DI-245"])
+    parser.add_argument("output")
+    parser.add_argument("--slist", nargs="+", type=lambda s: int(s, 0), required=True)
+    parser.add_argument("--srate", type=int, required=True)
+    parser.add_argument("--dec", type=int)
+    parser.add_argument("--ps", type=int, default=6)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--max-bytes", type=int, default=1 << 30)
+    arguments = parser.parse_args()
+
+    config = manager.AcquisitionConfig(arguments.slist, arguments.srate, arguments.dec, arguments.ps)
+    with serial.Serial(arguments.port, 115200, timeout=0.5) as ser, \
+            CaptureWriter(arguments.output, arguments.model, arguments.slist, arguments.max_bytes,
+                          srate=arguments.srate, dec=arguments.dec, ps=arguments.ps) as writer:
+        manager.configure(ser, arguments.model, config)
+        recorder = Recorder(ser, writer)
+        recorder.start()
+        ser.write(b"start\r")
+        deadline = time.monotonic() + arguments.seconds
+        try:
+            while time.monotonic() < deadline and recorder.is_alive():
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+        recorder.stop()
+        ser.write(b"stop\r")
+        print("Captured", writer.data_bytes, "bytes" + (" (file full)" if recorder.full else ""))
@@ -0,0 +1,104 @@
+"""
+Change-event encoding for digital input and counter columns.
+
+Digital input (slist 0x0008) and counter (0x000A) positions are sampled at
+the full scan rate along with the analog channels, but change rarely, so
+most of their values repeat the one before. ChangeEncoder turns those
+columns into change events, the stream index of each scan where a column's
+value differs from the previous scan's and the new value, found with one
+vectorized comparison per column and block. ChangeDecoder expands events
+back into the dense columns, exactly. The first scan of a stream is always
+an event, so every value is known.
+
+dataq.columnar.ColumnarWriter can store these columns as events (its
+change_events option) instead of one value per scan. The other paths keep
+the dense columns: a raw capture must stay the device's own byte stream
+to keep up with the highest rates, a chunked recording's delta encoding
+already turns a repeated word into zeros that compress away (a steady
+digital input word costs under 0.02 bytes per scan), and a fanout ring is
+shared memory, where subscribers index scans by number and nothing
+crosses a wire.
+"""
+
+import collections
+
+import numpy as np
+
+from . import scan_plan
+
+"""
+Changes of one column. column is the decoded column, indexes the stream
+indexes of the scans where the value changed (int64) and values the new
+values.
+"""
+ChangeEvents = collections.namedtuple("ChangeEvents", "column indexes values")
+
+
+def event_columns(plan):
+    """Return the digital input and counter columns of a scan plan."""
+    return [c for c, kind in enumerate(plan.kinds) if kind in (scan_plan.DIG_IN, scan_plan.COUNTER)]
+
+
+class ChangeEncoder:
+    """
+    Encode columns of decoded blocks as change events.
+
+    columns lists the columns to encode (e.g. event_columns(plan).) Pass
+    every block of the stream to encode(), in order.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._last = None
+        # Stream index of the next scan
+        self.scans = 0
+        # Counters
+        self.events = 0
+
+    def encode(self, block):
+        """Return a ChangeEvents per encoded column for a block of decoded scans."""
+        block = np.asarray(block)
+        result = []
+        if not len(block):
+            return [ChangeEvents(c, np.empty(0, dtype=np.int64), block[:0, c]) for c in self.columns]
+        values = block[:, self.columns]
+        changed = np.empty(values.shape, dtype=bool)
+        changed[1:] = values[1:] != values[:-1]
+        changed[0] = True if self._last is None else values[0] != self._last
+        for position, column in enumerate(self.columns):
+            local = np.flatnonzero(changed[:, position])
+            result.append(ChangeEvents(column, local + self.scans, values[local, position]))
+            self.events += len(local)
+        self._last = values[-1].copy()
+        self.scans += len(block)
+        return result
+
+
+class ChangeDecoder:
+    """
+    Rebuild dense columns from change events.
+
+    columns lists the encoded columns, in the encoder's order. Pass each
+    block's events to decode() with the number of scans the block had.
+    """
+
+    def __init__(self, columns, dtype=np.float64):
+        self.columns = list(columns)
+        self.dtype = dtype
+        self._last = np.zeros(len(self.columns), dtype=dtype)
+        # Stream index of the next scan
+        self.scans = 0
+
+    def decode(self, events, scans):
+        """Return the encoded columns of the next scans, shaped (scans, columns)."""
+        result = np.empty((scans, len(self.columns)), dtype=self.dtype)
+        for position, changes in enumerate(events):
+            local = changes.indexes - self.scans
+            # Index of the latest change at or before each scan, -1 for none
+            latest = np.searchsorted(local, np.arange(scans), side="right") - 1
+            values = np.concatenate(([self._last[position]], changes.values))
+            result[:, position] = values[latest + 1]
+            if scans:
+                self._last[position] = result[-1, position]
+        self.scans += scans
+        return result
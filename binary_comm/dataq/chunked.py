@@ -0,0 +1,404 @@
+"""
+Compressed recordings of the binary stream, in independently readable
+chunks with an index.
+
+A raw capture (dataq.capture) is as large as the stream: multi-day runs
+fill disks. ChunkedWriter stores the same device words, faithfully, in
+chunks of chunk_scans scans. Each chunk is delta encoded across scans
+(successive samples of a channel are close, so the differences are small
+numbers), arranged channel by channel with the low and high bytes of the
+differences in separate planes, and compressed. The result compresses
+several times better than the stream itself, and is decoded exactly back
+to the device's bytes.
+
+An index of chunk offsets and first scans at the end of the file lets
+ChunkedRecording decompress only the chunks a requested scan or time range
+touches. A file that was never closed has no index; it is rebuilt by
+walking the chunk headers, up to the last complete chunk.
+
+File layout: a HEADER_SIZE byte header, starting with the fixed fields
+
+    magic       8 bytes, MAGIC
+    version     uint32
+    header_size uint32
+    chunk_scans uint64, scans per chunk (the last one may have fewer)
+    start_time  float64, time.time() of the first data (0 if not known)
+
+(little-endian), followed by UTF-8 JSON with the model, slist, dig_inputs,
+srate, dec, xrate, ps, scan_bytes and codec, padded with spaces. Then the
+chunks, each a (scans uint32, compressed bytes uint32) header and the
+compressed data, then the index, a (chunk offset uint64, first scan uint64)
+pair per chunk, and finally a trailer of the index offset, the number of
+chunks and the number of scans (uint64 each) and INDEX_MAGIC.
+
+The compressor is zstd if the zstandard package is installed, otherwise
+zlib from the standard library.
+"""
+
+import json
+import struct
+import time
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import models
+from .capture import open_capture
+
+MAGIC = b"DATAQCHK"
+INDEX_MAGIC = b"DATAQIDX"
+VERSION = 1
+HEADER_SIZE = 4096
+
+# magic, version, header_size, chunk_scans, start_time
+_FIXED = struct.Struct("<8sIIQd")
+_START_TIME_OFFSET = 24
+# scans, compressed bytes
+_CHUNK = struct.Struct("<II")
+# chunk offset, first scan
+_INDEX_ENTRY = struct.Struct("<QQ")
+# index offset, chunks, scans, INDEX_MAGIC
+_TRAILER = struct.Struct("<QQQ8s")
+
+
+def _compressor(codec, level):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("the zstd codec requires the zstandard package")
+        return zstandard.ZstdCompressor(level=level).compress
+    if codec == "zlib":
+        return lambda data: zlib.compress(data, level)
+    raise ValueError("unknown codec: " + str(codec))
+
+
+def _decompressor(codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("the zstd codec requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompress
+    if codec == "zlib":
+        return zlib.decompress
+    raise ValueError("unknown codec: " + str(codec))
+
+
+def encode_chunk(raw, words):
+    """
+    Delta encode and byte shuffle the bytes of whole scans of 'words' 16-bit
+    words: the differences between successive scans (the first scan as is)
+    channel by channel, low bytes first, then high bytes.
+    """
+    samples = np.frombuffer(raw, dtype="<u2").reshape(-1, words)
+    deltas = samples.copy()
+    deltas[1:] -= samples[:-1]
+    planes = np.ascontiguousarray(deltas.T).view(np.uint8).reshape(words, -1, 2)
+    return np.ascontiguousarray(planes.transpose(2, 0, 1)).tobytes()
+
+
+def decode_chunk(data, words):
+    """Undo encode_chunk(), returning the scans' bytes as a uint8 array."""
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(2, words, -1)
+    deltas = np.ascontiguousarray(planes.transpose(1, 2, 0)).view("<u2").reshape(words, -1)
+    # Sums of uint16 wrap around exactly as the differences did
+    samples = np.cumsum(deltas, axis=1, dtype="<u2")
+    return np.ascontiguousarray(samples.T).view(np.uint8).reshape(-1)
+
+
+class ChunkedWriter:
+    """
+    Write the raw binary stream to a chunked, compressed recording.
+
+    The arguments are as for dataq.capture.CaptureWriter, except that the
+    file grows as needed. chunk_scans is the number of scans compressed
+    together: larger chunks compress better, smaller ones make reading a
+    short range cheaper. codec is "zstd" or "zlib" (default: zstd if
+    available) at the given level. It can stand in for a CaptureWriter in
+    dataq.capture.Recorder.
+    """
+
+    def __init__(self, path, model, slist, chunk_scans=65536, codec=None, level=3,
+                 srate=None, dec=None, xrate=None, ps=None, dig_inputs=False):
+        self.path = path
+        self.plan = models.plan_for(model, slist, dig_inputs)
+        self.chunk_scans = chunk_scans
+        self.codec = codec or ("zstd" if zstandard is not None else "zlib")
+        self._compress = _compressor(self.codec, level)
+
+        settings = {
+            "model": model,
+            "slist": list(slist),
+            "dig_inputs": bool(dig_inputs),
+            "srate": srate,
+            "dec": dec,
+            "xrate": list(xrate) if xrate is not None else None,
+            "ps": ps,
+            "scan_bytes": self.plan.scan_bytes,
+            "codec": self.codec,
+        }
+        header = bytearray(HEADER_SIZE)
+        _FIXED.pack_into(header, 0, MAGIC, VERSION, HEADER_SIZE, chunk_scans, 0.0)
+        text = json.dumps(settings).encode()
+        if _FIXED.size + len(text) > HEADER_SIZE:
+            raise ValueError("recording settings do not fit in the header")
+        header[_FIXED.size:] = text.ljust(HEADER_SIZE - _FIXED.size)
+
+        self._file = open(path, "w+b")
+        self._file.write(header)
+        self._pending = bytearray()
+        self._index = []
+        # Counters
+        self.scans = 0
+        self.data_bytes = 0
+        self.compressed_bytes = 0
+
+    def mark_start(self, start_time=None):
+        """Record the acquisition start time (default: now) in the header."""
+        position = self._file.tell()
+        self._file.seek(_START_TIME_OFFSET)
+        self._file.write(struct.pack("<d", time.time() if start_time is None else start_time))
+        self._file.seek(position)
+
+    def write(self, data):
+        """Append raw stream bytes, compressing each chunk as it fills."""
+        self._pending += data
+        self.data_bytes += len(data)
+        chunk_bytes = self.chunk_scans * self.plan.scan_bytes
+        while len(self._pending) >= chunk_bytes:
+            self._write_chunk(self._pending[:chunk_bytes])
+            del self._pending[:chunk_bytes]
+
+    def _write_chunk(self, raw):
+        scans = len(raw) // self.plan.scan_bytes
+        data = self._compress(encode_chunk(bytes(raw), self.plan.words))
+        self._index.append((self._file.tell(), self.scans))
+        self._file.write(_CHUNK.pack(scans, len(data)))
+        self._file.write(data)
+        self.scans += scans
+        self.compressed_bytes += _CHUNK.size + len(data)
+
+    def close(self):
+        """Compress the last whole scans and write the index."""
+        if self._file.closed:
+            return
+        whole = len(self._pending) // self.plan.scan_bytes * self.plan.scan_bytes
+        if whole:
+            self._write_chunk(self._pending[:whole])
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(_INDEX_ENTRY.pack(*entry))
+        self._file.write(_TRAILER.pack(index_offset, len(self._index), self.scans, INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _first_scan_at(position):
+    # Index of the first scan at or after a fractional scan position; a
+    # position within rounding error of a scan is that scan
+    nearest = round(position)
+    if abs(position - nearest) < 1e-6:
+        return int(nearest)
+    return int(np.ceil(position))
+
+
+class ChunkedRecording:
+    """
+    A chunked recording opened for random access.
+
+    len() is the number of scans. Indexing with an integer or a slice
+    (optionally followed by a column index) decompresses just the chunks
+    holding those scans and decodes them with the model's scan plan;
+    raw_scans() returns the device bytes instead. The most recently used
+    chunk is kept decompressed for sequential access.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        magic, version, header_size, chunk_scans, start_time = _FIXED.unpack(self._file.read(_FIXED.size))
+        if magic != MAGIC:
+            self._file.close()
+            raise ValueError(str(path) + " is not a chunked recording")
+        if version != VERSION:
+            self._file.close()
+            raise ValueError("unsupported recording version: " + str(version))
+        settings = json.loads(self._file.read(header_size - _FIXED.size).decode())
+
+        self.model = settings["model"]
+        self.slist = tuple(settings["slist"])
+        self.dig_inputs = settings["dig_inputs"]
+        self.srate = settings["srate"]
+        self.dec = settings["dec"]
+        self.xrate = tuple(settings["xrate"]) if settings["xrate"] is not None else None
+        self.ps = settings["ps"]
+        self.codec = settings["codec"]
+        self.chunk_scans = chunk_scans
+        self.start_time = start_time or None
+        self.plan = models.plan_for(self.model, self.slist, self.dig_inputs)
+        self._decompress = _decompressor(self.codec)
+
+        offsets, firsts, scans = self._read_index(header_size)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        # First scan of each chunk, and the number of scans at the end
+        self._firsts = np.array(firsts + [scans], dtype=np.int64)
+        self._cached = (None, None)
+
+    def _read_index(self, header_size):
+        # The index from the trailer, or rebuilt from the chunk headers
+        self._file.seek(0, 2)
+        size = self._file.tell()
+        if size >= header_size + _TRAILER.size:
+            self._file.seek(size - _TRAILER.size)
+            index_offset, chunks, scans, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+            if magic == INDEX_MAGIC:
+                self._file.seek(index_offset)
+                entries = np.frombuffer(self._file.read(chunks * _INDEX_ENTRY.size), dtype="<u8")
+                return entries[0::2].tolist(), entries[1::2].tolist(), scans
+        offsets = []
+        firsts = []
+        scans = 0
+        position = header_size
+        while position + _CHUNK.size <= size:
+            self._file.seek(position)
+            count, length = _CHUNK.unpack(self._file.read(_CHUNK.size))
+            if position + _CHUNK.size + length > size:
+                break
+            offsets.append(position)
+            firsts.append(scans)
+            scans += count
+            position += _CHUNK.size + length
+        return offsets, firsts, scans
+
+    def __len__(self):
+        return int(self._firsts[-1])
+
+    def _chunk(self, chunk):
+        # Decompressed scans of one chunk, shaped (scans, scan_bytes)
+        if self._cached[0] != chunk:
+            self._file.seek(int(self._offsets[chunk]))
+            count, length = _CHUNK.unpack(self._file.read(_CHUNK.size))
+            data = self._decompress(self._file.read(length))
+            raw = decode_chunk(data, self.plan.words).reshape(count, self.plan.scan_bytes)
+            self._cached = (chunk, raw)
+        return self._cached[1]
+
+    def raw_scans(self, start, stop):
+        """Return the device bytes of scans start to stop, shaped (scans, scan_bytes)."""
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if stop <= start:
+            return np.zeros((0, self.plan.scan_bytes), dtype=np.uint8)
+        first = int(np.searchsorted(self._firsts, start, side="right")) - 1
+        last = int(np.searchsorted(self._firsts, stop, side="left"))
+        parts = []
+        for chunk in range(first, last):
+            base = self._firsts[chunk]
+            raw = self._chunk(chunk)
+            parts.append(raw[max(start - base, 0):stop - base])
+        return np.concatenate(parts) if len(parts) > 1 else parts[0].copy()
+
+    def __getitem__(self, index):
+        columns = None
+        if isinstance(index, tuple):
+            index, columns = index[0], index[1:]
+        if isinstance(index, slice):
+            scans = range(*index.indices(len(self)))
+            if len(scans):
+                # Read from the lowest scan to the highest, then step through
+                low = min(scans[0], scans[-1])
+                raw = self.raw_scans(low, max(scans[0], scans[-1]) + 1)
+                raw = raw[scans[0] - low::scans.step][:len(scans)]
+            else:
+                raw = self.raw_scans(0, 0)
+            result = self.plan.decode(np.ascontiguousarray(raw))
+        else:
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("scan index out of range")
+            result = self.plan.decode(self.raw_scans(index, index + 1))[0]
+        if columns:
+            result = result[(Ellipsis,) + columns]
+        return result
+
+    def scan_rate(self):
+        """Return the nominal scan rate in Hz from the recorded settings."""
+        return models.scan_rate(self.model, self.srate, self.dec or 1, self.xrate)
+
+    def time_range(self, start, stop):
+        """
+        Decode the scans between two times in seconds since the epoch,
+        timed from the recorded start time and the nominal scan rate.
+        """
+        if self.start_time is None:
+            raise ValueError("the recording has no start time")
+        rate = self.scan_rate()
+        first = _first_scan_at((start - self.start_time) * rate)
+        last = _first_scan_at((stop - self.start_time) * rate)
+        return self[max(first, 0):max(last, 0)]
+
+    def blocks(self, start=0, stop=None):
+        """Yield the decoded scans from start to stop, one chunk at a time."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        first = start
+        while first < stop:
+            chunk = int(np.searchsorted(self._firsts, first, side="right")) - 1
+            end = min(int(self._firsts[chunk + 1]), stop)
+            yield self[first:end]
+            first = end
+
+    def close(self):
+        """Close the file."""
+        self._cached = (None, None)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_recording(path):
+    """Open a chunked recording for random access."""
+    return ChunkedRecording(path)
+
+
+def compress_capture(capture_path, path, chunk_scans=65536, codec=None, level=3):
+    """Convert a raw dataq.capture file into a chunked recording at path."""
+    with open_capture(capture_path) as capture, \
+            ChunkedWriter(path, capture.model, capture.slist, chunk_scans, codec, level,
+                          srate=capture.srate, dec=capture.dec, xrate=capture.xrate,
+                          ps=capture.ps, dig_inputs=capture.dig_inputs) as writer:
+        if capture.start_time is not None:
+            writer.mark_start(capture.start_time)
+        for first in range(0, len(capture), chunk_scans):
+            writer.write(np.ascontiguousarray(capture.raw[first:first + chunk_scans]).tobytes())
+    return path
+
+
+if __name__ == "__main__":
+    # Compress a raw capture, e.g.
+    #   python -m dataq.chunked run.dqr run.dqc
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compress a raw capture into a chunked recording")
+    parser.add_argument("capture")
+    parser.add_argument("output")
+    parser.add_argument("--chunk-scans", type=int, default=65536)
+    parser.add_argument("--codec", choices=("zstd", "zlib"))
+    parser.add_argument("--level", type=int, default=3)
+    arguments = parser.parse_args()
+
+    compress_capture(arguments.capture, arguments.output, arguments.chunk_scans,
+                     arguments.codec, arguments.level)
+    with open_recording(arguments.output) as recording:
+        print("Compressed", len(recording), "scans")
@@ -0,0 +1,292 @@
+"""
+Chunked columnar writer for decoded scans: Parquet or Arrow IPC files.
+
+ColumnarWriter buffers decoded blocks into fixed-size column chunks, one
+column per scan plan column plus a 'time' column, and hands each full chunk
+to a background thread that converts it to an Arrow table and writes it as
+one compressed row group (Parquet) or record batch (Arrow IPC.) The
+acquisition thread only copies blocks into the chunk buffer.
+
+Channel metadata comes from the scan plan: each field carries its slist
+entry, decode kind, measurement range, TC type and units as Arrow field
+metadata, and the schema carries the model, slist and scan rate. Analog,
+TC and rate columns are stored as float32, which holds every 16-bit reading
+exactly enough and halves the file size; digital inputs as uint8 and
+counters as uint16. TC error conditions are kept as +/- infinity.
+
+With change_events=True, digital input and counter columns, which rarely
+change, are left out of the main file and stored as change events instead
+(see dataq.change_events): a second file of (time, scan, channel, value)
+rows, one per change, named like the main file with ".events" before the
+extension.
+
+Requires pyarrow (pip install pyarrow.)
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from . import scan_plan
+from .change_events import ChangeEncoder, event_columns
+from .timestamps import TimedBlock
+
+# Arrow storage type per decode kind
+_STORAGE = {
+    scan_plan.VOLTAGE: np.float32,
+    scan_plan.TC: np.float32,
+    scan_plan.DIG_IN: np.uint8,
+    scan_plan.RATE: np.float32,
+    scan_plan.COUNTER: np.uint16,
+}
+
+FORMATS = ("parquet", "arrow")
+
+
+def column_names(plan):
+    """Return unique column names for a plan, numbering repeated channels."""
+    names = []
+    for position, name in enumerate(plan.channel_names()):
+        names.append(name if name not in names else name + "_" + str(position))
+    return names
+
+
+def schema_for(plan, scan_rate=None, columns=None):
+    """
+    Return the Arrow schema, with channel metadata, for a scan plan, or for
+    some of its columns.
+    """
+    if pa is None:
+        raise ImportError("dataq.columnar requires pyarrow")
+    names = column_names(plan)
+    if columns is None:
+        columns = range(plan.columns)
+    fields = [pa.field("time", pa.timestamp("us", tz="UTC"), nullable=False)]
+    for column in columns:
+        name = names[column]
+        metadata = {
+            "kind": scan_plan.KIND_NAMES[plan.kinds[column]],
+            "units": plan.units[column],
+            "range": str(plan.ranges[column]),
+        }
+        if column < len(plan.slist):
+            metadata["slist"] = hex(plan.slist[column])
+        if plan.tc_type[column] >= 0:
+            metadata["tc_type"] = scan_plan.TC_TYPES[plan.tc_type[column]]
+        fields.append(pa.field(name, pa.from_numpy_dtype(_STORAGE[plan.kinds[column]]),
+                               nullable=False, metadata=metadata))
+    metadata = {
+        "model": plan.model,
+        "slist": json.dumps([hex(item) for item in plan.slist]),
+        "scan_rate": json.dumps(scan_rate),
+    }
+    return pa.schema(fields, metadata=metadata)
+
+
+def events_schema_for(plan, scan_rate=None):
+    """Return the Arrow schema of the change events file for a scan plan."""
+    if pa is None:
+        raise ImportError("dataq.columnar requires pyarrow")
+    fields = [
+        pa.field("time", pa.timestamp("us", tz="UTC"), nullable=False),
+        pa.field("scan", pa.int64(), nullable=False),
+        pa.field("channel", pa.dictionary(pa.int16(), pa.string()), nullable=False),
+        pa.field("value", pa.int64(), nullable=False),
+    ]
+    metadata = {
+        "model": plan.model,
+        "slist": json.dumps([hex(item) for item in plan.slist]),
+        "scan_rate": json.dumps(scan_rate),
+    }
+    return pa.schema(fields, metadata=metadata)
+
+
+def events_path_for(path):
+    """Return the change events file name for a main file name."""
+    root, extension = os.path.splitext(path)
+    return root + ".events" + extension
+
+
+class ColumnarWriter:
+    """
+    Write decoded scan blocks to a Parquet or Arrow IPC file in row groups.
+
+    plan is the scan plan the blocks were decoded with. Each scan is time
+    stamped either by the timestamps passed to write() (seconds since the
+    epoch) or, if none are given, from start_time (default: the time of the
+    first write) and scan_rate in Hz. row_group_scans is the number of scans
+    per row group. file_format is "parquet" or "arrow"; compression is any
+    codec pyarrow supports for that format (e.g. "zstd", "lz4", "snappy".)
+    queue_chunks bounds the chunks waiting for the background thread;
+    write() blocks when it is full rather than use unbounded memory.
+    change_events stores digital input and counter columns as change
+    events in a second file (see events_path_for().)
+    """
+
+    def __init__(self, path, plan, scan_rate=None, start_time=None, row_group_scans=65536,
+                 file_format="parquet", compression="zstd", queue_chunks=8, change_events=False):
+        if pa is None:
+            raise ImportError("dataq.columnar requires pyarrow")
+        if file_format not in FORMATS:
+            raise ValueError("file_format must be one of " + ", ".join(FORMATS))
+        self.path = path
+        self.plan = plan
+        self.scan_rate = scan_rate
+        self.start_time = start_time
+        self.row_group_scans = row_group_scans
+
+        self._encoder = None
+        self._events_writer = None
+        self._columns = list(range(plan.columns))
+        if change_events:
+            encoded = event_columns(plan)
+            self._columns = [c for c in self._columns if c not in encoded]
+            self._encoder = ChangeEncoder(encoded)
+            self._channel_names = pa.array(column_names(plan))
+            self.events_schema = events_schema_for(plan, scan_rate)
+            self._events_writer = self._open(events_path_for(path), self.events_schema,
+                                             file_format, compression)
+        self.schema = schema_for(plan, scan_rate, self._columns)
+        self._writer = self._open(path, self.schema, file_format, compression)
+        self._file_format = file_format
+
+        # Exception that ended the thread, re-raised by write() and close()
+        self.error = None
+        # Counters
+        self.scans_written = 0
+        self.row_groups = 0
+        self.events_written = 0
+        self._scans = 0
+
+        self._new_chunk()
+        self._closed = False
+        self._chunks = queue.Queue(maxsize=queue_chunks)
+        self._thread = threading.Thread(target=self._run, name="dataq-columnar", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _open(path, schema, file_format, compression):
+        if file_format == "parquet":
+            return pq.ParquetWriter(path, schema, compression=compression)
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        return pa.ipc.new_file(path, schema, options=options)
+
+    def _new_chunk(self):
+        self._values = np.empty((self.row_group_scans, len(self._columns)))
+        self._times = np.empty(self.row_group_scans, dtype=np.int64)
+        self._fill = 0
+        # Change events since the last chunk: (scans, times, columns, values) arrays
+        self._events = []
+
+    def write(self, block, timestamps=None):
+        """
+        Buffer a block of decoded scans shaped (scans, plan.columns).
+        timestamps, if given, holds one time per scan in seconds since the
+        epoch. A dataq.timestamps.TimedBlock brings its own times.
+        """
+        if self.error is not None:
+            raise self.error
+        if isinstance(block, TimedBlock):
+            block, timestamps = block
+        block = np.asarray(block)
+        if timestamps is None:
+            if self.scan_rate is None:
+                raise ValueError("either timestamps or scan_rate is required")
+            if self.start_time is None:
+                self.start_time = time.time()
+            timestamps = self.start_time + (self._scans + np.arange(len(block))) / self.scan_rate
+        if self._encoder is not None:
+            times = np.round(np.asarray(timestamps) * 1e6).astype(np.int64)
+            for changes in self._encoder.encode(block):
+                local = changes.indexes - self._scans
+                self._events.append((changes.indexes, times[local],
+                                     np.full(len(local), changes.column, dtype=np.int16),
+                                     changes.values.astype(np.int64)))
+            if len(self._columns) < block.shape[1]:
+                block = block[:, self._columns]
+        self._scans += len(block)
+
+        start = 0
+        while start < len(block):
+            count = min(len(block) - start, self.row_group_scans - self._fill)
+            self._values[self._fill:self._fill + count] = block[start:start + count]
+            self._times[self._fill:self._fill + count] = np.round(
+                np.asarray(timestamps[start:start + count]) * 1e6)
+            self._fill += count
+            start += count
+            if self._fill == self.row_group_scans:
+                self.flush()
+
+    def flush(self):
+        """Hand the buffered scans to the background thread as a row group."""
+        if self._fill:
+            self._chunks.put((self._values[:self._fill], self._times[:self._fill], self._events))
+            self._new_chunk()
+
+    def _run(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            if self.error is not None:
+                # Keep draining so write() never blocks on a dead thread
+                continue
+            try:
+                values, times, events = chunk
+                arrays = [pa.array(times, type=self.schema.field(0).type)]
+                for position, column in enumerate(self._columns):
+                    arrays.append(pa.array(values[:, position].astype(_STORAGE[self.plan.kinds[column]])))
+                self._write_table(self._writer, pa.Table.from_arrays(arrays, schema=self.schema))
+                self.scans_written += len(times)
+                self.row_groups += 1
+                if events:
+                    self._write_events(events)
+            except Exception as e:
+                self.error = e
+
+    def _write_table(self, writer, table):
+        if self._file_format == "parquet":
+            writer.write_table(table, row_group_size=len(table))
+        else:
+            writer.write_table(table, max_chunksize=len(table))
+
+    def _write_events(self, events):
+        # One row per change, in scan order
+        scans, times, columns, values = (np.concatenate(field) for field in zip(*events))
+        order = np.argsort(scans, kind="stable")
+        channels = pa.DictionaryArray.from_arrays(pa.array(columns[order]), self._channel_names)
+        table = pa.Table.from_arrays(
+            [pa.array(times[order], type=self.events_schema.field(0).type), pa.array(scans[order]),
+             channels, pa.array(values[order])], schema=self.events_schema)
+        self._write_table(self._events_writer, table)
+        self.events_written += len(table)
+
+    def close(self):
+        """Write any buffered scans, wait for the thread and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        self._chunks.put(None)
+        self._thread.join()
+        self._writer.close()
+        if self._events_writer is not None:
+            self._events_writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,172 @@
+"""
+Pipelined command/response engine for the ASCII command set.
+
+The example programs' send_cmd() sleeps 100 ms after every command before
+looking for its echo, so a configuration of a dozen commands takes over a
+second. CommandEngine instead writes a whole sequence of commands back to
+back (up to 'window' outstanding at a time), matches each echoed line to
+the oldest outstanding command with the same command word, and gives each
+command its own timeout, so bring-up takes a few USB round trips.
+
+An echo must start its line with the command word, except the echo of
+'stop' (or 'S0'), which can follow binary scan data still arriving on the
+same line and must end it instead. Lines that don't match an outstanding
+command are skipped. confirm() also checks that every command was echoed
+back as sent and raises CommandError otherwise.
+"""
+
+import collections
+import time
+
+"""
+Response timeouts in seconds by command word. 'stop' can be answered only
+after the instrument has flushed data still queued.
+"""
+TIMEOUTS = {
+    "stop": 1.0,
+    "S0": 1.0,
+}
+DEFAULT_TIMEOUT = 0.5
+
+# Commands that start the binary stream instead of answering
+NO_RESPONSE = ("start", "S1")
+
+# Commands that end the binary stream, whose echo can follow scan data
+STREAM_ENDING = ("stop", "S0")
+
+# Serial read timeout while waiting for responses; reads return as soon as
+# bytes arrive, so this only bounds how often deadlines are checked
+_POLL = 0.01
+
+# Most unterminated bytes kept while looking for a response line
+_MAX_PARTIAL = 4096
+
+
+class CommandError(IOError):
+    """A command got no response, or one that doesn't echo it."""
+
+
+def echo_start(line, command):
+    """
+    Return the position in a response line where the echo of command
+    starts, or -1 if the line doesn't answer command.
+    """
+    if command.split()[0] in STREAM_ENDING:
+        return len(line) - len(command) if line.endswith(command) else -1
+    word = command.split()[0]
+    if line.startswith(word) and line[len(word):len(word) + 1] in ("", " "):
+        return 0
+    return -1
+
+
+def check_echo(command, response):
+    """Raise CommandError unless response is the echo of command."""
+    if command.split()[0] in NO_RESPONSE:
+        return
+    if response is None:
+        raise CommandError("no response to '" + command + "'")
+    if response.split()[:len(command.split())] != command.split():
+        raise CommandError("unexpected response to '" + command + "': '" + response + "'")
+
+
+class CommandEngine:
+    """
+    Send commands on an open serial port and collect their responses.
+
+    window is the largest number of commands awaiting a response at once.
+    timeouts overrides TIMEOUTS per command word. The port's read timeout
+    is restored after each execute().
+    """
+
+    def __init__(self, ser, window=16, timeouts=None):
+        self.ser = ser
+        self.window = window
+        self.timeouts = dict(TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self._partial = bytearray()
+        # Counters
+        self.commands_sent = 0
+        self.timeouts_expired = 0
+
+    def timeout_for(self, command):
+        """Return the response timeout of a command in seconds."""
+        return self.timeouts.get(command.split()[0], DEFAULT_TIMEOUT)
+
+    def execute(self, commands, timeout=None):
+        """
+        Send a sequence of commands, pipelined, and return their responses.
+
+        Returns one response line per command, in command order, starting at
+        the command word. A command that gets no response within its timeout
+        (or timeout, if given) has None, as do commands in NO_RESPONSE.
+        """
+        commands = list(commands)
+        responses = [None] * len(commands)
+        # (index, command, deadline) of commands awaiting a response
+        outstanding = collections.deque()
+        following = 0
+
+        saved_timeout = self.ser.timeout
+        self.ser.timeout = _POLL
+        try:
+            while following < len(commands) or outstanding:
+                # Fill the window with one write
+                batch = []
+                while following < len(commands) and len(outstanding) + len(batch) < self.window:
+                    batch.append(following)
+                    following += 1
+                if batch:
+                    self.ser.write(b"".join((commands[i] + "\r").encode() for i in batch))
+                    self.commands_sent += len(batch)
+                    now = time.monotonic()
+                    for i in batch:
+                        if commands[i].split()[0] not in NO_RESPONSE:
+                            limit = timeout if timeout is not None else self.timeout_for(commands[i])
+                            outstanding.append((i, commands[i], now + limit))
+                if not outstanding:
+                    continue
+
+                line = self._read_line(min(deadline for _, _, deadline in outstanding))
+                if line is not None:
+                    for entry in outstanding:
+                        start = echo_start(line, entry[1])
+                        if start >= 0:
+                            responses[entry[0]] = line[start:]
+                            outstanding.remove(entry)
+                            break
+
+                now = time.monotonic()
+                for entry in [e for e in outstanding if e[2] <= now]:
+                    outstanding.remove(entry)
+                    self.timeouts_expired += 1
+        finally:
+            self.ser.timeout = saved_timeout
+        return responses
+
+    def confirm(self, commands, timeout=None):
+        """
+        Like execute(), but raise CommandError if a command's response timed
+        out or doesn't echo the command.
+        """
+        commands = list(commands)
+        responses = self.execute(commands, timeout)
+        for command, response in zip(commands, responses):
+            check_echo(command, response)
+        return responses
+
+    def _read_line(self, deadline):
+        # Return the next complete line, or None at the deadline
+        while True:
+            end = self._partial.find(b"\r")
+            if end >= 0:
+                line = bytes(self._partial[:end])
+                del self._partial[:end + 1]
+                return line.decode(errors="replace").strip("\n\r\x00 ")
+            if time.monotonic() >= deadline:
+                return None
+            data = self.ser.read(max(1, self.ser.in_waiting))
+            if data:
+                self._partial += data
+                if len(self._partial) > _MAX_PARTIAL:
+                    del self._partial[:-_MAX_PARTIAL]
@@ -0,0 +1,112 @@
+"""
+Block averaging (boxcar) decimation for instruments without a protocol-level
+decimation function, such as models DI-1100 and DI-1110.
+
+BlockDecimator consumes whole scans as an integer array shaped
+(scans, width) and produces one result per 'factor' scans. Complete windows
+within a block are reduced with a single reshape and sum, and a window left
+incomplete at the end of a block is carried over as a running sum so it can
+be finished by the next block.
+
+PlanDecoder combines a BlockDecimator with a compiled scan plan
+(dataq.scan_plan) to decode and decimate raw bytes in one step.
+"""
+
+import numpy as np
+
+from . import scan_plan
+
+
+class BlockDecimator:
+    """
+    Boxcar decimation of integer scans, carried across block boundaries.
+
+    factor is the number of scans per output and must be an integer greater
+    than zero (1 passes every scan through). width is the number of columns
+    in each scan.
+    """
+
+    def __init__(self, factor, width):
+        if int(factor) != factor or factor < 1:
+            raise ValueError("decimation factor must be an integer greater than zero")
+        self.factor = int(factor)
+        self.width = width
+        self.reset()
+
+    def reset(self):
+        """Discard any partially accumulated window, e.g. after a stop."""
+        # Running column sums and scan count of the incomplete window
+        self._sum = np.zeros(self.width, dtype=np.int64)
+        self._count = 0
+
+    def push(self, counts):
+        """
+        Add a block of scans and return the windows it completes.
+
+        Returns (means, last): means is a float64 array shaped
+        (windows, width) holding the average of each completed window, and
+        last holds the final scan of each window for columns that are shown
+        instantaneously rather than averaged (digital inputs, counters.)
+        """
+        counts = np.asarray(counts).reshape(-1, self.width)
+        sums = []
+        lasts = []
+        start = 0
+
+        if self._count:
+            # Finish the window carried over from the previous block first
+            start = min(self.factor - self._count, len(counts))
+            self._sum += counts[:start].sum(axis=0, dtype=np.int64)
+            self._count += start
+            if self._count == self.factor:
+                sums.append(self._sum[np.newaxis])
+                lasts.append(counts[start - 1:start])
+                self._sum = np.zeros(self.width, dtype=np.int64)
+                self._count = 0
+
+        # Every complete window in the rest of the block, in one reduction
+        windows = (len(counts) - start) // self.factor
+        end = start + windows * self.factor
+        if windows:
+            body = counts[start:end].reshape(windows, self.factor, self.width)
+            sums.append(body.sum(axis=1, dtype=np.int64))
+            lasts.append(body[:, -1])
+
+        # Carry the incomplete tail into the next block
+        if end < len(counts):
+            self._sum += counts[end:].sum(axis=0, dtype=np.int64)
+            self._count += len(counts) - end
+
+        if not sums:
+            empty = np.empty((0, self.width))
+            return empty, empty.astype(counts.dtype)
+        return np.concatenate(sums) / self.factor, np.concatenate(lasts)
+
+
+class PlanDecoder:
+    """
+    Decode and decimate the raw bytes for the scans of a compiled scan plan.
+
+    Voltage, TC and rate columns are averaged over each window; digital
+    input and counter columns are reported instantaneously from the last
+    scan of the window. decode() returns a float64 array with one row per
+    completed window and one column per plan column.
+    """
+
+    def __init__(self, plan, decimation_factor=1):
+        self.plan = plan
+        self.decimator = BlockDecimator(decimation_factor, plan.columns)
+        # Columns taken from the last scan of a window instead of the average
+        kinds = np.asarray(plan.kinds)
+        self.instantaneous = (kinds == scan_plan.DIG_IN) | (kinds == scan_plan.COUNTER)
+
+    def reset(self):
+        """Discard a partially accumulated window, e.g. after a stop."""
+        self.decimator.reset()
+
+    def decode(self, raw):
+        """Decode the bytes for a number of whole scans; a partial scan is ignored."""
+        means, last = self.decimator.push(self.plan.integers(raw))
+        if self.instantaneous.any():
+            means[:, self.instantaneous] = last[:, self.instantaneous]
+        return self.plan.scale_integers(means)
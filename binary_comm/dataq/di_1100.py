@@ -0,0 +1,46 @@
+"""
+Block decoder with software decimation for model DI-1100.
+
+The DI-1100 cannot scan slower than ~915 Hz and has no protocol-level
+decimation, so Decoder averages 'decimation_factor' scans per output with
+dataq.decimation.BlockDecimator. All slist positions are ±10 V analog
+channels, and the two digital input states ride in the two LSBs of ONLY the
+first slist position. They are masked out of the analog value before
+averaging and reported instantaneously from the last scan of each window.
+
+The DI-1100 protocol can be downloaded from the instrument's product page:
+https://www.dataq.com/resources/pdfs/misc/di-1100-protocol.pdf
+"""
+
+import functools
+
+from . import scan_plan
+from .decimation import PlanDecoder
+
+# The DI-1100 has a fixed ±10 V measurement range
+analog_range = 10
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(slist):
+    kinds = [scan_plan.VOLTAGE] * len(slist)
+    return scan_plan.build("DI-1100", slist, kinds, [analog_range] * len(slist), lsb_dig_in=True)
+
+
+def compile_plan(slist):
+    """Compile slist into a dataq.scan_plan.ScanPlan (cached.)"""
+    return _compile(tuple(slist))
+
+
+class Decoder(PlanDecoder):
+    """
+    Convert the DI-1100 binary stream into decimated volts.
+
+    decode() returns a float64 array with one row per completed decimation
+    window: the average volts of each slist position followed by the
+    digital input states (0-3) as the last column.
+    """
+
+    def __init__(self, slist, decimation_factor=1):
+        self.slist = list(slist)
+        super().__init__(compile_plan(self.slist), decimation_factor)
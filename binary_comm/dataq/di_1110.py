@@ -0,0 +1,51 @@
+"""
+Block decoder with software decimation for model DI-1110.
+
+Like the DI-1100, the DI-1110 cannot scan slower than ~915 Hz and has no
+protocol-level decimation, so Decoder averages 'decimation_factor' scans per
+output with dataq.decimation.BlockDecimator. Analog and rate channels are
+averaged; digital input and counter channels are reported instantaneously
+from the last scan of each window.
+
+The DI-1110 protocol can be downloaded from the instrument's product page:
+https://www.dataq.com/resources/pdfs/misc/di-1110-protocol.pdf
+"""
+
+import functools
+
+from . import scan_plan
+from .decimation import PlanDecoder
+
+# The DI-1110 has a fixed ±10 V measurement range
+analog_range = 10
+
+"""
+Ordered list of rate measurement ranges supported by the DI-1110.
+The first item in the list is the lowest gain code (e.g. 50 kHz range = gain code 1).
+"""
+rate_ranges = tuple((50000,20000,10000,5000,2000,1000,500,200,100,50,20,10))
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(slist):
+    kinds, ranges, tc_type = scan_plan.slist_kinds(slist, (analog_range,) * 16, rate_ranges)
+    return scan_plan.build("DI-1110", slist, kinds, ranges, tc_type)
+
+
+def compile_plan(slist):
+    """Compile slist into a dataq.scan_plan.ScanPlan (cached.)"""
+    return _compile(tuple(slist))
+
+
+class Decoder(PlanDecoder):
+    """
+    Convert the DI-1110 binary stream into decimated engineering units.
+
+    decode() returns a float64 array with one row per completed decimation
+    window and one column per slist position: volts, Hz, digital input
+    states or counts.
+    """
+
+    def __init__(self, slist, decimation_factor=1):
+        self.slist = list(slist)
+        super().__init__(compile_plan(self.slist), decimation_factor)
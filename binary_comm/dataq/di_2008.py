@@ -0,0 +1,73 @@
+"""
+Block decoder for model DI-2008.
+
+The DI-2008 sends two little-endian bytes for each slist position, in slist
+order, for every scan. Instead of reading and scaling one sample at a time,
+decode_block() takes the bytes for any number of whole scans, views them as an
+int16 array shaped (scans, len(slist)) and scales each column with NumPy,
+following the scan plan compiled from slist (see dataq.scan_plan.) TC counts
+are converted to temperature by table lookup (see dataq.thermocouple.)
+
+The instrument's protocol document can be found here:
+https://www.dataq.com/resources/pdfs/misc/di-2008%20protocol.pdf
+"""
+
+import functools
+
+from . import scan_plan
+
+"""
+Ordered list of analog measurement ranges supported by the DI-2008.
+Begins with gain code 0 (±500 mV) and ends with gain code 0xD (±1 V), padded
+with 0 values as place holders for undefined codes (see protocol.)
+"""
+analog_ranges = [.5, 0.25, 0.1, .05, .025, .01, 0, 0, 50 ,25, 10, 5, 2.5, 1, 0, 0]
+
+"""
+Ordered list of rate measurement ranges supported by the DI-2008.
+The first item in the list is the lowest gain code (e.g. 50 kHz range = gain code 1).
+"""
+rate_ranges = tuple((50000,20000,10000,5000,2000,1000,500,200,100,50,20,10))
+
+"""
+m and b TC scaling constants in TC type order: B, E, J, K, N, R, S, T
+See protocol
+"""
+tc_m = [0.023956,0.018311,0.021515,0.023987,0.022888,0.02774,0.02774,0.009155]
+tc_b = [1035,400,495,586,550,859,859,100]
+
+# TC readings the instrument sends in place of a temperature
+TC_CJC_ERROR = 32767
+TC_OPEN = -32768
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(slist, nist):
+    kinds, ranges, tc_type = scan_plan.slist_kinds(slist, analog_ranges, rate_ranges, tc=True)
+    return scan_plan.build("DI-2008", slist, kinds, ranges, tc_type, tc_m, tc_b,
+                           tc_cjc=TC_CJC_ERROR, tc_open=TC_OPEN, nist=nist)
+
+
+def compile_plan(slist, nist=None):
+    """
+    Compile slist into a dataq.scan_plan.ScanPlan (cached.)
+
+    nist optionally maps voltage slist positions with a thermocouple wired
+    to them (e.g. on the ±10 mV to ±100 mV ranges) to (TC type name, cold
+    junction temperature in degC), such as {2: ("K", 23.0)}. Those positions
+    decode to temperature through the NIST reference function of the type
+    (see dataq.thermocouple.)
+    """
+    return _compile(tuple(slist), tuple(sorted(dict(nist or ()).items())))
+
+
+def decode_block(raw, slist):
+    """
+    Decode the bytes for a number of whole scans into engineering units.
+
+    raw is any bytes-like object holding whole scans; a trailing partial scan
+    is ignored. Returns a float64 array shaped (scans, len(slist)) holding
+    volts, degrees C, Hz, counts or digital input states per slist position.
+    TC positions reporting a CJC error decode as +inf, and open TCs as -inf.
+    """
+    return compile_plan(slist).decode(raw)
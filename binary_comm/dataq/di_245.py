@@ -0,0 +1,133 @@
+"""
+Block decoder for model DI-245.
+
+Every DI-245 sample is two bytes with a sync bit in the LSB of each byte and
+an inverted sign bit in the MS byte. The 14-bit ADC counts are recovered by
+inverting the sign bit, removing both sync bits and merging the 7-bit LS and
+MS byte halves. Since a sample is only 16 bits, that whole rearrangement is
+precomputed once into a 65536-entry table indexed by the raw little-endian
+word, and the scan plan applies it to every sample of a block by indexing.
+
+If digital inputs are enabled with 'dchn 1', the instrument appends one more
+word to each scan after the last slist position, carrying D0 and D1.
+"""
+
+import functools
+
+import numpy as np
+
+from . import scan_plan
+
+"""
+Ordered list of analog measurement ranges supported by the DI-245.
+Begins with gain code 0 (±500 mV) and ends with gain code 0xD (±1 V), padded
+with 0 values as place holders for undefined codes (see protocol.)
+"""
+analog_ranges = [.5, 0.25, 0.1, .05, .025, .01, 0, 0, 50 ,25, 10, 5, 2.5, 1, 0, 0]
+
+"""
+m and b TC scaling constants in TC type order: B, E, J, K, N, R, S, T
+See protocol
+"""
+tc_m = [0.095825,0.073242,0.08606,0.095947,0.091553,0.110962,0.110962,0.036621]
+tc_b = [1035,400,495,586,550,859,859,100]
+
+# TC readings the instrument sends in place of a temperature
+TC_CJC_ERROR = 8191
+TC_OPEN = -8192
+
+
+def _build_counts_table():
+    # Every possible raw word, low byte first as it arrives from the instrument
+    raw = np.arange(65536, dtype=np.uint16)
+    # Invert the sign bit of the high byte and treat the word as signed
+    counts = (raw ^ 0x8000).view(np.int16).astype(np.int32)
+    # Remove the LS byte sync bit, preserve the 7-bit LS byte data...
+    counts = counts >> 1
+    ls_byte = counts & 0x7F
+    # ...then drop the MS byte sync bit and move the MS byte back into place
+    counts = (counts >> 8) << 7
+    return (counts | ls_byte).astype(np.int16)
+
+
+def _build_dig_in_table():
+    raw = np.arange(65536, dtype=np.uint16)
+    # Strip the MS byte sync bit so D1 moves next to D0 in bit 7, then shift
+    # D1 and D0 into the LSB+1 and LSB positions (values 0-3)
+    low_byte = raw & 0xFF
+    high_byte = raw >> 8
+    return (((high_byte >> 1) << 8 | low_byte) >> 7).astype(np.uint8)
+
+
+# Raw little-endian sample word -> signed 14-bit ADC counts
+counts_table = _build_counts_table()
+
+# Raw little-endian digital input word -> D1/D0 states
+dig_in_table = _build_dig_in_table()
+
+
+def scan_width(slist, dig_inputs=False):
+    """Return the number of words in one scan."""
+    return len(slist) + (1 if dig_inputs else 0)
+
+
+def decode_counts(raw, slist, dig_inputs=False):
+    """
+    Strip sync bits from the bytes for a number of whole scans.
+
+    Returns (counts, dig_in): an int16 array of ADC counts shaped
+    (scans, len(slist)) and, if dig_inputs is set, a uint8 array of digital
+    input states with one entry per scan (otherwise None). A trailing
+    partial scan is ignored.
+    """
+    width = scan_width(slist, dig_inputs)
+    scans = memoryview(raw).nbytes // (2 * width)
+    words = np.frombuffer(raw, dtype="<u2", count=scans * width).reshape(scans, width)
+    counts = counts_table[words[:, :len(slist)]]
+    dig_in = dig_in_table[words[:, -1]] if dig_inputs else None
+    return counts, dig_in
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(slist, dig_inputs, nist):
+    kinds = []
+    ranges = []
+    tc_type = []
+    for item in slist:
+        # slist bit 12 is cleared for voltage, and set for TC channels
+        if item & 0x1000 == 0:
+            kinds.append(scan_plan.VOLTAGE)
+            ranges.append(analog_ranges[item >> 8])
+            tc_type.append(-1)
+        else:
+            kinds.append(scan_plan.TC)
+            ranges.append(0)
+            tc_type.append((item & 0x0700) >> 8)
+    return scan_plan.build("DI-245", slist, kinds, ranges, tc_type, tc_m, tc_b,
+                           full_scale=8192, dig_inputs=dig_inputs,
+                           tc_cjc=TC_CJC_ERROR, tc_open=TC_OPEN,
+                           counts_table=counts_table,
+                           dig_in_table=dig_in_table if dig_inputs else None,
+                           nist=nist)
+
+
+def compile_plan(slist, dig_inputs=False, nist=None):
+    """
+    Compile slist into a dataq.scan_plan.ScanPlan (cached.)
+
+    nist optionally maps voltage slist positions with a thermocouple wired
+    to them to (TC type name, cold junction temperature in degC), as for
+    dataq.di_2008.compile_plan().
+    """
+    return _compile(tuple(slist), bool(dig_inputs), tuple(sorted(dict(nist or ()).items())))
+
+
+def decode_block(raw, slist, dig_inputs=False):
+    """
+    Decode the bytes for a number of whole scans into engineering units.
+
+    Returns a float64 array shaped (scans, len(slist)), with one more column
+    holding the digital input states (0-3) if dig_inputs is set. TC positions
+    reporting a CJC error decode as +inf, and open TCs as -inf.
+    """
+    return compile_plan(slist, dig_inputs).decode(raw)
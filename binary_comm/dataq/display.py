@@ -0,0 +1,80 @@
+"""
+Console readout that refreshes at a fixed rate, independent of scan rate.
+
+Formatting and printing every scan limits how fast a program can acquire.
+Display instead keeps only a reference to the latest decoded scan, handed
+over with show(), and a thread of its own formats and prints that snapshot
+refresh_hz times per second, overwriting the line in place. show() only
+swaps a reference under a lock that is never held while printing, so the
+readout costs the same CPU at 10 Hz and at 100 kHz scan rates, and a slow
+terminal can't stall acquisition.
+"""
+
+import sys
+import threading
+import time
+
+from . import scan_plan
+
+
+class Display(threading.Thread):
+    """
+    Print the latest decoded scan of a scan plan at refresh_hz.
+
+    Each refresh formats the scan with dataq.scan_plan.format_scan() and
+    writes it to stream followed by a carriage return. Call show() with a
+    scan (or a block, of which the last scan is shown) from the acquisition
+    loop, clear() before printing other messages, and stop() when done.
+    metrics, a dataq.metrics.Metrics, optionally records the time of each
+    refresh as the "print" stage.
+    """
+
+    def __init__(self, plan, refresh_hz=10, stream=None, padding="           ", metrics=None):
+        super().__init__(daemon=True)
+        self.plan = plan
+        self.interval = 1 / refresh_hz
+        self.stream = stream or sys.stdout
+        self.padding = padding
+        self.metrics = metrics
+        self._latest = None
+        # _lock guards _latest; _writing is held for a whole refresh
+        self._lock = threading.Lock()
+        self._writing = threading.Lock()
+        self._stopping = threading.Event()
+        # Counters
+        self.shown = 0
+        self.refreshes = 0
+
+    def show(self, scan):
+        """Make scan (or the last scan of a block) the next one displayed."""
+        if scan.ndim > 1:
+            if not len(scan):
+                return
+            scan = scan[-1]
+        with self._lock:
+            self._latest = scan
+            self.shown += 1
+
+    def clear(self):
+        """Drop any scan not yet displayed and wait for a refresh in progress."""
+        with self._writing, self._lock:
+            self._latest = None
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            with self._writing:
+                with self._lock:
+                    scan, self._latest = self._latest, None
+                if scan is not None:
+                    started = time.perf_counter()
+                    self.stream.write(scan_plan.format_scan(self.plan, scan) + self.padding + "\r")
+                    self.stream.flush()
+                    self.refreshes += 1
+                    if self.metrics is not None:
+                        self.metrics.stage("print", time.perf_counter() - started, 1)
+
+    def stop(self):
+        """Stop refreshing and wait for the thread to end."""
+        self._stopping.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,432 @@
+"""
+Fan-out of one acquisition to any number of local processes through a
+shared memory ring buffer.
+
+The serial port can only be opened by one process, and piping decoded text
+to other processes costs far more than acquiring. Publisher instead copies
+each decoded block into a multiprocessing.shared_memory ring of float64
+scans, with an optional timestamp per scan. Subscribers in other processes
+attach to the ring by name and read at their own pace, without messages
+that would load the publisher: each one keeps its own position in the
+stream.
+
+Every scan has a sequence number, its index in the stream. A subscriber that
+falls more than the ring's capacity behind has lost the oldest scans; it
+skips ahead to the oldest scan still in the ring and counts the loss in
+'lost_scans' and 'lag_events', so a slow logger never holds up a live
+display.
+
+Shared memory layout: a HEADER_SIZE byte header, then the timestamps
+(capacity float64s) and the scans (capacity x columns float64s.) The header
+starts with the fixed fields
+
+    magic       8 bytes, MAGIC
+    version     uint32
+    header_size uint32
+    capacity    uint64, scans in the ring
+    columns     uint64, columns per scan
+    reserved    uint64, scans being written, including the block in progress
+    committed   uint64, scans written
+    closed      uint64, nonzero once the publisher has closed
+
+(little-endian), followed by UTF-8 JSON with the model, slist, dig_inputs,
+scan rate and the publisher's process id. The publisher raises 'reserved'
+before copying a block and 'committed' after, so a subscriber can tell if a
+slot was overwritten while it was reading it.
+
+Python has no memory barriers, so the counters are only ever read and
+written inside short sections under an flock() of a lock file next to the
+ring (LOCK_FILE.) Taking and releasing the lock orders the counter updates
+against the copies of the scans on any CPU. The scans themselves are copied
+outside the lock, so a slow subscriber never blocks the publisher for longer
+than one counter update. Where fcntl is missing (Windows), only x86 CPUs,
+which keep stores in order, are supported.
+
+Before Python 3.13 every process that attaches a shared memory block
+registers it with a resource tracker, which removes the block when the
+process exits. Subscribers in other processes unregister it again, so only
+the publisher's tracker cleans up after a crash. A subscriber sharing that
+tracker (a multiprocessing child) unregisters it there too, so a subscriber
+that finds the publisher gone when it closes removes the ring itself.
+"""
+
+import collections
+import json
+import os
+import platform
+import struct
+import sys
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+
+from . import models
+from .timestamps import TimedBlock
+
+MAGIC = b"DATAQFAN"
+VERSION = 1
+HEADER_SIZE = 4096
+
+# magic, version, header_size, capacity, columns, reserved, committed, closed
+_FIXED = struct.Struct("<8sIIQQQQQ")
+_COUNTERS_OFFSET = 32
+
+# Lock file of a ring, formatted with the ring's name
+LOCK_FILE = os.path.join(tempfile.gettempdir(), "dataq-fanout-{}.lock")
+
+# CPUs whose stores become visible to other processes in program order
+_ORDERED_MACHINES = ("x86_64", "amd64", "i386", "i686", "x86")
+
+"""
+Scans read from the ring. sequence is the stream index of the first scan,
+values the scans shaped (scans, columns) and times their timestamps (NaN
+where the publisher gave none.)
+"""
+Block = collections.namedtuple("Block", "sequence values times")
+
+
+class _Ordering:
+    """
+    A lock section that orders shared memory accesses between processes:
+    with ordering: ... Exclusive sections (for the publisher) exclude every
+    other section; shared ones only exclude exclusive ones.
+    """
+
+    def __init__(self, name, create=False, exclusive=False):
+        self.path = LOCK_FILE.format(name)
+        self._fd = None
+        if fcntl is None:
+            if platform.machine().lower() not in _ORDERED_MACHINES:
+                raise RuntimeError("fan-out needs fcntl or an x86 CPU, not " + platform.machine())
+            return
+        flags = os.O_RDWR | (os.O_CREAT if create else 0)
+        self._fd = os.open(self.path, flags, 0o600)
+        self._operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+    def __enter__(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, self._operation)
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self, remove=False):
+        """Close the lock file, removing it if remove is True."""
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        if remove:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _tracker_name(name):
+    # The name a POSIX shared memory block is known by to the resource tracker
+    return "/" + name
+
+
+def _uses_tracker():
+    # Whether attaching a block registers it with the resource tracker
+    return os.name == "posix" and sys.version_info < (3, 13)
+
+
+def _running(pid):
+    # Whether the process pid still exists
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _views(buffer, capacity, columns):
+    # (reserved, committed, closed), timestamps and scans of a ring
+    counters = np.ndarray(3, dtype="<u8", buffer=buffer, offset=_COUNTERS_OFFSET)
+    times = np.ndarray(capacity, dtype="<f8", buffer=buffer, offset=HEADER_SIZE)
+    values = np.ndarray((capacity, columns), dtype="<f8", buffer=buffer,
+                        offset=HEADER_SIZE + 8 * capacity)
+    return counters, times, values
+
+
+class Publisher:
+    """
+    Publish decoded scan blocks to a shared memory ring.
+
+    plan is the scan plan the blocks are decoded with, and capacity the
+    ring size in scans. name is the shared memory block name (default: a
+    unique name, in 'name' afterwards) that subscribers attach to. The
+    ring is removed by close().
+    """
+
+    def __init__(self, plan, capacity=65536, name=None, scan_rate=None):
+        self.plan = plan
+        self.capacity = capacity
+        self.columns = plan.columns
+        size = HEADER_SIZE + 8 * capacity * (1 + self.columns)
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = self._shm.name
+        self._ordering = _Ordering(self.name, create=True, exclusive=True)
+
+        settings = {
+            "model": plan.model,
+            "slist": list(plan.slist),
+            # Only the DI-245 digital inputs add a word after the slist positions
+            "dig_inputs": plan.words > len(plan.slist),
+            "scan_rate": scan_rate,
+            "pid": os.getpid(),
+        }
+        text = json.dumps(settings).encode()
+        if _FIXED.size + len(text) > HEADER_SIZE:
+            self._shm.close()
+            self._shm.unlink()
+            self._ordering.close(remove=True)
+            raise ValueError("fan-out settings do not fit in the header")
+        buffer = self._shm.buf
+        _FIXED.pack_into(buffer, 0, MAGIC, VERSION, HEADER_SIZE, capacity, self.columns, 0, 0, 0)
+        buffer[_FIXED.size:HEADER_SIZE] = text.ljust(HEADER_SIZE - _FIXED.size)
+        self._counters, self._times, self._values = _views(buffer, capacity, self.columns)
+        # Counters
+        self.scans_published = 0
+
+    def publish(self, block, timestamps=None):
+        """
+        Append a block of decoded scans shaped (scans, plan.columns), with
+        timestamps, if given, holding one time per scan. A
+        dataq.timestamps.TimedBlock brings its own times.
+        """
+        if isinstance(block, TimedBlock):
+            block, timestamps = block
+        block = np.asarray(block)
+        count = len(block)
+        if not count:
+            return
+        head = self.scans_published
+        if count > self.capacity:
+            # Only the newest capacity scans can be kept
+            skip = count - self.capacity
+            block = block[skip:]
+            if timestamps is not None:
+                timestamps = timestamps[skip:]
+            head += skip
+        with self._ordering:
+            self._counters[0] = self.scans_published + count
+
+        start = head % self.capacity
+        first = min(len(block), self.capacity - start)
+        self._values[start:start + first] = block[:first]
+        self._values[:len(block) - first] = block[first:]
+        if timestamps is None:
+            self._times[start:start + first] = np.nan
+            self._times[:len(block) - first] = np.nan
+        else:
+            self._times[start:start + first] = timestamps[:first]
+            self._times[:len(block) - first] = timestamps[first:]
+
+        self.scans_published += count
+        with self._ordering:
+            self._counters[1] = self.scans_published
+
+    def close(self):
+        """Tell subscribers the stream has ended and remove the ring."""
+        if self._shm is None:
+            return
+        with self._ordering:
+            self._counters[2] = 1
+        # Views into the block must go before it can be closed
+        self._counters = self._times = self._values = None
+        self._shm.close()
+        if _uses_tracker():
+            # A subscriber sharing this process's resource tracker may have
+            # unregistered the block, which unlink() unregisters again
+            resource_tracker.register(_tracker_name(self.name), "shared_memory")
+        self._shm.unlink()
+        self._shm = None
+        self._ordering.close(remove=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Subscriber:
+    """
+    Read scans published to a shared memory ring, from any local process.
+
+    name is the Publisher's name. start is "latest" to begin with the next
+    scan published, or "oldest" to begin with the oldest still in the ring.
+    While waiting for data, read() checks the ring every poll seconds.
+    If the publisher died without closing the ring, close() removes it.
+    """
+
+    def __init__(self, name, start="latest", poll=0.001):
+        if start not in ("latest", "oldest"):
+            raise ValueError("start must be 'latest' or 'oldest'")
+        self.name = name
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        magic, version, header_size, capacity, columns = _FIXED.unpack_from(self._shm.buf)[:5]
+        settings = {}
+        if magic == MAGIC and version == VERSION:
+            settings = json.loads(bytes(self._shm.buf[_FIXED.size:header_size]).decode())
+        self._publisher = settings.get("pid")
+        if _uses_tracker() and self._publisher != os.getpid():
+            # The publisher owns the block; this process's tracker must not
+            # remove it on exit
+            resource_tracker.unregister(_tracker_name(name), "shared_memory")
+        if not settings:
+            self._shm.close()
+            raise ValueError(name + " is not a dataq fan-out ring")
+        self._ordering = _Ordering(name)
+        self.model = settings["model"]
+        self.slist = settings["slist"]
+        self.dig_inputs = settings["dig_inputs"]
+        self.scan_rate = settings["scan_rate"]
+        self.plan = models.plan_for(self.model, self.slist, self.dig_inputs)
+        self.capacity = capacity
+        self.columns = columns
+        self.poll = poll
+        self._counters, self._times, self._values = _views(self._shm.buf, capacity, columns)
+
+        committed = self._committed()
+        # Sequence number of the next scan to read
+        self.sequence = committed if start == "latest" else max(0, committed - capacity)
+        # Counters
+        self.scans_read = 0
+        self.lost_scans = 0
+        self.lag_events = 0
+
+    def _committed(self):
+        # The number of scans written
+        with self._ordering:
+            return int(self._counters[1])
+
+    def _reserved(self):
+        # The number of scans written or being written
+        with self._ordering:
+            return int(self._counters[0])
+
+    def _skip_to(self, oldest):
+        # Scans before oldest were overwritten before this subscriber got to them
+        if self.sequence < oldest:
+            self.lost_scans += oldest - self.sequence
+            self.lag_events += 1
+            self.sequence = oldest
+
+    def closed(self):
+        """Return True if the publisher has closed and every scan was read."""
+        with self._ordering:
+            closed, committed = self._counters[2], int(self._counters[1])
+        return bool(closed) and self.sequence >= committed
+
+    def lag(self):
+        """Return the number of published scans not read yet."""
+        return self._committed() - self.sequence
+
+    def read(self, max_scans=None, timeout=None, copy=True):
+        """
+        Return a Block of the next scans, up to max_scans, waiting up to
+        timeout seconds (forever if None) for at least one. The Block is
+        empty if the wait timed out or the stream has ended.
+
+        With copy=False the Block holds views into the ring, with no copy,
+        up to the point where the ring wraps around. They stay valid only
+        until the publisher overwrites them; check with valid() after use,
+        and drop them before close().
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._ordering:
+                reserved, committed, closed = (int(c) for c in self._counters)
+            if committed > self.sequence:
+                # Scans the publisher is overwriting are lost to this subscriber
+                self._skip_to(reserved - self.capacity)
+                if committed > self.sequence:
+                    break
+            if closed or (deadline is not None and time.monotonic() >= deadline):
+                return Block(self.sequence, np.empty((0, self.columns)), np.empty(0))
+            time.sleep(self.poll)
+
+        count = committed - self.sequence
+        if max_scans is not None:
+            count = min(count, max_scans)
+        start = self.sequence % self.capacity
+        if copy:
+            first = min(count, self.capacity - start)
+            values = np.concatenate((self._values[start:start + first], self._values[:count - first]))
+            times = np.concatenate((self._times[start:start + first], self._times[:count - first]))
+        else:
+            count = min(count, self.capacity - start)
+            values = self._values[start:start + count]
+            times = self._times[start:start + count]
+
+        sequence = self.sequence
+        if copy:
+            # Drop scans the publisher started overwriting while they were copied
+            overwritten = self._reserved() - self.capacity - sequence
+            if overwritten > 0:
+                overwritten = min(overwritten, count)
+                values = values[overwritten:]
+                times = times[overwritten:]
+                self.lost_scans += overwritten
+                self.lag_events += 1
+                sequence += overwritten
+                count -= overwritten
+        self.sequence = sequence + count
+        self.scans_read += count
+        return Block(sequence, values, times)
+
+    def valid(self, block):
+        """Return True if none of a block's scans have been overwritten yet."""
+        return self._reserved() - self.capacity <= block.sequence
+
+    def blocks(self, max_scans=None):
+        """Yield Blocks as they are published until the publisher closes."""
+        while not self.closed():
+            block = self.read(max_scans, timeout=self.poll * 100)
+            if len(block.values):
+                yield block
+
+    def close(self):
+        """Detach from the ring, removing it if its publisher died without closing it."""
+        if self._shm is None:
+            return
+        with self._ordering:
+            abandoned = not self._counters[2]
+        abandoned = abandoned and os.name == "posix" and not _running(self._publisher)
+        self._counters = self._times = self._values = None
+        self._shm.close()
+        if abandoned:
+            if _uses_tracker():
+                # Unregistered on attaching; unlink() unregisters it again
+                resource_tracker.register(_tracker_name(self.name), "shared_memory")
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                # Another subscriber removed it first
+                if _uses_tracker():
+                    resource_tracker.unregister(_tracker_name(self.name), "shared_memory")
+        self._shm = None
+        self._ordering.close(remove=abandoned)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,201 @@
+"""
+Stream framing validator: keeps the binary stream aligned to scan
+boundaries, and re-aligns it when bytes go missing.
+
+Every decoder assumes the first byte it is handed starts a scan. After a
+flushInput() mid-stream or a dropped byte that stops being true, and every
+later reading is silently credited to the wrong channel until acquisition
+is restarted. FrameValidator sits between the reader and the decoder and
+checks each scan against the bits the protocol guarantees:
+
+- DI-245: the sync bit (bit 0) of every byte is 0 in the first byte of a
+  scan and 1 in all others.
+- CDC models: a digital input slist position always has a zero low byte and
+  a zero bit 15, and if max_counter_step is given, a counter can't advance
+  by more than that many counts from one scan to the next.
+
+When a scan fails, the validator tries each byte offset of the data that
+follows and re-locks at the first one where lock_scans scans in a row
+pass, dropping the bytes in front of it. Where the checked bits don't cover
+every byte, a byte lost late in a scan only shows in the next one, so the
+last scan of each block is held back until its successor passes, and the
+scan before a failure is dropped with it. Acquisition never stops; the loss
+shows up in the dropped_bytes and resync_events counters.
+
+A CDC scan list with neither a digital input position nor a counter has no
+bits to check, and the stream is passed through as is ('checkable' is
+False.) Adding a digital input position to such a scan list makes it self
+checking for the cost of one word per scan.
+"""
+
+import numpy as np
+
+from . import scan_plan
+
+
+def constant_bits(plan):
+    """
+    Return (mask, expected), two uint8 arrays of plan.scan_bytes: the bits
+    of each scan byte that are fixed by the protocol, and their values.
+    """
+    mask = np.zeros(plan.scan_bytes, dtype=np.uint8)
+    expected = np.zeros(plan.scan_bytes, dtype=np.uint8)
+    if plan.model == "DI-245":
+        mask[:] = 0x01
+        expected[1:] = 0x01
+    else:
+        for column, kind in enumerate(plan.kinds[:plan.words]):
+            if kind == scan_plan.DIG_IN:
+                # States are in bits 8-14 of the little-endian word
+                mask[2 * column] = 0xff
+                mask[2 * column + 1] = 0x80
+    return mask, expected
+
+
+class FrameValidator:
+    """
+    Check raw scan data against a scan plan and pass on only aligned, whole
+    scans.
+
+    Call feed() with each block of raw bytes as it is read; it returns the
+    bytes of the scans that passed, ready for plan.decode() or a decoder. A
+    scan split across two reads is held until the rest arrives. lock_scans
+    is the number of consecutive good scans required to (re-)lock onto a
+    byte offset. max_counter_step enables the counter continuity check.
+    """
+
+    def __init__(self, plan, lock_scans=2, max_counter_step=None):
+        self.plan = plan
+        self.scan_bytes = plan.scan_bytes
+        self.lock_scans = lock_scans
+        self.max_counter_step = max_counter_step
+        self.mask, self.expected = constant_bits(plan)
+        if max_counter_step is None:
+            self._counters = []
+        else:
+            self._counters = [c for c, kind in enumerate(plan.kinds[:plan.words])
+                              if kind == scan_plan.COUNTER]
+        self.checkable = bool(self.mask.any()) or bool(self._counters)
+        # Scans held back before passing on: none if every byte has a checked bit
+        self._hold = 0 if self.mask.all() else 1
+
+        self._pending = np.empty(0, dtype=np.uint8)
+        self._locked = False
+        self._ever_locked = False
+        # Counter words of the last scan passed on, for the continuity check
+        self._last_counts = None
+        # Counters
+        self.bytes_in = 0
+        self.scans_out = 0
+        self.dropped_bytes = 0
+        self.resync_events = 0
+
+    def _failures(self, scans, last_counts=None):
+        # Boolean per scan: True if it breaks a constant bit or counter rule
+        bad = ((scans & self.mask) != self.expected).any(axis=1)
+        if self._counters:
+            counts = scans.view("<u2")[:, self._counters].astype(np.int32)
+            if last_counts is not None:
+                counts = np.vstack((last_counts, counts))
+            steps = np.diff(counts, axis=0) % 65536
+            jumps = (steps > self.max_counter_step).any(axis=1)
+            if last_counts is not None:
+                bad |= jumps
+            else:
+                bad[1:] |= jumps
+        return bad
+
+    def _find_lock(self, data):
+        # Offset in data of the first run of lock_scans good scans; None if
+        # no offset within one scan has one, or -1 if more data is needed
+        span = self.lock_scans * self.scan_bytes
+        if len(data) < span + self.scan_bytes - 1:
+            return -1
+        for offset in range(self.scan_bytes):
+            window = data[offset:offset + span].reshape(self.lock_scans, self.scan_bytes)
+            if not self._failures(window).any():
+                return offset
+        return None
+
+    def feed(self, raw):
+        """Validate the next raw bytes and return the aligned scans among them."""
+        data = np.frombuffer(raw, dtype=np.uint8)
+        self.bytes_in += len(data)
+        if not self.checkable:
+            self.scans_out += len(data) // self.scan_bytes
+            return data
+        if len(self._pending):
+            data = np.concatenate((self._pending, data))
+
+        passed = []
+        position = 0
+        while True:
+            if not self._locked:
+                offset = self._find_lock(data[position:])
+                if offset == -1:
+                    break
+                if offset is None:
+                    # Nothing within this scan's worth of bytes lines up
+                    position += self.scan_bytes
+                    self.dropped_bytes += self.scan_bytes
+                    continue
+                position += offset
+                self.dropped_bytes += offset
+                self._locked = True
+                self._last_counts = None
+                if self._ever_locked:
+                    self.resync_events += 1
+                self._ever_locked = True
+
+            count = (len(data) - position) // self.scan_bytes
+            if count <= self._hold:
+                break
+            scans = data[position:position + count * self.scan_bytes].reshape(count, self.scan_bytes)
+            bad = self._failures(scans, self._last_counts)
+            good = int(np.argmax(bad)) if bad.any() else count
+            if good < count:
+                # Lost alignment in this scan. Unless every byte is checked,
+                # the scan before it may have lost a byte past the checked
+                # bits, so it goes too; then look for alignment again
+                suspect = min(good, self._hold)
+                passing = good - suspect
+                self.dropped_bytes += suspect * self.scan_bytes
+                self._locked = False
+            else:
+                # Hold the last scan back until the one after it checks out
+                passing = good - self._hold
+            if passing:
+                passed.append(scans[:passing].reshape(-1))
+                self.scans_out += passing
+                if self._counters:
+                    self._last_counts = scans[passing - 1].view("<u2")[self._counters].astype(np.int32)
+            position += (good if good < count else passing) * self.scan_bytes
+            if good == count:
+                break
+
+        self._pending = data[position:].copy()
+        if not passed:
+            return np.empty(0, dtype=np.uint8)
+        return np.concatenate(passed) if len(passed) > 1 else passed[0]
+
+    def position(self):
+        """Return the offset in bytes, in everything fed, just past the last scan returned."""
+        if not self.checkable:
+            return self.bytes_in
+        return self.bytes_in - len(self._pending)
+
+    def reset(self):
+        """Forget held bytes and lock, e.g. after the stream was restarted."""
+        self._pending = np.empty(0, dtype=np.uint8)
+        self._locked = False
+        self._ever_locked = False
+        self._last_counts = None
+
+    def stats(self):
+        """Return the counters as a dict."""
+        return {
+            "bytes_in": self.bytes_in,
+            "scans_out": self.scans_out,
+            "dropped_bytes": self.dropped_bytes,
+            "resync_events": self.resync_events,
+        }
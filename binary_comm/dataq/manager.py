@@ -0,0 +1,294 @@
+"""
+Discover every connected DATAQ Instruments device and run each acquisition
+in its own process.
+
+Unlike the discovery() routine of the example programs, which stops at the
+first port with the DATAQ Instruments VID, discover() returns all of them and
+identifies each unit by USB serial number and model ('info 1'.)
+DeviceManager then starts one worker process per configured unit, each with
+its own scan list and sample rate, and merges the decoded blocks from all
+workers into a single stream. Since each worker reads and decodes in its own
+process, throughput scales with cores rather than being capped by one GIL.
+"""
+
+import collections
+import multiprocessing
+import queue
+import time
+
+import serial
+import serial.tools.list_ports
+
+from . import models, timestamps, tuning
+from .commands import CommandEngine
+from .framing import FrameValidator
+from .metrics import Metrics, render
+from .reader import ScanReader
+
+# A discovered device
+DeviceInfo = collections.namedtuple("DeviceInfo", "port serial_number model")
+
+"""
+Acquisition settings for one device. dec is only sent if given (the DI-1100
+and DI-1110 have no 'dec' command); decimation_factor is their software
+decimation instead. If latency_budget (seconds) is given, ps is ignored and
+the packet size and host read size are chosen by dataq.tuning.choose() for
+that budget and the throughput target (scans per second, default: the scan
+rate.) The DI-245 uses xrate, the (arg0, arg1) pair of its 'xrate' command,
+and dig_inputs ('dchn 1') instead of srate, dec and ps.
+"""
+AcquisitionConfig = collections.namedtuple(
+    "AcquisitionConfig",
+    "slist srate dec ps decimation_factor latency_budget throughput xrate dig_inputs",
+    defaults=(None, 0, 1, None, None, None, False))
+
+
+def send_cmd(ser, command, timeout=1.0):
+    """
+    Send a command on an open port and return its response line.
+
+    Lines that don't contain the command word, such as leftover scan data,
+    are skipped. Returns None if no response arrives within timeout.
+    """
+    return CommandEngine(ser).execute([command], timeout)[0]
+
+
+def _model_from_info(response):
+    # 'info 1' answers with the model number, e.g. "info 1 2008"; None if
+    # there was no answer or it isn't one
+    fields = response.split() if response else []
+    if len(fields) != 3 or fields[:2] != ["info", "1"] or not fields[2].isdigit():
+        return None
+    number = fields[2]
+    if number == "4718":
+        return "DI-4718B"
+    return "DI-" + number
+
+
+def identify(port):
+    """
+    Return a DeviceInfo for a port, asking the instrument for its model.
+    The model is None if the instrument gave no valid 'info 1' reply.
+    """
+    with serial.Serial(port.device, 115200, timeout=0.5) as ser:
+        # Stop in case the device was left running, then discard its data
+        ser.write(b"stop\r")
+        time.sleep(0.1)
+        ser.reset_input_buffer()
+        model = _model_from_info(send_cmd(ser, "info 1"))
+        serial_number = port.serial_number
+        if not serial_number:
+            response = send_cmd(ser, "info 6")
+            serial_number = response.split()[-1] if response else port.device
+    return DeviceInfo(port.device, serial_number, model)
+
+
+def discover():
+    """
+    Return a DeviceInfo for every connected DATAQ Instruments device.
+
+    A port that can't be opened or read, or whose instrument gives no valid
+    'info 1' reply (e.g. one busy with another program), is skipped.
+    """
+    devices = []
+    for p in serial.tools.list_ports.comports():
+        if "VID:PID=0683" not in p.hwid:
+            continue
+        try:
+            device = identify(p)
+        except (serial.SerialException, OSError):
+            continue
+        if device.model is not None:
+            devices.append(device)
+    return devices
+
+
+def start_command(model):
+    """Return the bytes that start scanning on 'model'."""
+    return b"S1\r" if model == "DI-245" else b"start\r"
+
+
+def stop_command(model):
+    """Return the bytes that stop scanning on 'model'."""
+    return b"S0\r" if model == "DI-245" else b"stop\r"
+
+
+def configure(ser, model, config):
+    """
+    Stop the instrument and send its scan list, sample rate and packet
+    size. Returns the dataq.tuning.Tuning applied (None for the DI-245.)
+    Raises dataq.commands.CommandError if a command isn't echoed back.
+    """
+    engine = CommandEngine(ser)
+    engine.confirm(["stop"])
+    ser.reset_input_buffer()
+    if model == "DI-245":
+        commands = ["chn " + str(position) + " " + str(item)
+                    for position, item in enumerate(config.slist)]
+        commands.append("xrate " + str(config.xrate[0]) + " " + str(config.xrate[1]))
+        commands.append("dchn " + ("1" if config.dig_inputs else "0"))
+        engine.confirm(commands)
+        return None
+
+    tuned = tuning.for_config(model, config)
+    commands = []
+    if model != "DI-2008":
+        # Define binary output mode
+        commands.append("encode 0")
+    commands.append("ps " + str(tuned.ps))
+    # Scan list position must start with 0 and increment sequentially
+    for position, item in enumerate(config.slist):
+        commands.append("slist " + str(position) + " " + str(item))
+    if config.dec is not None:
+        commands.append("dec " + str(config.dec))
+    commands.append("srate " + str(config.srate))
+    # Sent back to back, each echo matched to its command
+    engine.confirm(commands)
+    return tuned
+
+
+# Seconds between reader statistics sent by each worker
+STATS_INTERVAL = 1.0
+
+
+def _stats(reader, tuned, validator, metrics):
+    # Reader and framing counters and measured latency, with the packet
+    # settings used and a snapshot of the hot-path metrics
+    stats = reader.stats()
+    stats.update(validator.stats())
+    if tuned is not None:
+        stats.update(tuned._asdict())
+    stats["metrics"] = metrics.snapshot()
+    return stats
+
+
+def _acquire(device, config, blocks, stopping):
+    # Worker process: configure, then read and decode until told to stop
+    try:
+        with serial.Serial(device.port, 115200, timeout=0.1) as ser:
+            tuned = configure(ser, device.model, config)
+            decode = models.decoder_for(device.model, config.slist, config.decimation_factor,
+                                        config.dig_inputs)
+            validator = FrameValidator(models.plan_for(device.model, config.slist, config.dig_inputs))
+            metrics = Metrics()
+            reader = ScanReader(ser, validator.scan_bytes,
+                                read_size=tuned.read_size if tuned else None, metrics=metrics)
+            ser.write(start_command(device.model))
+            reader.start()
+            stamper = timestamps.BlockStamper(timestamps.for_config(device.model, config), reader,
+                                              validator, config.decimation_factor)
+            next_stats = time.monotonic() + STATS_INTERVAL
+            try:
+                while not stopping.is_set():
+                    raw = validator.feed(reader.get(timeout=0.1))
+                    if len(raw):
+                        started = time.perf_counter()
+                        block = stamper.stamp(len(raw) // validator.scan_bytes, decode(raw))
+                        decoded = time.perf_counter()
+                        metrics.stage("decode", decoded - started, len(block.values))
+                        if len(block.values):
+                            blocks.put((device.serial_number, block))
+                            metrics.stage("sink", time.perf_counter() - decoded, len(block.values))
+                    if time.monotonic() >= next_stats:
+                        next_stats += STATS_INTERVAL
+                        blocks.put((device.serial_number,
+                                    _stats(reader, tuned, validator, metrics)))
+            finally:
+                reader.stop()
+                ser.write(stop_command(device.model))
+                blocks.put((device.serial_number, _stats(reader, tuned, validator, metrics)))
+    except Exception as e:
+        blocks.put((device.serial_number, e))
+    finally:
+        # End of stream marker for this device
+        blocks.put((device.serial_number, None))
+
+
+class DeviceManager:
+    """
+    Run acquisitions on several devices, one worker process each.
+
+    Configure devices with add(), then start() the workers and iterate
+    blocks() for (serial_number, block) pairs from all devices, in arrival
+    order, each block a dataq.timestamps.TimedBlock timed by the worker's
+    ScanClock. stop() ends every acquisition. 'stats' holds the latest reader
+    statistics of each device, including the measured delivery latency, the
+    packet size and read size used, the framing validator's dropped_bytes
+    and resync_events, and a dataq.metrics snapshot under "metrics";
+    metrics_text() renders those in the Prometheus text format.
+    """
+
+    def __init__(self, devices=None):
+        # Known devices by serial number, found with discover() if not given
+        if devices is None:
+            devices = discover()
+        self.devices = dict((d.serial_number, d) for d in devices)
+        self.configs = {}
+        self._workers = {}
+        self._blocks = multiprocessing.Queue()
+        self._stopping = multiprocessing.Event()
+        # Latest reader statistics from each worker, by serial number
+        self.stats = {}
+
+    def add(self, serial_number, config):
+        """Acquire from the device with serial_number using an AcquisitionConfig."""
+        if serial_number not in self.devices:
+            raise KeyError("no device with serial number " + str(serial_number))
+        if self.devices[serial_number].model not in models.MODELS:
+            raise ValueError("unsupported model: " + str(self.devices[serial_number].model))
+        self.configs[serial_number] = config
+
+    def start(self):
+        """Start one worker process per configured device."""
+        self._stopping.clear()
+        for serial_number, config in self.configs.items():
+            worker = multiprocessing.Process(
+                target=_acquire, name="dataq-" + serial_number, daemon=True,
+                args=(self.devices[serial_number], config, self._blocks, self._stopping))
+            worker.start()
+            self._workers[serial_number] = worker
+
+    def blocks(self, timeout=None):
+        """
+        Yield (serial_number, block) pairs until every worker has ended.
+
+        An exception raised in a worker is re-raised here. If timeout is
+        given and no block arrives within it, the generator returns.
+        """
+        running = set(self._workers)
+        while running:
+            try:
+                serial_number, block = self._blocks.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if block is None:
+                running.discard(serial_number)
+            elif isinstance(block, Exception):
+                raise block
+            elif isinstance(block, dict):
+                self.stats[serial_number] = block
+            else:
+                yield serial_number, block
+
+    def metrics_text(self):
+        """Return the latest metrics of every device in the Prometheus text format."""
+        return render(dict((serial_number, stats["metrics"])
+                           for serial_number, stats in self.stats.items()))
+
+    def stop(self):
+        """Stop every worker and wait for them to finish."""
+        self._stopping.set()
+        # Drain the queue so workers blocked on a full pipe can exit
+        running = set(self._workers)
+        while running:
+            try:
+                serial_number, block = self._blocks.get(timeout=1)
+            except queue.Empty:
+                break
+            if block is None:
+                running.discard(serial_number)
+            elif isinstance(block, dict):
+                self.stats[serial_number] = block
+        for worker in self._workers.values():
+            worker.join()
+        self._workers.clear()
@@ -0,0 +1,277 @@
+"""
+Hot-path metrics of an acquisition, and a text endpoint for them.
+
+Whether an instrument is keeping up shows in a few numbers: bytes and
+scans per second, how much each read call returns and how long it blocks,
+how long each block takes to decode and to hand to its sink, and how full
+the input buffers get. A Metrics object collects them from the reader
+thread and the consumer loop: counters, gauges (with peaks) and
+histograms with fixed buckets. Recording a value is a dictionary update or
+a bisect into a short list under an uncontended lock, a microsecond or so
+per read or block, so it can stay on in production.
+
+dataq.reader.ScanReader, dataq.session.Session and the
+dataq.manager.DeviceManager workers accept or keep a Metrics object.
+Names used by them:
+
+    counters    bytes_read, reads, scans_read, overrun_scans
+                <stage>_blocks, <stage>_scans and <stage>_busy_seconds for
+                the decode, sink and print stages (the rate of the last is
+                the fraction of the time the stage is busy)
+    gauges      backlog_bytes and backlog_capacity_bytes (the reader's ring
+                buffer), input_waiting_bytes (bytes the OS held when a read
+                started), each also as a peak
+    histograms  read_bytes and read_seconds per read call, <stage>_seconds
+                per block
+
+snapshot() returns all of them as a plain dict, with per-second rates of
+the counters over the last rate_window seconds, which can be pickled
+across processes. render() turns snapshots into the Prometheus text
+format; MetricsServer serves it over HTTP on a local port and MetricsFile
+writes it to a file periodically (e.g. for node_exporter's textfile
+collector.)
+"""
+
+import bisect
+import collections
+import http.server
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds: bytes per read call and seconds per call or block
+SIZE_BUCKETS = tuple(2 ** n for n in range(4, 21))
+SECONDS_BUCKETS = (1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3,
+                   0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class Histogram:
+    """
+    Counts of values by bucket, with their sum. bounds are the inclusive
+    upper bounds of the buckets, ascending; values above the last one are
+    counted in an overflow bucket.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Count one value."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """Return the bounds, counts, sum and count as a dict."""
+        return {"bounds": self.bounds, "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and histograms of one acquisition.
+
+    rate_window is the time in seconds over which snapshot() computes the
+    rates of the counters.
+    """
+
+    def __init__(self, rate_window=10.0):
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._peaks = {}
+        self._histograms = {}
+        self.started = time.monotonic()
+        # (time, counters) samples for the rates, oldest first
+        self._samples = collections.deque([(self.started, {})])
+
+    def add(self, name, value=1):
+        """Add value to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Set a gauge, keeping its peak."""
+        with self._lock:
+            self._gauges[name] = value
+            if value > self._peaks.get(name, value - 1):
+                self._peaks[name] = value
+
+    def observe(self, name, value, bounds=SECONDS_BUCKETS):
+        """Count value in a histogram, created with bounds on first use."""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(bounds)
+            histogram.observe(value)
+
+    def stage(self, name, seconds, scans):
+        """Record one block of scans that took seconds in a pipeline stage."""
+        with self._lock:
+            for counter, value in ((name + "_blocks", 1), (name + "_scans", scans),
+                                   (name + "_busy_seconds", seconds)):
+                self._counters[counter] = self._counters.get(counter, 0) + value
+            histogram = self._histograms.get(name + "_seconds")
+            if histogram is None:
+                histogram = self._histograms[name + "_seconds"] = Histogram(SECONDS_BUCKETS)
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """
+        Return the metrics as a dict: uptime_s, counters, rates (per second
+        over the last rate_window seconds), gauges, peaks and histograms.
+        """
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            peaks = dict(self._peaks)
+            histograms = dict((name, h.snapshot()) for name, h in self._histograms.items())
+            # Measure rates from the newest sample at least rate_window old
+            while len(self._samples) > 1 and now - self._samples[1][0] >= self.rate_window:
+                self._samples.popleft()
+            then, previous = self._samples[0]
+            if now - self._samples[-1][0] >= self.rate_window / 10:
+                self._samples.append((now, counters))
+        elapsed = now - then
+        rates = dict((name, (value - previous.get(name, 0)) / elapsed if elapsed > 0 else 0.0)
+                     for name, value in counters.items())
+        return {
+            "uptime_s": now - self.started,
+            "counters": counters,
+            "rates": rates,
+            "gauges": gauges,
+            "peaks": peaks,
+            "histograms": histograms,
+        }
+
+
+def _labels(label, value, extra=""):
+    pairs = []
+    if value is not None:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(label + '="' + escaped + '"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, int):
+        return str(value)
+    # Prometheus spells these +Inf, -Inf and NaN
+    return repr(float(value)).replace("inf", "Inf").replace("nan", "NaN")
+
+
+def render(snapshots, label="device", prefix="dataq"):
+    """
+    Return snapshots in the Prometheus text format. snapshots maps a label
+    value (e.g. a serial number, or None for no label) to a snapshot().
+    """
+    # Samples of each metric family, as (name suffix, labels and value)
+    series = collections.OrderedDict()
+
+    def add(name, kind, value, key, extra="", suffix=""):
+        series.setdefault((prefix + "_" + name, kind), []).append(
+            (suffix, _labels(label, key, extra) + " " + _number(value)))
+
+    for key, snapshot in snapshots.items():
+        add("uptime_seconds", "gauge", snapshot["uptime_s"], key)
+        for name, value in sorted(snapshot["counters"].items()):
+            add(name + "_total", "counter", value, key)
+        for name, value in sorted(snapshot["rates"].items()):
+            add(name + "_per_second", "gauge", value, key)
+        for name, value in sorted(snapshot["gauges"].items()):
+            add(name, "gauge", value, key)
+        for name, value in sorted(snapshot["peaks"].items()):
+            add(name + "_peak", "gauge", value, key)
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            cumulative = 0
+            for bound, count in zip(histogram["bounds"] + (float("inf"),), histogram["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                add(name, "histogram", cumulative, key, 'le="' + le + '"', "_bucket")
+            add(name, "histogram", histogram["sum"], key, suffix="_sum")
+            add(name, "histogram", histogram["count"], key, suffix="_count")
+
+    lines = []
+    for (name, kind), samples in series.items():
+        lines.append("# TYPE " + name + " " + kind)
+        for suffix, text in samples:
+            lines.append(name + suffix + text)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer(threading.Thread):
+    """
+    Serve metrics in the text format over HTTP, on any path.
+
+    collect is a function returning the text, e.g.
+    lambda: render({None: metrics.snapshot()}). The server listens on
+    host:port, the local host only by default; port 0 picks a free port,
+    found in 'port' afterwards.
+    """
+
+    def __init__(self, collect, port=9108, host="127.0.0.1"):
+        super().__init__(daemon=True)
+        self.collect = collect
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                body = self.collect().encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+
+    def run(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsFile(threading.Thread):
+    """
+    Write metrics in the text format to path every interval seconds.
+
+    collect is as for MetricsServer. Each write replaces the file at once
+    (through a temporary file), so readers never see a partial one.
+    """
+
+    def __init__(self, path, collect, interval=1.0):
+        super().__init__(daemon=True)
+        self.path = path
+        self.collect = collect
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def write(self):
+        """Write the current metrics now."""
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(self.collect())
+        os.replace(temporary, self.path)
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        """Stop writing, after a last write of the final values."""
+        self._stopping.set()
+        if self.is_alive():
+            self.join()
+        self.write()
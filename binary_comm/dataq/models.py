@@ -0,0 +1,84 @@
+"""
+Look up the block decoder for an instrument model by name.
+
+Code that works with more than one model (the asyncio device, tools that
+replay recordings) uses decoder_for(), plan_for() and scan_bytes() instead
+of importing a particular model module.
+"""
+
+from . import di_1100, di_1110, di_2008, di_245, starter_kit
+
+# Models that use the DI-2108 family decoder in starter_kit.py
+STARTER_KIT_MODELS = tuple(starter_kit.model_analog_ranges)
+
+MODELS = ("DI-2008", "DI-245", "DI-1100", "DI-1110") + STARTER_KIT_MODELS
+
+
+def decoder_for(model, slist, decimation_factor=1, dig_inputs=False):
+    """
+    Return a function that decodes the bytes for whole scans of 'model'.
+
+    The function takes a bytes-like object and returns a float64 array of
+    decoded scans. decimation_factor applies to the DI-1100 and DI-1110,
+    which have no protocol-level decimation, and dig_inputs to the DI-245
+    ('dchn 1'.) DI-1100/DI-1110 decoders keep a partial decimation window
+    between calls, so use one decoder per acquisition.
+    """
+    if model in ("DI-2008", "DI-245"):
+        return plan_for(model, slist, dig_inputs).decode
+    if model == "DI-1100":
+        return di_1100.Decoder(slist, decimation_factor).decode
+    if model == "DI-1110":
+        return di_1110.Decoder(slist, decimation_factor).decode
+    if model in STARTER_KIT_MODELS:
+        return plan_for(model, slist).decode
+    raise ValueError("unsupported model: " + str(model))
+
+
+def plan_for(model, slist, dig_inputs=False, nist=None):
+    """
+    Return the compiled scan plan (dataq.scan_plan.ScanPlan) of 'model' for
+    slist. dig_inputs applies to the DI-245 ('dchn 1'.) nist maps voltage
+    positions with a thermocouple wired to them to (TC type name, cold
+    junction temperature), for the DI-2008 and DI-245 (see
+    dataq.di_2008.compile_plan().) Plans are cached, so repeated calls with
+    the same slist are cheap.
+    """
+    if model == "DI-2008":
+        return di_2008.compile_plan(slist, nist)
+    if model == "DI-245":
+        return di_245.compile_plan(slist, dig_inputs, nist)
+    if nist:
+        raise ValueError("NIST thermocouple conversion is not supported for the " + str(model))
+    if model == "DI-1100":
+        return di_1100.compile_plan(slist)
+    if model == "DI-1110":
+        return di_1110.compile_plan(slist)
+    if model in STARTER_KIT_MODELS:
+        return starter_kit.compile_plan(slist, model)
+    raise ValueError("unsupported model: " + str(model))
+
+
+def scan_bytes(model, slist, dig_inputs=False):
+    """Return the number of bytes in one scan of 'model' for slist."""
+    return plan_for(model, slist, dig_inputs).scan_bytes
+
+
+def scan_rate(model, srate=None, dec=1, xrate=None):
+    """
+    Return the nominal scan rate in Hz for the instrument's rate settings.
+
+    DI-2008: 800 / (srate * dec). DI-1100 and DI-1110: 60,000,000 / srate
+    (no 'dec' command.) DI-2108 family: 60,000,000 / (srate * dec).
+    DI-245: xrate is the (arg0, arg1) pair of the 'xrate' command, where arg1
+    is the sample rate in Hz and arg0 holds the filter settings.
+    """
+    if model == "DI-2008":
+        return 800 / (srate * dec)
+    if model == "DI-245":
+        return float(xrate[1])
+    if model in ("DI-1100", "DI-1110"):
+        return 60e6 / srate
+    if model in STARTER_KIT_MODELS:
+        return 60e6 / (srate * dec)
+    raise ValueError("unsupported model: " + str(model))
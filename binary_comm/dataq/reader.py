@@ -0,0 +1,218 @@
+"""
+Background serial reader with a preallocated ring buffer.
+
+ScanReader owns the read side of an open serial port while acquiring. Its
+thread does blocking bulk reads and copies the bytes into a fixed-size NumPy
+ring buffer, so a slow consumer (decoding, printing to a terminal) never stalls
+draining the USB port. Consumers take whole scans with get(); a partial scan
+stays in the buffer until the rest of it arrives.
+
+If the consumer falls so far behind that the ring fills, the oldest whole
+scans are overwritten and counted in 'overrun_scans', so scan alignment is
+never lost. Each read is time stamped on arrival, and get() measures the
+delivery latency of every block it returns: the time from the arrival of the
+block's oldest byte to its delivery to the consumer. Commands can still be
+written to the port from another thread with ser.write() while the reader is
+running.
+"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+from .metrics import SIZE_BUCKETS
+
+
+class ScanReader(threading.Thread):
+    """
+    Drain a serial port into a ring buffer of whole scans.
+
+    ser is an open serial.Serial. scan_bytes is the number of bytes in one
+    scan and capacity is the ring size in scans. read_size is the minimum
+    number of bytes requested per read call; more is requested whenever
+    more is already waiting. timeout is the serial read timeout used by the
+    thread, which bounds how long stop() takes. metrics, a
+    dataq.metrics.Metrics, optionally records the size and duration of
+    every read call, the bytes the OS held before it, the backlog in the
+    ring and the scans delivered.
+    """
+
+    def __init__(self, ser, scan_bytes, capacity=65536, read_size=None, timeout=0.05,
+                 metrics=None):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.scan_bytes = scan_bytes
+        self.capacity = capacity * scan_bytes
+        self.read_size = read_size or 64 * scan_bytes
+        self.timeout = timeout
+        self.buffer = np.zeros(self.capacity, dtype=np.uint8)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.set("backlog_capacity_bytes", self.capacity)
+
+        # Total bytes ever written and consumed; positions are taken modulo capacity
+        self._head = 0
+        self._tail = 0
+        self._lock = threading.Lock()
+        self._data_ready = threading.Condition(self._lock)
+        self._stopping = threading.Event()
+
+        # Exception that ended the thread, re-raised to the consumer by get()
+        self.error = None
+        # Counters
+        self.bytes_read = 0
+        self.reads = 0
+        self.high_water = 0
+        self.overrun_scans = 0
+        self.overrun_events = 0
+
+        # (stream position after a read, arrival time) for unconsumed reads
+        self._arrivals = collections.deque()
+        # Delivery latency of the blocks returned by get(), in seconds
+        self.blocks = 0
+        self.latency_last = None
+        self.latency_max = 0.0
+        self._latency_total = 0.0
+        # Stream index of the first scan of the last block returned by get(),
+        # and (whole scans received, arrival time) of the read that completed
+        # it, for dataq.timestamps.ScanClock. Indexes count overwritten scans.
+        self.block_start = 0
+        self.last_arrival = None
+
+    def run(self):
+        # Blocking reads while running; the caller's timeout is restored on exit
+        saved_timeout = self.ser.timeout
+        self.ser.timeout = self.timeout
+        try:
+            while not self._stopping.is_set():
+                waiting = self.ser.in_waiting
+                started = time.perf_counter()
+                data = self.ser.read(max(self.read_size, waiting))
+                if self.metrics is not None:
+                    self.metrics.observe("read_seconds", time.perf_counter() - started)
+                    self.metrics.observe("read_bytes", len(data), SIZE_BUCKETS)
+                    self.metrics.set("input_waiting_bytes", waiting)
+                if data:
+                    self._put(data)
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self.ser.timeout = saved_timeout
+            except Exception:
+                # The port is gone (e.g. the unit was unplugged); nothing to restore
+                pass
+            with self._data_ready:
+                self._data_ready.notify_all()
+
+    def _put(self, data):
+        arrival = time.monotonic()
+        data = np.frombuffer(data, dtype=np.uint8)
+        with self._data_ready:
+            self.reads += 1
+            self.bytes_read += len(data)
+            # Only the newest capacity bytes of an oversized read can be kept
+            if len(data) > self.capacity:
+                self._head += len(data) - self.capacity
+                data = data[len(data) - self.capacity:]
+            excess = self._head - self._tail + len(data) - self.capacity
+            if excess > 0:
+                # Overwrite the oldest whole scans to keep scan alignment
+                dropped = -(-excess // self.scan_bytes)
+                self._tail += dropped * self.scan_bytes
+                self.overrun_scans += dropped
+                self.overrun_events += 1
+
+            start = self._head % self.capacity
+            first = min(len(data), self.capacity - start)
+            self.buffer[start:start + first] = data[:first]
+            self.buffer[:len(data) - first] = data[first:]
+            self._head += len(data)
+            self._arrivals.append((self._head, arrival))
+            self._forget_arrivals()
+
+            self.high_water = max(self.high_water, self._head - self._tail)
+            if self.metrics is not None:
+                self.metrics.add("bytes_read", len(data))
+                self.metrics.add("reads")
+                self.metrics.set("backlog_bytes", self._head - self._tail)
+                if excess > 0:
+                    self.metrics.add("overrun_scans", dropped)
+            if self._head - self._tail >= self.scan_bytes:
+                self._data_ready.notify_all()
+
+    def _forget_arrivals(self):
+        # Drop arrival times of reads that have been consumed or overwritten
+        while self._arrivals and self._arrivals[0][0] <= self._tail:
+            self._arrivals.popleft()
+
+    def backlog(self):
+        """Return the number of whole scans waiting to be consumed."""
+        with self._lock:
+            return (self._head - self._tail) // self.scan_bytes
+
+    def get(self, max_scans=None, timeout=None):
+        """
+        Take whole scans from the ring buffer.
+
+        Waits up to timeout seconds (forever if None) for at least one whole
+        scan and returns a uint8 array holding up to max_scans scans (all
+        waiting scans if None). Returns an empty array if the wait timed out.
+        """
+        with self._data_ready:
+            self._data_ready.wait_for(
+                lambda: self._head - self._tail >= self.scan_bytes
+                or self.error is not None or not self.is_alive(), timeout)
+            if self.error is not None:
+                raise self.error
+            scans = (self._head - self._tail) // self.scan_bytes
+            if max_scans is not None:
+                scans = min(scans, max_scans)
+            count = scans * self.scan_bytes
+            start = self._tail % self.capacity
+            first = min(count, self.capacity - start)
+            block = np.concatenate((self.buffer[start:start + first], self.buffer[:count - first]))
+            if count:
+                # The oldest byte of the block came with the first unconsumed read
+                latency = time.monotonic() - self._arrivals[0][1]
+                self.blocks += 1
+                self.latency_last = latency
+                self.latency_max = max(self.latency_max, latency)
+                self._latency_total += latency
+                end = self._tail + count
+                for position, arrival in self._arrivals:
+                    if position >= end:
+                        self.block_start = self._tail // self.scan_bytes
+                        self.last_arrival = (position // self.scan_bytes, arrival)
+                        break
+            self._tail += count
+            self._forget_arrivals()
+            if self.metrics is not None and count:
+                self.metrics.add("scans_read", scans)
+                self.metrics.set("backlog_bytes", self._head - self._tail)
+            return block
+
+    def stop(self):
+        """Stop the reader thread and wait for it to finish."""
+        self._stopping.set()
+        if self.is_alive():
+            self.join()
+
+    def stats(self):
+        """Return the reader counters as a dict."""
+        with self._lock:
+            return {
+                "bytes_read": self.bytes_read,
+                "reads": self.reads,
+                "backlog_bytes": self._head - self._tail,
+                "high_water_bytes": self.high_water,
+                "capacity_bytes": self.capacity,
+                "overrun_scans": self.overrun_scans,
+                "overrun_events": self.overrun_events,
+                "blocks": self.blocks,
+                "latency_last_s": self.latency_last,
+                "latency_mean_s": self._latency_total / self.blocks if self.blocks else None,
+                "latency_max_s": self.latency_max,
+            }
@@ -0,0 +1,165 @@
+"""
+Parallel offline decoding of recordings into columnar files.
+
+Reprocessing a recorded session, for instance with thermocouple
+conversion on voltage channels or another decimation factor, is a matter
+of decoding every scan again. reprocess() splits a recording into ranges of
+whole scans and decodes them in a pool of worker processes with the
+model's scan plan (and, for decimation, dataq.decimation.PlanDecoder), so
+the work spreads over every core. Each worker opens the recording itself:
+a raw capture (dataq.capture) is memory mapped, and a chunked recording
+(dataq.chunked) decompresses just the chunks of its range, so only decoded
+blocks travel back to the main process. Those are passed to a
+dataq.columnar.ColumnarWriter strictly in recording order, timed as
+dataq.timestamps.BlockStamper times them online: a decimated row at the
+middle of its window.
+
+At most a few blocks per worker are in flight at once, so memory use stays
+bounded when the writer is slower than the pool.
+"""
+
+import collections
+import multiprocessing
+import os
+
+import numpy as np
+
+from . import capture, chunked, columnar, models
+from .decimation import PlanDecoder
+from .timestamps import ScanClock, TimedBlock
+
+# Set up in each worker process by _start_worker()
+_recording = None
+_plan = None
+_factor = 1
+
+
+def open_any(path):
+    """Open a raw capture or a chunked recording, by its magic."""
+    with open(path, "rb") as f:
+        magic = f.read(8)
+    if magic == capture.MAGIC:
+        return capture.open_capture(path)
+    if magic == chunked.MAGIC:
+        return chunked.open_recording(path)
+    raise ValueError(str(path) + " is not a capture file or chunked recording")
+
+
+def _raw_scans(recording, start, stop):
+    # The undecoded bytes of scans start to stop, shaped (scans, scan_bytes)
+    if isinstance(recording, chunked.ChunkedRecording):
+        return recording.raw_scans(start, stop)
+    return np.ascontiguousarray(recording.raw[start:stop])
+
+
+def _start_worker(path, nist, decimation_factor):
+    global _recording, _plan, _factor
+    _recording = open_any(path)
+    _plan = models.plan_for(_recording.model, _recording.slist, _recording.dig_inputs, nist)
+    _factor = decimation_factor
+
+
+def _decode(scans):
+    # Decode one range of scans in a worker. float32 holds every reading
+    # exactly enough (see dataq.columnar) and halves what is sent back.
+    start, stop = scans
+    raw = _raw_scans(_recording, start, stop)
+    if _factor == 1:
+        values = _plan.decode(raw)
+    else:
+        values = PlanDecoder(_plan, _factor).decode(raw)
+    return values.astype(np.float32)
+
+
+def ranges(scans, block_scans, decimation_factor=1):
+    """
+    Split scans into (start, stop) ranges of up to block_scans, each a whole
+    number of decimation windows; the scans of a last, incomplete window
+    are left out.
+    """
+    block_scans = max(block_scans // decimation_factor, 1) * decimation_factor
+    scans -= scans % decimation_factor
+    return [(start, min(start + block_scans, scans)) for start in range(0, scans, block_scans)]
+
+
+def reprocess(path, output, processes=None, block_scans=None, decimation_factor=1, nist=None,
+              start_time=None, file_format="parquet", compression="zstd", in_flight=2,
+              change_events=False):
+    """
+    Decode the recording at path in parallel and write it to the columnar
+    file output. Returns the number of (decimated) scans written.
+
+    processes is the size of the process pool (default: one per CPU.)
+    block_scans is the number of scans per task (default: the chunk size
+    of a chunked recording, or 65536.) decimation_factor averages that many
+    scans into one, as dataq.decimation.PlanDecoder does, and nist converts
+    voltage positions to temperature (see dataq.di_2008.compile_plan().)
+    Scans are timed from start_time (default: the recording's start time,
+    or the epoch if it has none) at the recording's nominal rate, each
+    decimated scan at the middle of its window. in_flight is the number of tasks queued per process.
+    file_format, compression and change_events are passed to
+    dataq.columnar.ColumnarWriter.
+    """
+    processes = processes or os.cpu_count() or 1
+    with open_any(path) as recording:
+        model = recording.model
+        plan = models.plan_for(model, recording.slist, recording.dig_inputs, nist)
+        scan_rate = recording.scan_rate() / decimation_factor
+        if start_time is None:
+            start_time = recording.start_time or 0.0
+        clock = ScanClock(recording.scan_rate(), start_time)
+        if block_scans is None:
+            block_scans = getattr(recording, "chunk_scans", 65536)
+        tasks = ranges(len(recording), block_scans, decimation_factor)
+
+    def write(task, result):
+        # Time the rows of a task from its first scan, as BlockStamper does
+        block = result.get()
+        first = task[0] + (decimation_factor - 1) / 2
+        writer.write(TimedBlock(block, clock.times(first, len(block), decimation_factor)))
+        return len(block)
+
+    written = 0
+    # (task, result) of the tasks queued, in recording order
+    pending = collections.deque()
+    with multiprocessing.Pool(processes, _start_worker, (path, nist, decimation_factor)) as pool, \
+            columnar.ColumnarWriter(output, plan, scan_rate, start_time, file_format=file_format,
+                                    compression=compression, change_events=change_events) as writer:
+        for task in tasks:
+            pending.append((task, pool.apply_async(_decode, (task,))))
+            if len(pending) >= processes * in_flight:
+                written += write(*pending.popleft())
+        while pending:
+            written += write(*pending.popleft())
+    return written
+
+
+if __name__ == "__main__":
+    # Decode a recording to Parquet on every core, e.g.
+    #   python -m dataq.reprocess run.dqc run.parquet --dec 10 --nist 2:K:23.5
+    import argparse
+    import time
+
+    def nist_position(text):
+        position, tc_type, cjc = text.split(":")
+        return int(position), (tc_type.upper(), float(cjc))
+
+    parser = argparse.ArgumentParser(description="Decode a capture or chunked recording in parallel")
+    parser.add_argument("recording")
+    parser.add_argument("output")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--block-scans", type=int)
+    parser.add_argument("--dec", type=int, default=1)
+    parser.add_argument("--nist", nargs="+", type=nist_position, default=[],
+                        help="position:type:cold junction degC, e.g. 2:K:23.5")
+    parser.add_argument("--format", choices=columnar.FORMATS, default="parquet")
+    parser.add_argument("--compression", default="zstd")
+    parser.add_argument("--change-events", action="store_true")
+    arguments = parser.parse_args()
+
+    began = time.monotonic()
+    scans = reprocess(arguments.recording, arguments.output, arguments.processes,
+                      arguments.block_scans, arguments.dec, dict(arguments.nist) or None,
+                      file_format=arguments.format, compression=arguments.compression,
+                      change_events=arguments.change_events)
+    print("Wrote", scans, "scans in", round(time.monotonic() - began, 1), "s")
@@ -0,0 +1,254 @@
+"""
+Scan plans: slist compiled once into everything needed to decode a scan.
+
+Each slist entry packs the measurement function, range or TC type and
+channel number into bit fields. Rather than have every decoder, writer and
+display re-derive those per sample, a model module compiles slist into an
+immutable ScanPlan: per-column decode kind, scale and offset arrays, TC type
+index, TC error sentinels, units and display formats. Decoding a block is
+then the same few array operations for every model, with no branching on
+slist bits, and changing slist costs one compile (cached) rather than
+anything at sample time.
+
+Plans are built by the model modules (e.g. dataq.di_2008.compile_plan) or by
+name with dataq.models.plan_for().
+"""
+
+import collections
+
+import numpy as np
+
+from . import thermocouple
+
+# Decode kinds, one per output column
+VOLTAGE = 0
+TC = 1
+DIG_IN = 2
+RATE = 3
+COUNTER = 4
+
+KIND_NAMES = ("voltage", "tc", "dig_in", "rate", "counter")
+
+# Units and display formats per kind
+UNITS = ("V", "degC", "state", "Hz", "counts")
+FORMATS = ("{: 3.3f}", "{: 3.3f}", "{: 3d}", "{: 3.1f}", "{: 1d}")
+
+# TC type names in TC type index order
+TC_TYPES = "BEJKNRST"
+
+
+_ScanPlan = collections.namedtuple("ScanPlan", (
+    "model slist words scan_bytes kinds scale offset ranges tc_type units formats "
+    "tc_cjc tc_open tc_tables counts_table dig_in_table lsb_dig_in dtype"))
+
+
+class ScanPlan(_ScanPlan):
+    """
+    An immutable, compiled scan list.
+
+    There is one output column per slist position, plus a final digital
+    input column for the DI-245 with 'dchn 1' (a trailing word in each scan)
+    and for the DI-1100 (two LSBs of the first slist position.)
+
+    model           model name
+    slist           the scan list, as a tuple
+    words           16-bit words per scan, including a trailing digital input word
+    scan_bytes      bytes per scan
+    kinds           decode kind per output column (VOLTAGE, TC, ...)
+    scale, offset   engineering units = integer counts * scale + offset, except
+                    for TC columns
+    ranges          measurement range per column (0 where not applicable)
+    tc_type         TC type index (into TC_TYPES) per column, -1 if not a TC
+    units, formats  unit name and display format per column
+    tc_cjc, tc_open TC error sentinels in counts
+    tc_tables       (column, table) of every TC column: temperature by counts
+                    + len(table) // 2 (see dataq.thermocouple)
+    counts_table    raw word -> counts lookup table (DI-245), or None
+    dig_in_table    raw word -> digital input states table (DI-245), or None
+    lsb_dig_in      digital inputs in the two LSBs of position 0 (DI-1100)
+    dtype           output dtype
+    """
+
+    __slots__ = ()
+
+    @property
+    def columns(self):
+        """Number of output columns."""
+        return len(self.kinds)
+
+    def integers(self, raw):
+        """
+        Return the integer value of every column for the whole scans in raw.
+
+        Analog, TC, rate and counter columns hold signed ADC counts and
+        digital input columns hold input states, in an int32 array shaped
+        (scans, columns). A trailing partial scan is ignored.
+        """
+        scans = memoryview(raw).nbytes // self.scan_bytes
+        words = np.frombuffer(raw, dtype="<u2", count=scans * self.words).reshape(scans, self.words)
+        positions = len(self.slist)
+        result = np.empty((scans, self.columns), dtype=np.int32)
+        if self.counts_table is not None:
+            result[:, :positions] = self.counts_table[words[:, :positions]]
+        else:
+            result[:, :positions] = words[:, :positions].view(np.int16)
+        kinds = np.asarray(self.kinds)
+        dig_in = kinds[:positions] == DIG_IN
+        if dig_in.any():
+            # Digital input states are in the seven LSBs of the second byte
+            result[:, :positions][:, dig_in] = (words[:, :positions][:, dig_in] >> 8) & 0x7f
+        if self.lsb_dig_in:
+            # Two LSBs of position 0 carry the digital inputs, not analog data
+            result[:, positions] = words[:, 0] & 0x3
+            result[:, 0] &= ~0x3
+        elif self.dig_in_table is not None:
+            result[:, positions] = self.dig_in_table[words[:, positions]]
+        return result
+
+    def scale_integers(self, values):
+        """
+        Convert integer column values (or averages of them) into engineering
+        units. TC columns are looked up in their tables, where a CJC error
+        reads +inf and an open TC -inf.
+        """
+        result = (values * self.scale + self.offset).astype(self.dtype, copy=False)
+        integral = values.dtype.kind in "iu"
+        for column, table in self.tc_tables:
+            if integral:
+                result[:, column] = table[values[:, column] + len(table) // 2]
+            else:
+                # Averaged counts fall between table entries
+                result[:, column] = np.interp(values[:, column] + len(table) // 2,
+                                              np.arange(len(table)), table)
+        return result
+
+    def decode(self, raw):
+        """Decode the bytes for a number of whole scans into engineering units."""
+        return self.scale_integers(self.integers(raw))
+
+    def channel_names(self):
+        """Return a descriptive name per output column, e.g. 'tc2_K'."""
+        names = []
+        for column, kind in enumerate(self.kinds):
+            if column >= len(self.slist):
+                names.append("dig_in")
+            elif kind == TC:
+                names.append("tc" + str(self.slist[column] & 0xf) + "_" + TC_TYPES[self.tc_type[column]])
+            elif kind == VOLTAGE:
+                names.append("ch" + str(self.slist[column] & 0xf))
+            else:
+                names.append(KIND_NAMES[kind] + str(column))
+        return names
+
+
+def build(model, slist, kinds, ranges, tc_type=None, tc_m=None, tc_b=None, full_scale=32768,
+          dig_inputs=False, lsb_dig_in=False, tc_cjc=None, tc_open=None,
+          counts_table=None, dig_in_table=None, formats=None, nist=None):
+    """
+    Assemble a ScanPlan from per-position kinds and ranges.
+
+    This is the common part of the model modules' compile_plan() functions.
+    full_scale is the count for the top of a voltage range (32768 for
+    16-bit, 8192 for the 14-bit DI-245.) A digital input column is appended
+    if dig_inputs or lsb_dig_in is set. nist maps voltage positions with a
+    thermocouple wired to them to (TC type name, cold junction temperature
+    in degC); they decode as TCs through the NIST reference function.
+    """
+    kinds = list(kinds)
+    ranges = list(ranges)
+    tc_type = list(tc_type) if tc_type is not None else [-1] * len(kinds)
+    tables = {}
+    for position, (name, cjc_temperature) in dict(nist or ()).items():
+        if kinds[position] != VOLTAGE:
+            raise ValueError("slist position " + str(position) + " is not a voltage channel")
+        kinds[position] = TC
+        tc_type[position] = TC_TYPES.index(name)
+        tables[position] = thermocouple.nist_table(
+            name, ranges[position] / full_scale, 2 * full_scale, cjc_temperature)
+    if dig_inputs or lsb_dig_in:
+        kinds.append(DIG_IN)
+        ranges.append(0)
+        tc_type.append(-1)
+
+    scale = np.zeros(len(kinds))
+    offset = np.zeros(len(kinds))
+    for column, kind in enumerate(kinds):
+        if kind == VOLTAGE:
+            scale[column] = ranges[column] / full_scale
+        elif kind == TC:
+            if column not in tables:
+                tables[column] = thermocouple.linear_table(
+                    tc_m[tc_type[column]], tc_b[tc_type[column]], 2 * full_scale, tc_cjc, tc_open)
+        elif kind == RATE:
+            # (counts + 32768) / 65535 * range
+            scale[column] = ranges[column] / 65535
+            offset[column] = 32768 * ranges[column] / 65535
+        elif kind == COUNTER:
+            scale[column] = 1
+            offset[column] = 32768
+        else:
+            scale[column] = 1
+    scale.flags.writeable = False
+    offset.flags.writeable = False
+    tc_type = np.array(tc_type, dtype=np.int8)
+    tc_type.flags.writeable = False
+
+    words = len(slist) + (1 if dig_inputs else 0)
+    formats = formats or FORMATS
+    return ScanPlan(
+        model=model, slist=tuple(slist), words=words, scan_bytes=2 * words,
+        kinds=tuple(kinds), scale=scale, offset=offset, ranges=tuple(ranges),
+        tc_type=tc_type, units=tuple(UNITS[k] for k in kinds),
+        formats=tuple(formats[k] for k in kinds), tc_cjc=tc_cjc, tc_open=tc_open,
+        tc_tables=tuple(sorted(tables.items())),
+        counts_table=counts_table, dig_in_table=dig_in_table, lsb_dig_in=lsb_dig_in,
+        dtype=np.dtype(np.float64))
+
+
+def slist_kinds(slist, analog_ranges, rate_ranges, tc=False):
+    """
+    Decode the CDC-mode slist bit fields (DI-2008, DI-2108 family, DI-1100,
+    DI-1110) into per-position kinds, ranges and TC type indexes.
+    """
+    kinds = []
+    ranges = []
+    tc_type = []
+    for item in slist:
+        # The four LSBs of slist determine measurement function
+        function = item & 0xf
+        if function < 8 and tc and item & 0x1000:
+            # TC type in bits 8-10 selects m & b
+            kinds.append(TC)
+            ranges.append(0)
+            tc_type.append((item & 0x0700) >> 8)
+            continue
+        if function < 8:
+            kinds.append(VOLTAGE)
+            ranges.append(analog_ranges[item >> 8])
+        elif function == 8:
+            kinds.append(DIG_IN)
+            ranges.append(0)
+        elif function == 9:
+            kinds.append(RATE)
+            # Rate ranges begin with 1, so subtract 1 for a zero-based index
+            ranges.append(rate_ranges[(item >> 8) - 1])
+        else:
+            kinds.append(COUNTER)
+            ranges.append(0)
+        tc_type.append(-1)
+    return kinds, ranges, tc_type
+
+
+def format_scan(plan, scan):
+    """Format one decoded scan for display, using the plan's formats."""
+    fields = []
+    for kind, form, result in zip(plan.kinds, plan.formats, scan):
+        if kind == TC and result == np.inf:
+            fields.append("cjc error")
+        elif kind == TC and result == -np.inf:
+            fields.append("open")
+        elif kind in (DIG_IN, COUNTER):
+            fields.append(form.format(int(result)))
+        else:
+            fields.append(form.format(result))
+    return ", ".join(fields)
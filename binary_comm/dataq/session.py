@@ -0,0 +1,191 @@
+"""
+Supervised acquisition that survives the instrument dropping off USB.
+
+If a unit re-enumerates mid-run, every later serial call fails and the
+example programs stop. Session runs an acquisition in a thread that treats
+a failed read or write as a disconnect: it looks for the same unit again by
+its USB serial number (it may come back on a different port), replays the
+cached configuration with dataq.manager.configure(), restarts scanning and
+carries on. Nothing waits on an operator.
+
+The interruption is recorded in the stream itself: blocks() yields a Gap
+between the last block before the drop and the first block after it, with
+the wall-clock times the stream stopped and resumed and an estimate of the
+scans lost.
+
+Blocks are timed by a dataq.timestamps.ScanClock, a new one for each
+connection, and come out as dataq.timestamps.TimedBlock.
+"""
+
+import collections
+import queue
+import threading
+import time
+
+import serial
+import serial.tools.list_ports
+
+from . import manager, models, timestamps
+from .framing import FrameValidator
+from .metrics import Metrics
+from .reader import ScanReader
+
+"""
+Marker in the block stream for an interruption. start and end are
+time.time() values of the last data before the drop and of the restart;
+scans is the number of scans the instrument would have sent in between.
+"""
+Gap = collections.namedtuple("Gap", "start end scans")
+
+
+def find_port(serial_number):
+    """Return the port of the DATAQ Instruments device with serial_number, or None."""
+    for p in serial.tools.list_ports.comports():
+        if "VID:PID=0683" in p.hwid and p.serial_number == serial_number:
+            return p.device
+    return None
+
+
+class Session(threading.Thread):
+    """
+    Acquire from one unit, reconnecting whenever it disappears.
+
+    serial_number identifies the unit and config is a
+    dataq.manager.AcquisitionConfig. locate is a function of serial_number
+    returning the unit's current port or None (default: find_port.) The
+    port is looked for every retry_interval seconds while the unit is
+    missing. Iterate blocks() for TimedBlocks and Gap markers, and call
+    stop() when done. 'framing' is the dataq.framing.FrameValidator the
+    stream passes through, with the dropped_bytes and resync_events counts,
+    and 'metrics' a dataq.metrics.Metrics with the reader's and the decode
+    and sink stages' measurements, both kept across reconnects.
+    """
+
+    def __init__(self, serial_number, model, config, locate=None, retry_interval=0.05,
+                 queue_size=256):
+        super().__init__(daemon=True)
+        self.serial_number = serial_number
+        self.model = model
+        self.config = config
+        self.locate = locate or find_port
+        self.retry_interval = retry_interval
+        # Checks alignment of the stream; its counters are kept across reconnects
+        self.framing = FrameValidator(models.plan_for(model, config.slist, config.dig_inputs))
+        self.scan_bytes = self.framing.scan_bytes
+        self.scan_rate = models.scan_rate(model, config.srate, config.dec or 1, config.xrate)
+        self.metrics = Metrics()
+
+        self._blocks = queue.Queue(queue_size)
+        self._stopping = threading.Event()
+
+        # Exception other than a disconnect that ended the thread
+        self.error = None
+        self.port = None
+        # Counters
+        self.reconnects = 0
+        self.overrun_blocks = 0
+        self.gap_seconds = 0.0
+        self.last_recovery = None
+
+    def run(self):
+        decode = models.decoder_for(self.model, self.config.slist, self.config.decimation_factor,
+                                    self.config.dig_inputs)
+        dropped = None
+        last_data = time.time()
+        try:
+            while not self._stopping.is_set():
+                self.port = self.locate(self.serial_number)
+                if self.port is None:
+                    self._stopping.wait(self.retry_interval)
+                    continue
+                try:
+                    with serial.Serial(self.port, 115200, timeout=0.1) as ser:
+                        tuned = manager.configure(ser, self.model, self.config)
+                        reader = ScanReader(ser, self.scan_bytes,
+                                            read_size=tuned.read_size if tuned else None,
+                                            metrics=self.metrics)
+                        reader.start()
+                        ser.write(manager.start_command(self.model))
+                        stamper = timestamps.BlockStamper(
+                            timestamps.for_config(self.model, self.config), reader, self.framing,
+                            self.config.decimation_factor)
+                        if dropped is not None:
+                            resumed = time.time()
+                            self._put(Gap(last_data, resumed,
+                                          int(round((resumed - last_data) * self.scan_rate))))
+                            self.gap_seconds += resumed - last_data
+                            self.last_recovery = time.monotonic() - dropped
+                            self.reconnects += 1
+                            dropped = None
+                        try:
+                            while not self._stopping.is_set():
+                                raw = reader.get(timeout=0.1)
+                                if len(raw):
+                                    last_data = time.time()
+                                    started = time.perf_counter()
+                                    raw = self.framing.feed(raw)
+                                    values = decode(raw)
+                                    block = stamper.stamp(len(raw) // self.scan_bytes, values)
+                                    decoded = time.perf_counter()
+                                    self.metrics.stage("decode", decoded - started, len(values))
+                                    if len(values):
+                                        self._put(block)
+                                        self.metrics.stage("sink", time.perf_counter() - decoded,
+                                                           len(values))
+                        finally:
+                            reader.stop()
+                        ser.write(manager.stop_command(self.model))
+                except (serial.SerialException, OSError):
+                    # The unit dropped off (or didn't echo a command, a
+                    # dataq.commands.CommandError): start over with an empty
+                    # decimation window and framing lock, and look for it again
+                    self.framing.reset()
+                    if dropped is None:
+                        dropped = time.monotonic()
+                    decode = models.decoder_for(self.model, self.config.slist,
+                                                self.config.decimation_factor,
+                                                self.config.dig_inputs)
+                    self._stopping.wait(self.retry_interval)
+        except Exception as e:
+            self.error = e
+        finally:
+            # End of stream marker
+            self._put(None)
+
+    def _put(self, item):
+        # A consumer that falls behind loses the oldest blocks, not the stream
+        while True:
+            try:
+                self._blocks.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._blocks.get_nowait()
+                    self.overrun_blocks += 1
+                    self.metrics.add("overrun_blocks")
+                except queue.Empty:
+                    pass
+
+    def blocks(self, timeout=None):
+        """
+        Yield TimedBlocks and Gap markers until the session stops.
+
+        An exception that ended the session is re-raised here. If timeout is
+        given and nothing arrives within it, the generator returns.
+        """
+        while True:
+            try:
+                item = self._blocks.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if item is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+    def stop(self):
+        """Stop acquiring and wait for the thread to finish."""
+        self._stopping.set()
+        if self.is_alive():
+            self.join()
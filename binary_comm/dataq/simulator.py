@@ -0,0 +1,350 @@
+"""
+Pseudo-terminal instrument simulator for the binary protocols.
+
+Simulator opens a Linux pty and answers on it the way an instrument does, so
+the example programs, decoders and tools can be run and stress-tested without
+hardware. Open Simulator.port (the pty's slave side) like any serial port.
+
+Commands understood:
+    DI-2008, DI-2108 family, DI-1100, DI-1110:
+        stop, start, ps, slist, dec, srate, encode, reset, info
+    DI-245:
+        chn, xrate, dchn, S1, S0, stop, info
+
+While scanning, the simulator streams correctly formatted binary scans at
+the configured rate (see dataq.models.scan_rate), multiplied by
+'rate_multiplier' to exceed the real instruments' top rates. Scans carry the
+DI-245 sync bits (bit 0 of every byte is 1, except the first byte of each
+scan), the DI-1100 digital input states in the two LSBs of the first slist
+position, and TC open/CJC error sentinels where requested. Bytes can be
+dropped at random with 'loss_probability' to exercise resync logic.
+
+Waveforms are functions of time in seconds returning a fraction of full
+scale in [-1, 1); see sine(), ramp(), constant() and noise().
+"""
+
+import os
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+
+from . import models
+
+
+def sine(frequency, amplitude=0.5, offset=0.0):
+    """Return a sine waveform of 'frequency' Hz."""
+    return lambda t: offset + amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+def ramp(period, amplitude=1.0):
+    """Return a sawtooth from -amplitude to +amplitude every 'period' seconds."""
+    return lambda t: amplitude * (2 * ((t / period) % 1.0) - 1)
+
+
+def constant(value):
+    """Return a constant waveform."""
+    return lambda t: np.full(np.shape(t), float(value))
+
+
+def noise(amplitude=0.1, seed=None):
+    """Return uniformly distributed noise of +/- amplitude."""
+    generator = np.random.default_rng(seed)
+    return lambda t: generator.uniform(-amplitude, amplitude, np.shape(t))
+
+
+class Simulator(threading.Thread):
+    """
+    Simulate one instrument on a pseudo-terminal.
+
+    model is a name from dataq.models.MODELS. waveforms maps slist positions
+    to waveform functions (positions without one get a sine of 1 + position
+    Hz, except counter positions, which count at counter_rate Hz since the
+    last 'reset'.) dig_in is a function of time returning digital input states.
+    tc_faults maps slist positions to "open" or "cjc" to send TC error
+    sentinels in place of readings. loss_probability is the chance that a
+    scan loses one byte. buffer_limit is the number of bytes held while the
+    host isn't reading; beyond it whole scans are discarded, as in the
+    instrument's FIFO, and counted in 'overflow_bytes'.
+    """
+
+    def __init__(self, model="DI-2008", serial_number="00000001", waveforms=None,
+                 dig_in=None, tc_faults=None, loss_probability=0.0,
+                 counter_rate=100, rate_multiplier=1.0, buffer_limit=1 << 20, seed=None):
+        super().__init__(daemon=True)
+        if model not in models.MODELS:
+            raise ValueError("unsupported model: " + str(model))
+        self.model = model
+        self.serial_number = serial_number
+        self.waveforms = dict(waveforms or {})
+        self.dig_in = dig_in or (lambda t: (t * 2).astype(np.int64) & 0x7f)
+        self.tc_faults = dict(tc_faults or {})
+        self.counter_rate = counter_rate
+        self.loss_probability = loss_probability
+        self.rate_multiplier = rate_multiplier
+        self.buffer_limit = buffer_limit
+        self._random = np.random.default_rng(seed)
+
+        # Instrument settings, as configured by commands
+        self.slist = {}
+        self.srate = 1000 if model != "DI-2008" else 4
+        self.dec = 1
+        self.xrate = (4451, 20)
+        self.ps = 0
+        self.dig_inputs = False
+        self.scanning = False
+        # Stream times (seconds since start) of the next scan and the last counter reset
+        self._stream_time = 0.0
+        self._counter_zero = 0.0
+
+        # Counters
+        self.scans_sent = 0
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self.overflow_bytes = 0
+
+        self._master, slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        # Keep the slave side open so the pty survives the host closing it
+        self._slave = slave
+        os.set_blocking(self._master, False)
+        self._commands = b""
+        self._pending = bytearray()
+        # Bytes of the stream queued since the last scan boundary
+        self._scan_offset = 0
+        self._stopping = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the simulator and close the pty."""
+        self._stopping.set()
+        if self.is_alive():
+            self.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def scan_list(self):
+        """Return the configured slist in position order."""
+        return [self.slist[position] for position in sorted(self.slist)]
+
+    def scan_rate(self):
+        """Return the simulated scan rate in Hz."""
+        return self.rate_multiplier * models.scan_rate(
+            self.model, srate=self.srate, dec=self.dec, xrate=self.xrate)
+
+    def packet_size(self):
+        """Return the number of bytes per USB packet set by 'ps'."""
+        if self.model == "DI-245":
+            return 1
+        return 16 << self.ps
+
+    def run(self):
+        next_scan = 0
+        started = 0.0
+        while not self._stopping.is_set():
+            wait = [self._master] if self._pending else []
+            readable, writable, _ = select.select([self._master], wait, [], 0.001)
+            if readable:
+                was_scanning = self.scanning
+                self._read_commands()
+                if self.scanning and not was_scanning:
+                    started = time.monotonic()
+                    next_scan = 0
+                    self._counter_zero = 0.0
+            if self.scanning:
+                # Scans due since the start of the run, capped at 50 ms worth
+                due = int((time.monotonic() - started) * self.scan_rate()) - next_scan
+                due = min(due, max(1, int(self.scan_rate() * 0.05)))
+                if due > 0:
+                    t = (next_scan + np.arange(due)) / self.scan_rate()
+                    self._queue(self.encode(t))
+                    next_scan += due
+                    self.scans_sent += due
+                    self._stream_time = next_scan / self.scan_rate()
+            if self._pending:
+                self._write()
+
+    def _read_commands(self):
+        try:
+            self._commands += os.read(self._master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        while b"\r" in self._commands:
+            line, self._commands = self._commands.split(b"\r", 1)
+            self.handle(line.decode(errors="replace").strip("\n\x00 "))
+
+    def handle(self, command):
+        """Apply one command line and send its echo."""
+        words = command.split()
+        if not words:
+            return
+        name, args = words[0], words[1:]
+        response = command
+        if name in ("start", "S1"):
+            self._pending.clear()
+            self._scan_offset = 0
+            self.scanning = True
+            # No echo once the binary stream has started
+            return
+        if name in ("stop", "S0"):
+            # Data still queued is released, followed by the echo
+            self.scanning = False
+        elif name in ("slist", "chn") and len(args) == 2:
+            # Writing position 0 begins a new scan list, so a shorter slist
+            # doesn't keep positions from an older, longer one
+            if int(args[0]) == 0:
+                self.slist = {}
+            self.slist[int(args[0])] = int(args[1])
+        elif name == "srate" and args:
+            self.srate = int(args[0])
+        elif name == "dec" and args:
+            self.dec = int(args[0])
+        elif name == "ps" and args:
+            self.ps = int(args[0])
+        elif name == "xrate" and len(args) == 2:
+            self.xrate = (int(args[0]), int(args[1]))
+        elif name == "reset":
+            self._counter_zero = self._stream_time
+        elif name == "dchn" and args:
+            self.dig_inputs = args[0] != "0"
+        elif name == "info" and args:
+            if args[0] == "1":
+                response = command + " " + self.model[3:].rstrip("B")
+            elif args[0] == "6":
+                response = command + " " + self.serial_number
+            else:
+                response = command + " DATAQ"
+        if not self.scanning:
+            self._pending += (response + "\r").encode()
+            self._write()
+
+    def encode(self, t):
+        """Return the binary stream for scans at times t (seconds.)"""
+        slist = self.scan_list()
+        if not slist:
+            return b""
+        values = np.empty((len(t), len(slist)))
+        for position in range(len(slist)):
+            waveform = self.waveforms.get(position, sine(1 + position))
+            values[:, position] = waveform(t)
+        values = np.clip(values, -1, 1)
+        if self.model == "DI-245":
+            raw = self._encode_di_245(slist, values, t)
+        else:
+            raw = self._encode_cdc(slist, values, t)
+        return self._lose_bytes(raw, len(t))
+
+    def _encode_cdc(self, slist, values, t):
+        counts = np.clip(np.round(values * 32768), -32768, 32767).astype("<i2")
+        states = np.asarray(self.dig_in(t), dtype=np.int64)
+        for position, item in enumerate(slist):
+            function = item & 0xf
+            if function == 8:
+                # Digital input states in the seven LSBs of the second byte
+                counts[:, position] = ((states & 0x7f) << 8).astype(np.uint16).view(np.int16)
+            elif function > 9 and position not in self.waveforms:
+                # Counter: counts + 32768 is the count since the last reset
+                count = ((t - self._counter_zero) * self.counter_rate).astype(np.int64)
+                counts[:, position] = (count % 65536 - 32768).astype(np.int16)
+            elif self.model == "DI-2008" and function < 8 and item & 0x1000:
+                fault = self.tc_faults.get(position)
+                if fault == "open":
+                    counts[:, position] = -32768
+                elif fault == "cjc":
+                    counts[:, position] = 32767
+        if self.model == "DI-1100":
+            # Digital inputs ride in the two LSBs of the first slist position
+            counts[:, 0] = (counts[:, 0] & ~0x3) | (states & 0x3)
+        return counts.tobytes()
+
+    def _encode_di_245(self, slist, values, t):
+        counts = np.clip(np.round(values * 8192), -8192, 8191).astype(np.int16)
+        for position, item in enumerate(slist):
+            fault = self.tc_faults.get(position)
+            if item & 0x1000 and fault == "open":
+                counts[:, position] = -8192
+            elif item & 0x1000 and fault == "cjc":
+                counts[:, position] = 8191
+        ls_7 = (counts & 0x7f).astype(np.uint8)
+        ms_7 = ((counts >> 7) & 0x7f).astype(np.uint8)
+        # Sync bit in bit 0 of each byte; the MS byte's sign bit is inverted
+        low = (ls_7 << 1) | 1
+        high = ((ms_7 << 1) | 1) ^ 0x80
+        words = [low, high]
+        if self.dig_inputs:
+            states = np.asarray(self.dig_in(t), dtype=np.int64)
+            # D0 in bit 7 of the low byte, D1 in bit 1 of the high byte
+            low = np.column_stack((low, ((states & 0x1) << 7 | 1).astype(np.uint8)))
+            high = np.column_stack((high, ((states & 0x2) | 1).astype(np.uint8)))
+            words = [low, high]
+        # The first byte of each scan has its sync bit cleared
+        words[0][:, 0] &= 0xfe
+        return np.stack(words, axis=-1).tobytes()
+
+    def _lose_bytes(self, raw, scans):
+        if not self.loss_probability or not raw:
+            return raw
+        width = len(raw) // scans
+        lost = np.flatnonzero(self._random.random(scans) < self.loss_probability)
+        if not len(lost):
+            return raw
+        self.bytes_dropped += len(lost)
+        offsets = lost * width + self._random.integers(0, width, len(lost))
+        return np.delete(np.frombuffer(raw, dtype=np.uint8), offsets).tobytes()
+
+    def _queue(self, raw):
+        scan_bytes = models.scan_bytes(self.model, self.scan_list(), self.dig_inputs)
+        room = self.buffer_limit - len(self._pending)
+        keep = len(raw)
+        if keep > room:
+            # Instrument FIFO overflow: the newest whole scans are lost, so
+            # what is kept ends on a scan boundary of the stream
+            keep = max(room - (self._scan_offset + room) % scan_bytes, 0)
+            self.overflow_bytes += len(raw) - keep
+        self._scan_offset = (self._scan_offset + keep) % scan_bytes
+        self._pending += raw[:keep]
+
+    def _write(self):
+        # Only whole packets are released while scanning
+        size = len(self._pending)
+        if self.scanning:
+            size -= size % self.packet_size()
+        if not size:
+            return
+        try:
+            written = os.write(self._master, self._pending[:size])
+        except (BlockingIOError, OSError):
+            return
+        del self._pending[:written]
+        self.bytes_sent += written
+
+
+if __name__ == "__main__":
+    # Serve one simulated instrument until interrupted, e.g. from binary_comm:
+    #   python -m dataq.simulator DI-2008 --rate-multiplier 10
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate a DATAQ Instruments device on a pty")
+    parser.add_argument("model", choices=models.MODELS)
+    parser.add_argument("--rate-multiplier", type=float, default=1.0)
+    parser.add_argument("--loss-probability", type=float, default=0.0)
+    arguments = parser.parse_args()
+
+    with Simulator(arguments.model, rate_multiplier=arguments.rate_multiplier,
+                   loss_probability=arguments.loss_probability) as simulator:
+        print("Simulating a", arguments.model, "on", simulator.port)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,63 @@
+"""
+Block decoder for the DI-2108 family used by DataqStarterKit.py:
+models DI-1120, -2108, -4108, -4208 and -4718B.
+
+These models send two little-endian bytes for each slist position, in slist
+order, for every scan, with the same analog, digital input, rate and counter
+channel encoding as the DI-2008 (without thermocouple channels.) Only the
+analog measurement ranges differ between models.
+
+Any specific instrument's protocol document can be downloaded from the
+instrument's product page: Once there, click the DETAILS tab.
+"""
+
+import functools
+
+from . import scan_plan
+
+"""
+Analog measurement ranges per model. The first item is the lowest gain code
+(e.g. ±100 V range = gain code 0 for the DI-4208.) Some models do not support
+programmable gain, so their tuples contain only one value.
+"""
+model_analog_ranges = {
+    "DI-1120": (100,50,20,10,5,2),
+    "DI-4208": (100,50,20,10,5,2),
+    "DI-4108": (10,5,2,1,0.5,0.2),
+    # Fixed ±10 V measurement range
+    "DI-2108": (10,),
+    # Fixed ±5 V measurement range
+    "DI-4718B": (5,),
+}
+
+"""
+Ordered list of rate measurement ranges supported by the hardware.
+The first item in the list is the lowest gain code (e.g. 50 kHz range = gain code 1).
+"""
+rate_ranges = tuple((50000,20000,10000,5000,2000,1000,500,200,100,50,20,10))
+
+
+# Analog values are shown with more digits than the default format
+FORMATS = ("{: 3.5f}",) + scan_plan.FORMATS[1:]
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(slist, model):
+    kinds, ranges, tc_type = scan_plan.slist_kinds(slist, model_analog_ranges[model], rate_ranges)
+    return scan_plan.build(model, slist, kinds, ranges, tc_type, formats=FORMATS)
+
+
+def compile_plan(slist, model="DI-2108"):
+    """Compile slist for one of the models into a dataq.scan_plan.ScanPlan (cached.)"""
+    return _compile(tuple(slist), model)
+
+
+def decode_block(raw, slist, model="DI-2108"):
+    """
+    Decode the bytes for a number of whole scans into engineering units.
+
+    Returns a float64 array shaped (scans, len(slist)) holding volts, Hz,
+    digital input states or counts per slist position. A trailing partial
+    scan is ignored.
+    """
+    return compile_plan(slist, model).decode(raw)
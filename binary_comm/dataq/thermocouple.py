@@ -0,0 +1,203 @@
+"""
+Thermocouple conversion by table lookup.
+
+A TC reading is converted to temperature by indexing a precomputed table
+with its ADC counts: one table per TC type and instrument resolution, with
+an entry for every possible count (65536 for the 16-bit DI-2008, 16384 for
+the 14-bit DI-245.) A table costs one memory lookup per sample whatever
+curve it was built from, so accuracy no longer trades against throughput.
+Tables are built once and cached.
+
+Two kinds of table are built:
+
+- linear_table(): the instrument's own linearization, temperature =
+  m * counts + b with the protocol's per-type m and b constants, used for
+  channels in TC mode. TC error sentinels become +inf (CJC error) and -inf
+  (open TC.)
+- nist_table(): for a thermocouple wired to a millivolt voltage range. Each
+  count's EMF plus the EMF of the cold junction temperature is converted to
+  temperature through the NIST ITS-90 reference function of the TC type,
+  inverted numerically. Counts outside the type's temperature range are NaN.
+
+The NIST reference functions are the ITS-90 polynomials (and, for type K,
+the exponential term) from NIST Monograph 175, giving EMF in mV for a
+temperature in degrees C.
+"""
+
+import functools
+
+import numpy as np
+
+"""
+ITS-90 reference functions by TC type: a list of (upper limit in degC,
+coefficients c0, c1, ...) per temperature subrange, in ascending order. The
+lower limit of each type is in TEMPERATURE_RANGES.
+"""
+NIST_COEFFICIENTS = {
+    "B": [
+        (630.615, (0.0, -0.246508183460e-03, 0.590404211710e-05, -0.132579316360e-08,
+                   0.156682919010e-11, -0.169445292400e-14, 0.629903470940e-18)),
+        (1820.0, (-0.389381686210e+01, 0.285717474700e-01, -0.848851047850e-04,
+                  0.157852801640e-06, -0.168353448640e-09, 0.111097940130e-12,
+                  -0.445154310330e-16, 0.989756408210e-20, -0.937913302890e-24)),
+    ],
+    "E": [
+        (0.0, (0.0, 0.586655087080e-01, 0.454109771240e-04, -0.779980486860e-06,
+               -0.258001608430e-07, -0.594525830570e-09, -0.932140586670e-11,
+               -0.102876055340e-12, -0.803701236210e-15, -0.439794973910e-17,
+               -0.164147763550e-19, -0.396736195160e-22, -0.558273287210e-25,
+               -0.346578420130e-28)),
+        (1000.0, (0.0, 0.586655087100e-01, 0.450322755820e-04, 0.289084072120e-07,
+                  -0.330568966520e-09, 0.650244032700e-12, -0.191974955040e-15,
+                  -0.125366004970e-17, 0.214892175690e-20, -0.143880417820e-23,
+                  0.359608994810e-27)),
+    ],
+    "J": [
+        (760.0, (0.0, 0.503811878150e-01, 0.304758369300e-04, -0.856810657200e-07,
+                 0.132281952950e-09, -0.170529583370e-12, 0.209480906970e-15,
+                 -0.125383953360e-18, 0.156317256970e-22)),
+        (1200.0, (0.296456256810e+03, -0.149761277860e+01, 0.317871039240e-02,
+                  -0.318476867010e-05, 0.157208190040e-08, -0.306913690560e-12)),
+    ],
+    "K": [
+        (0.0, (0.0, 0.394501280250e-01, 0.236223735980e-04, -0.328589067840e-06,
+               -0.499048287770e-08, -0.675090591730e-10, -0.574103274280e-12,
+               -0.310888728940e-14, -0.104516093650e-16, -0.198892668780e-19,
+               -0.163226974860e-22)),
+        (1372.0, (-0.176004136860e-01, 0.389212049750e-01, 0.185587700320e-04,
+                  -0.994575928740e-07, 0.318409457190e-09, -0.560728448890e-12,
+                  0.560750590590e-15, -0.320207200030e-18, 0.971511471520e-22,
+                  -0.121047212750e-25)),
+    ],
+    "N": [
+        (0.0, (0.0, 0.261591059620e-01, 0.109574842280e-04, -0.938411115540e-07,
+               -0.464120397590e-10, -0.263033577160e-11, -0.226534380030e-13,
+               -0.760893007910e-16, -0.934196678350e-19)),
+        (1300.0, (0.0, 0.259293946010e-01, 0.157101418800e-04, 0.438256272370e-07,
+                  -0.252611697940e-09, 0.643118193390e-12, -0.100634715190e-14,
+                  0.997453389920e-18, -0.608632456070e-21, 0.208492293390e-24,
+                  -0.306821961510e-28)),
+    ],
+    "R": [
+        (1064.18, (0.0, 0.528961729765e-02, 0.139166589782e-04, -0.238855693017e-07,
+                   0.356916001063e-10, -0.462347666298e-13, 0.500777441034e-16,
+                   -0.373105886191e-19, 0.157716482367e-22, -0.281038625251e-26)),
+        (1664.5, (0.295157925316e+01, -0.252061251332e-02, 0.159564501865e-04,
+                  -0.764085947576e-08, 0.205305291024e-11, -0.293359668173e-15)),
+        (1768.1, (0.152232118209e+03, -0.268819888545e+00, 0.171280280471e-03,
+                  -0.345895706453e-07, -0.934633971046e-14)),
+    ],
+    "S": [
+        (1064.18, (0.0, 0.540313308631e-02, 0.125934289740e-04, -0.232477968689e-07,
+                   0.322028823036e-10, -0.331465196389e-13, 0.255744251786e-16,
+                   -0.125068871393e-19, 0.271443176145e-23)),
+        (1664.5, (0.132900444085e+01, 0.334509311344e-02, 0.654805192818e-05,
+                  -0.164856259209e-08, 0.129989605174e-13)),
+        (1768.1, (0.146628232636e+03, -0.258430516752e+00, 0.163693574641e-03,
+                  -0.330439046987e-07, -0.943223690612e-14)),
+    ],
+    "T": [
+        (0.0, (0.0, 0.387481063640e-01, 0.441944343470e-04, 0.118443231050e-06,
+               0.200329735540e-07, 0.901380195590e-09, 0.226511565930e-10,
+               0.360711542050e-12, 0.384939398830e-14, 0.282135219250e-16,
+               0.142515947790e-18, 0.487686622860e-21, 0.107955392700e-23,
+               0.139450270620e-26, 0.797951539270e-30)),
+        (400.0, (0.0, 0.387481063640e-01, 0.332922278800e-04, 0.206182434040e-06,
+                 -0.218822568460e-08, 0.109968809280e-10, -0.308157587720e-13,
+                 0.454791352900e-16, -0.275129016730e-19)),
+    ],
+}
+
+# Type K adds a0 * exp(a1 * (t - a2)^2) above 0 degC
+_K_EXPONENTIAL = (0.118597600000e+00, -0.118343200000e-03, 0.126968600000e+03)
+
+"""
+Temperature range of each type's reference function in degC. Type B starts
+at 50 degC rather than 0: its EMF is not monotonic (and below 3 uV) under
+about 40 degC, so lower temperatures can't be told apart by EMF.
+"""
+TEMPERATURE_RANGES = {
+    "B": (50.0, 1820.0),
+    "E": (-270.0, 1000.0),
+    "J": (-210.0, 1200.0),
+    "K": (-270.0, 1372.0),
+    "N": (-270.0, 1300.0),
+    "R": (-50.0, 1768.1),
+    "S": (-50.0, 1768.1),
+    "T": (-270.0, 400.0),
+}
+
+# Step in degC of the grid the reference functions are inverted on
+_GRID_STEP = 0.01
+
+
+def emf(tc_type, temperature):
+    """Return the thermoelectric voltage in mV of a TC type at temperatures in degC."""
+    t = np.asarray(temperature, dtype=np.float64)
+    result = np.zeros_like(t)
+    lower = -np.inf
+    for upper, coefficients in NIST_COEFFICIENTS[tc_type]:
+        # Each subrange includes its upper limit
+        inside = (t > lower) & (t <= upper)
+        result[inside] = np.polynomial.polynomial.polyval(t[inside], coefficients)
+        lower = upper
+    if tc_type == "K":
+        a0, a1, a2 = _K_EXPONENTIAL
+        positive = t > 0
+        result[positive] += a0 * np.exp(a1 * (t[positive] - a2) ** 2)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _inverse_grid(tc_type):
+    low, high = TEMPERATURE_RANGES[tc_type]
+    temperatures = np.linspace(low, high, int(round((high - low) / _GRID_STEP)) + 1)
+    return emf(tc_type, temperatures), temperatures
+
+
+def temperature(tc_type, millivolts):
+    """
+    Return the temperature in degC for thermoelectric voltages in mV
+    (referred to 0 degC), or NaN outside the type's range.
+    """
+    emfs, temperatures = _inverse_grid(tc_type)
+    millivolts = np.asarray(millivolts, dtype=np.float64)
+    result = np.interp(millivolts, emfs, temperatures)
+    return np.where((millivolts < emfs[0]) | (millivolts > emfs[-1]), np.nan, result)
+
+
+def _counts(size):
+    # Every count of a signed ADC with size codes, in table order
+    return np.arange(-(size // 2), size // 2, dtype=np.float64)
+
+
+@functools.lru_cache(maxsize=None)
+def linear_table(m, b, size, tc_cjc=None, tc_open=None):
+    """
+    Return the table of m * counts + b for a signed ADC with size codes,
+    indexed by counts + size // 2, with the TC error sentinels as +/-inf.
+    """
+    table = m * _counts(size) + b
+    if tc_cjc is not None:
+        table[tc_cjc + size // 2] = np.inf
+    if tc_open is not None:
+        table[tc_open + size // 2] = -np.inf
+    table.flags.writeable = False
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def nist_table(tc_type, volts_per_count, size, cjc_temperature=0.0):
+    """
+    Return the temperature table of a TC type measured on a voltage range,
+    indexed by counts + size // 2.
+
+    volts_per_count is the range's volts per ADC count (e.g. 0.1 / 32768 on
+    a 16-bit +/-100 mV range) and cjc_temperature the temperature in degC of
+    the cold junction, where the TC wires meet the instrument's terminals.
+    """
+    millivolts = _counts(size) * volts_per_count * 1000
+    table = temperature(tc_type, millivolts + emf(tc_type, cjc_temperature))
+    table.flags.writeable = False
+    return table
+
@@ -0,0 +1,195 @@
+"""
+Per-scan timestamps from the instrument's sample clock.
+
+Decoded blocks carry no time base, and calling time.time() for every scan
+costs a system call per scan and measures when the host got around to the
+data, not when it was sampled. ScanClock instead times scan i as
+
+    t0 + i * period
+
+computed for a whole block with one vectorized multiply. period starts at
+the nominal scan period of the rate settings (see dataq.models.scan_rate())
+and t0 at the start of acquisition; both are then corrected against the host
+clock from the arrival times of the reads, which dataq.reader.ScanReader
+records as 'last_arrival' for every block it hands out.
+
+A read can arrive late (USB scheduling, a busy host) but never before its
+scans were sampled, so the estimator uses the lower envelope of the arrival
+times: the earliest arrival relative to the current clock model in each
+'segment' seconds of host time. A least-squares line through the last
+'segments' envelope points gives t0 and the period actually kept by the
+instrument's oscillator, which tracks a crystal that is off by tens of ppm
+to the host clock. The cost is a comparison per block and a small fit per
+segment.
+
+Host times are taken from time.monotonic(), so the estimate is immune to
+wall clock steps, and converted to seconds since the epoch once, when the
+clock is created.
+
+BlockStamper is the timestamping stage of an acquisition loop: it feeds the
+reader's arrivals to a ScanClock and turns each decoded block into a
+TimedBlock. dataq.session.Session and the dataq.manager.DeviceManager
+workers use it, so their blocks come out timed, and
+dataq.columnar.ColumnarWriter.write() and dataq.fanout.Publisher.publish()
+take the times of a TimedBlock along with its values.
+"""
+
+import collections
+import time
+
+import numpy as np
+
+from . import models
+
+"""
+A decoded block with its timestamps: values shaped (scans, columns) and
+times holding one time per scan in seconds since the epoch. For decimated
+decoders each time is the middle of the scan's decimation window.
+"""
+TimedBlock = collections.namedtuple("TimedBlock", "values times")
+
+
+class ScanClock:
+    """
+    Assign times, in seconds since the epoch, to scans by stream index.
+
+    scan_rate is the nominal scan rate in Hz. start_time is the epoch time
+    of scan 0 until arrivals have been observed (default: now.) latency is
+    subtracted from every arrival, for a known fixed delay between sampling
+    and the read's arrival. segment and segments set the length of each
+    envelope segment in seconds and how many of the latest segments the fit
+    uses.
+    """
+
+    def __init__(self, scan_rate, start_time=None, latency=0.0, segment=1.0, segments=30):
+        self.nominal_period = 1 / scan_rate
+        self.period = self.nominal_period
+        self.latency = latency
+        self.segment = segment
+        # Add to a time.monotonic() value to get seconds since the epoch
+        self._epoch = time.time() - time.monotonic()
+        if start_time is None:
+            start_time = time.time()
+        # Monotonic time of scan 0
+        self.t0 = start_time - self._epoch
+        self._fixed = False
+
+        # (scan index, arrival) of the earliest arrival in each closed segment
+        self._envelope = collections.deque(maxlen=segments)
+        self._segment_end = None
+        self._best = None
+        self._best_residual = None
+        # Index of the next scan stamp() times
+        self.scans = 0
+        # Counters
+        self.observations = 0
+        self.fits = 0
+
+    def observe(self, scans, arrival):
+        """
+        Correct the clock for a read that arrived at time.monotonic() value
+        'arrival' with scans whole scans received since acquisition started.
+        """
+        if scans <= 0:
+            return
+        arrival -= self.latency
+        # The last whole scan was sampled no later than the arrival
+        index = scans - 1
+        residual = arrival - (self.t0 + index * self.period)
+        self.observations += 1
+        if not self._fixed or residual < 0:
+            # Earliest sighting yet: scan 0 can't have been later than this
+            self.t0 += residual
+            residual = 0.0
+            self._fixed = True
+        if self._best_residual is None or residual < self._best_residual:
+            self._best = (index, arrival)
+            self._best_residual = residual
+        if self._segment_end is None:
+            self._segment_end = arrival + self.segment
+        elif arrival >= self._segment_end:
+            self._envelope.append(self._best)
+            self._best = None
+            self._best_residual = None
+            self._segment_end = arrival + self.segment
+            self._fit()
+
+    def _fit(self):
+        # Line through the envelope points: arrival = t0 + index * period
+        if len(self._envelope) < 2:
+            return
+        points = np.array(self._envelope)
+        index = points[:, 0]
+        arrival = points[:, 1]
+        if index[-1] - index[0] < 1:
+            return
+        period, t0 = np.polyfit(index - index[0], arrival, 1)
+        self.period = period
+        self.t0 = t0 - index[0] * period
+        self.fits += 1
+
+    def times(self, first, count, step=1):
+        """
+        Return the times of count scans starting at stream index first, step
+        scans apart.
+        """
+        return self._epoch + self.t0 + (first + np.arange(count) * step) * self.period
+
+    def stamp(self, count):
+        """Return the times of the next count scans, continuing from the last call."""
+        times = self.times(self.scans, count)
+        self.scans += count
+        return times
+
+    def drift_ppm(self):
+        """Return the measured deviation of the scan period from nominal in ppm."""
+        return (self.period / self.nominal_period - 1) * 1e6
+
+
+def for_config(model, config, start_time=None, latency=0.0):
+    """
+    Return a ScanClock for a dataq.manager.AcquisitionConfig.
+
+    Stream indexes count the instrument's scans, before any software
+    decimation (config.decimation_factor.)
+    """
+    scan_rate = models.scan_rate(model, config.srate, config.dec or 1, config.xrate)
+    return ScanClock(scan_rate, start_time, latency)
+
+
+class BlockStamper:
+    """
+    Time the decoded blocks of one run of a dataq.reader.ScanReader.
+
+    clock is the run's ScanClock, reader the ScanReader and framing the
+    dataq.framing.FrameValidator the raw scans pass through before the
+    decoder; decimation_factor is the decoder's software decimation. After
+    each decode, call stamp() with the number of raw scans the decoder was
+    given and the rows it returned. Scans the reader overwrote or the
+    validator dropped are counted in the stream index, so the times stay
+    on the instrument's sample clock across losses.
+    """
+
+    def __init__(self, clock, reader, framing, decimation_factor=1):
+        self.clock = clock
+        self.reader = reader
+        self.framing = framing
+        self.decimation_factor = decimation_factor
+        # Stream position of the run's first byte, and raw scans decoded so far
+        self._base = framing.position()
+        self._fed = 0
+        self._arrival = None
+
+    def stamp(self, scans, values):
+        """Return values as a TimedBlock, after scans raw scans were decoded into it."""
+        if self.reader.last_arrival is not None and self.reader.last_arrival != self._arrival:
+            self._arrival = self.reader.last_arrival
+            self.clock.observe(*self._arrival)
+        self._fed += scans
+        factor = self.decimation_factor
+        # Stream index just past the last scan decoded, then past the last whole window
+        end = (self.framing.position() - self._base) // self.framing.scan_bytes
+        end += self.reader.overrun_scans
+        end -= self._fed % factor
+        first = end - len(values) * factor
+        return TimedBlock(values, self.clock.times(first + (factor - 1) / 2, len(values), factor))
@@ -0,0 +1,224 @@
+"""
+Triggered acquisition: keep only the scans around events.
+
+To catch transients the instrument has to run continuously at full rate,
+but recording everything to find a few events wastes disk and CPU.
+TriggeredRecorder watches decoded blocks for trigger conditions and hands
+only complete segments to a sink: pre_scans of history from before the
+trigger, kept in a ring buffer, followed by post_scans from the trigger on.
+
+Conditions are tested on whole blocks with array comparisons, never per
+scan in Python:
+
+- level(): the channel is at or above (rising) or at or below (falling) a
+  level.
+- edge(): the channel crosses a level, rising, falling or either way. The
+  last scan of the previous block is remembered, so edges between blocks
+  are found too.
+- window(): the channel leaves (exit) or is inside (enter) a band.
+
+Any one condition fires the trigger. After a segment, holdoff_scans must
+pass before the trigger is armed again, and with rearm=False it stays
+disarmed until arm() is called. Segments never overlap: the pre-trigger
+history of an event doesn't reach back into the previous segment.
+"""
+
+import collections
+
+import numpy as np
+
+# Condition kinds
+LEVEL = 0
+EDGE = 1
+WINDOW = 2
+
+"""
+A trigger condition on one decoded column. level is the level of a LEVEL or
+EDGE condition and the lower bound of a WINDOW, upper the WINDOW's upper
+bound. slope is "rising", "falling" or "either" for levels and edges, and
+"exit" or "enter" for windows.
+"""
+Condition = collections.namedtuple("Condition", "kind column level upper slope")
+
+"""
+A captured segment, passed to the sink. trigger is the stream index of the
+scan that fired the trigger, first the stream index of values[0], and
+values the decoded scans shaped (scans, columns.) condition is the index of
+the condition that fired.
+"""
+Event = collections.namedtuple("Event", "trigger first values condition")
+
+
+def level(column, value, slope="rising"):
+    """Fire while column is at or above (rising) or at or below (falling) value."""
+    if slope not in ("rising", "falling"):
+        raise ValueError("slope must be 'rising' or 'falling'")
+    return Condition(LEVEL, column, value, None, slope)
+
+
+def edge(column, value, slope="rising"):
+    """Fire where column crosses value, "rising", "falling" or "either" way."""
+    if slope not in ("rising", "falling", "either"):
+        raise ValueError("slope must be 'rising', 'falling' or 'either'")
+    return Condition(EDGE, column, value, None, slope)
+
+
+def window(column, low, high, slope="exit"):
+    """Fire while column is outside (exit) or inside (enter) low to high."""
+    if slope not in ("exit", "enter"):
+        raise ValueError("slope must be 'exit' or 'enter'")
+    return Condition(WINDOW, column, low, high, slope)
+
+
+def hits(condition, values, previous=None):
+    """
+    Return a boolean array with one entry per scan of values: True where
+    condition fires. previous is the scan before values[0], if any, for
+    edges.
+    """
+    x = values[:, condition.column]
+    if condition.kind == LEVEL:
+        return x >= condition.level if condition.slope == "rising" else x <= condition.level
+    if condition.kind == WINDOW:
+        inside = (x >= condition.level) & (x <= condition.upper)
+        return ~inside if condition.slope == "exit" else inside
+    before = np.empty_like(x)
+    before[0] = x[0] if previous is None else previous[condition.column]
+    before[1:] = x[:-1]
+    rising = (before < condition.level) & (x >= condition.level)
+    if condition.slope == "rising":
+        return rising
+    falling = (before > condition.level) & (x <= condition.level)
+    return falling if condition.slope == "falling" else rising | falling
+
+
+class TriggeredRecorder:
+    """
+    Pass only pre- and post-trigger segments of a decoded stream to a sink.
+
+    columns is the number of columns of the blocks (e.g. plan.columns) and
+    conditions a list of Conditions. sink is called with an Event for every
+    complete segment of up to pre_scans plus post_scans scans; post_scans
+    includes the trigger scan. Feed every decoded block to update(), in
+    order.
+    """
+
+    def __init__(self, columns, conditions, sink, pre_scans=1000, post_scans=1000,
+                 holdoff_scans=0, rearm=True):
+        self.columns = columns
+        self.conditions = list(conditions)
+        self.sink = sink
+        self.pre_scans = pre_scans
+        self.post_scans = post_scans
+        self.holdoff_scans = holdoff_scans
+        self.rearm = rearm
+
+        # Pre-trigger history: the latest pre_scans scans, oldest at _ring_head
+        self._ring = np.zeros((pre_scans, columns))
+        self._ring_head = 0
+        self._ring_fill = 0
+        self._previous = None
+
+        self.armed = True
+        # Stream index before which the trigger can't fire, and end of the last segment
+        self._next_allowed = 0
+        self._last_end = 0
+        # Segment being completed: (trigger, first, condition, parts, scans still needed)
+        self._capture = None
+        # Stream index of the next scan
+        self.scans = 0
+        # Counters
+        self.events = 0
+        self.scans_kept = 0
+
+    def _history(self, count):
+        # The latest count scans before the current block, oldest first
+        start = (self._ring_head + self._ring_fill - count) % max(self.pre_scans, 1)
+        first = min(count, self.pre_scans - start)
+        return np.concatenate((self._ring[start:start + first], self._ring[:count - first]))
+
+    def _remember(self, block):
+        # Keep the newest pre_scans scans of block in the ring
+        block = block[len(block) - min(len(block), self.pre_scans):]
+        end = (self._ring_head + self._ring_fill) % max(self.pre_scans, 1)
+        first = min(len(block), self.pre_scans - end)
+        self._ring[end:end + first] = block[:first]
+        self._ring[:len(block) - first] = block[first:]
+        overflow = self._ring_fill + len(block) - self.pre_scans
+        if overflow > 0:
+            self._ring_head = (self._ring_head + overflow) % self.pre_scans
+        self._ring_fill = min(self._ring_fill + len(block), self.pre_scans)
+
+    def _fired(self, block):
+        # Per scan: whether any condition fires, and the first one that does
+        fired = np.zeros(len(block), dtype=bool)
+        which = np.full(len(block), -1)
+        for index, condition in enumerate(self.conditions):
+            hit = hits(condition, block, self._previous) & ~fired
+            which[hit] = index
+            fired |= hit
+        return fired, which
+
+    def update(self, block):
+        """Check a decoded block for triggers and complete pending segments."""
+        block = np.asarray(block, dtype=np.float64)
+        if not len(block):
+            return
+        base = self.scans
+        fired = None
+        position = 0
+        while position < len(block):
+            if self._capture is not None:
+                trigger, first, condition, parts, needed = self._capture
+                take = min(needed, len(block) - position)
+                # Copies: the caller may reuse its block buffer
+                parts.append(block[position:position + take].copy())
+                position += take
+                self._capture = (trigger, first, condition, parts, needed - take)
+                if needed == take:
+                    self._emit()
+                continue
+            if not self.armed:
+                break
+            begin = max(position, self._next_allowed - base)
+            if begin >= len(block):
+                break
+            if fired is None:
+                fired, which = self._fired(block)
+            candidates = np.flatnonzero(fired[begin:])
+            if not len(candidates):
+                break
+            at = begin + int(candidates[0])
+            # Pre-trigger scans: from the ring, then from this block
+            first = max(base + at - self.pre_scans, self._last_end, 0)
+            parts = []
+            if first < base:
+                parts.append(self._history(base - first))
+            parts.append(block[max(first - base, 0):at].copy())
+            self._capture = (base + at, first, int(which[at]), parts, self.post_scans)
+            position = at
+
+        self._remember(block)
+        self._previous = block[-1].copy()
+        self.scans += len(block)
+
+    def _emit(self):
+        trigger, first, condition, parts, _ = self._capture
+        self._capture = None
+        values = np.concatenate(parts)
+        self.events += 1
+        self.scans_kept += len(values)
+        self._last_end = first + len(values)
+        self._next_allowed = self._last_end + self.holdoff_scans
+        self.armed = self.rearm
+        self.sink(Event(trigger, first, values, condition))
+
+    def arm(self):
+        """Arm the trigger again after a segment with rearm=False."""
+        self._next_allowed = max(self._next_allowed, self.scans)
+        self.armed = True
+
+    def flush(self):
+        """Pass a segment still waiting for post-trigger scans to the sink, short."""
+        if self._capture is not None:
+            self._emit()
@@ -0,0 +1,101 @@
+"""
+Choose the protocol packet size ('ps') and host read size for a latency
+budget and a throughput target.
+
+A CDC-mode instrument only sends whole packets of 16 << ps bytes, so each
+scan waits on the device until its packet fills. The example programs use
+'ps 0' (16 bytes) for responsiveness, which at high scan rates means
+thousands of USB packets and read calls per second. choose() picks the
+largest packet that still fills within the latency budget, so bulk logging
+gets few large transfers and a control loop gets small, prompt ones, and a
+host read size aligned to whole scans to match. The delivery latency that
+results is measured by dataq.reader.ScanReader (see its stats().)
+
+The DI-245 has no 'ps' command and is not supported.
+"""
+
+import collections
+
+from . import models
+
+# Valid 'ps' arguments and their packet sizes in bytes
+PACKET_SIZES = tuple(16 << ps for ps in range(8))
+
+"""
+Packets per second above which per-packet and per-read overhead on the host
+starts to cost a meaningful share of a CPU core.
+"""
+MAX_PACKETS_PER_S = 1000
+
+"""
+Share of the latency budget a packet may take to fill on the device; the
+rest is left for USB transfer, the host read and the consumer.
+"""
+DEVICE_SHARE = 0.5
+
+"""
+ps: the protocol packet size argument, and packet_bytes its size in bytes.
+read_size: bytes per host read, a whole number of scans.
+packet_interval: seconds to fill one packet at the scan rate.
+expected_latency: packet_interval plus the time to fill one host read,
+    the worst-case wait from a scan's sampling to its delivery.
+meets_latency: False if expected_latency exceeds the budget, which happens
+    when even the smallest packet can't fill in time.
+"""
+Tuning = collections.namedtuple(
+    "Tuning", "ps packet_bytes read_size packet_interval expected_latency meets_latency")
+
+
+def choose(scan_rate, scan_bytes, latency_budget, throughput=None,
+           max_packets_per_s=MAX_PACKETS_PER_S):
+    """
+    Return a Tuning for a scan rate (Hz) and scan size (bytes).
+
+    latency_budget is the longest acceptable time in seconds from a scan
+    being sampled to its delivery to the consumer. If no packet size can
+    meet it, the smallest packet that keeps the throughput target (scans
+    per second the host must sustain, default: scan_rate) under
+    max_packets_per_s is chosen instead.
+    """
+    fill_rate = scan_rate * scan_bytes
+    # Largest packet that fills within the device's share of the budget
+    ps = None
+    for candidate, size in enumerate(PACKET_SIZES):
+        if size / fill_rate <= latency_budget * DEVICE_SHARE:
+            ps = candidate
+    if ps is None:
+        # The budget can't be met; use the smallest packet the throughput target allows
+        byte_rate = (throughput or scan_rate) * scan_bytes
+        ps = 0
+        while ps < len(PACKET_SIZES) - 1 and byte_rate / PACKET_SIZES[ps] > max_packets_per_s:
+            ps += 1
+
+    packet_bytes = PACKET_SIZES[ps]
+    packet_interval = packet_bytes / fill_rate
+    # Host reads take half of the rest of the budget, leaving the other half
+    # for the consumer, in whole scans and at least one packet
+    read_scans = int(scan_rate * max(latency_budget - packet_interval, 0) / 2)
+    read_size = max(read_scans * scan_bytes, -(-packet_bytes // scan_bytes) * scan_bytes)
+    expected_latency = packet_interval + read_size / fill_rate
+    return Tuning(ps, packet_bytes, read_size, packet_interval, expected_latency,
+                  expected_latency <= latency_budget)
+
+
+def for_config(model, config):
+    """
+    Return the Tuning for a dataq.manager.AcquisitionConfig.
+
+    If config.latency_budget is None, the configured ps is kept and the read
+    size is dataq.reader.ScanReader's default.
+    """
+    if model == "DI-245":
+        raise ValueError("the DI-245 has no packet size setting")
+    scan_bytes = models.scan_bytes(model, config.slist)
+    scan_rate = models.scan_rate(model, config.srate, config.dec or 1)
+    if config.latency_budget is None:
+        packet_bytes = PACKET_SIZES[config.ps]
+        packet_interval = packet_bytes / (scan_rate * scan_bytes)
+        read_size = 64 * scan_bytes
+        return Tuning(config.ps, packet_bytes, read_size, packet_interval,
+                      packet_interval + read_size / (scan_rate * scan_bytes), True)
+    return choose(scan_rate, scan_bytes, config.latency_budget, config.throughput)
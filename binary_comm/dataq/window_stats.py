@@ -0,0 +1,241 @@
+"""
+Streaming per-channel statistics over fixed time windows.
+
+For long soak tests the numbers that get reported are each channel's mean,
+minimum, maximum, standard deviation and a few percentiles per second,
+minute or hour, not every reading. WindowStats keeps those up to date one
+decoded block at a time and emits a Summary each time a window closes, so
+only the summaries need to be stored.
+
+Every block is folded into the running statistics with whole-array NumPy
+operations: its count, mean and sum of squared deviations per column are
+merged into the window's running values with the parallel form of
+Welford's algorithm (Chan et al.), which stays accurate over millions of
+scans. Percentiles come from a QuantileSketch, a histogram with
+logarithmically spaced bins that answers any quantile to within a fixed
+relative error using a fixed amount of memory.
+
+Windows are counted in scans at the nominal scan rate and nest: each
+longer window must be a whole number of the next shorter one, and is built
+by merging that window's statistics as it closes, not from the raw scans
+again. So adding a 1 h window to a 1 s one costs almost nothing.
+
+Readings that aren't finite, such as TC error sentinels (+/-inf), are left
+out of the statistics; 'count' in a Summary is the number of readings used
+per channel.
+"""
+
+import collections
+
+import numpy as np
+
+"""
+Statistics of one window. window is its length in seconds, first the stream
+index of its first scan (dataq.timestamps.ScanClock.times() turns it into a
+time) and scans the number of scans it covered, fewer than a full window
+for one emitted by flush(). count, mean, std, minimum and maximum hold one
+value per channel (NaN where a channel had no finite readings), and
+quantiles one row per requested quantile.
+"""
+Summary = collections.namedtuple("Summary", "window first scans count mean std minimum maximum quantiles")
+
+
+class QuantileSketch:
+    """
+    Mergeable, fixed-size quantile estimates for a number of columns.
+
+    Each value is counted in a bin covering magnitudes from g^(i-1) to g^i,
+    with g = (1 + relative_accuracy) / (1 - relative_accuracy), separately
+    for positive and negative values. Magnitudes below min_value count as
+    zero and above max_value as max_value. A quantile is reported as the
+    midpoint of its bin, within relative_accuracy of the true value.
+    """
+
+    def __init__(self, columns, relative_accuracy=0.01, min_value=1e-9, max_value=1e9):
+        self.columns = columns
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.min_value = min_value
+        self._log_gamma = np.log(self.gamma)
+        self._offset = int(np.floor(np.log(min_value) / self._log_gamma))
+        self._magnitudes = int(np.ceil(np.log(max_value) / self._log_gamma)) - self._offset + 1
+        # Bins per column: negative magnitudes (largest first), zero, positive
+        self.bins = 2 * self._magnitudes + 1
+        self.counts = np.zeros((columns, self.bins), dtype=np.int64)
+
+        # Representative value of each bin, in bin order
+        upper = self.gamma ** (np.arange(self._magnitudes) + self._offset)
+        middle = 2 * upper / (self.gamma + 1)
+        self._values = np.concatenate((-middle[::-1], [0.0], middle))
+
+    def add(self, values):
+        """Count a block of values shaped (scans, columns); NaNs are ignored."""
+        values = np.asarray(values, dtype=np.float64)
+        if np.isnan(values).any():
+            finite = ~np.isnan(values)
+            column = np.nonzero(finite)[1]
+            values = values[finite]
+        else:
+            column = np.broadcast_to(np.arange(self.columns), values.shape).ravel()
+            values = values.ravel()
+        magnitude = np.abs(values)
+        index = np.zeros(len(magnitude), dtype=np.int64)
+        nonzero = magnitude >= self.min_value
+        with np.errstate(divide="ignore"):
+            logs = np.log(magnitude)
+        index[nonzero] = np.minimum(
+            np.ceil(logs[nonzero] / self._log_gamma).astype(np.int64) - self._offset,
+            self._magnitudes - 1) + 1
+        signed = np.where(values < 0, -index, index) + self._magnitudes
+        self.counts += np.bincount(column * self.bins + signed,
+                                   minlength=self.columns * self.bins).reshape(self.columns, self.bins)
+
+    def merge(self, other):
+        """Add the counts of another sketch with the same settings."""
+        self.counts += other.counts
+
+    def quantiles(self, qs):
+        """Return the quantiles qs (0 to 1) of every column, shaped (len(qs), columns)."""
+        cumulative = np.cumsum(self.counts, axis=1)
+        total = cumulative[:, -1]
+        result = np.full((len(qs), self.columns), np.nan)
+        for row, q in enumerate(qs):
+            rank = np.ceil(q * total).clip(1)
+            for column in np.flatnonzero(total):
+                result[row, column] = self._values[np.searchsorted(cumulative[column], rank[column])]
+        return result
+
+    def reset(self):
+        """Forget all values."""
+        self.counts[:] = 0
+
+
+class _Window:
+    # Running statistics of one window
+
+    def __init__(self, seconds, scans, columns, sketch):
+        self.seconds = seconds
+        self.length = scans
+        self.columns = columns
+        self.sketch = sketch
+        self.first = 0
+        self.reset(0)
+
+    def reset(self, first):
+        self.first = first
+        self.scans = 0
+        self.count = np.zeros(self.columns, dtype=np.int64)
+        self.mean = np.zeros(self.columns)
+        self.m2 = np.zeros(self.columns)
+        self.minimum = np.full(self.columns, np.inf)
+        self.maximum = np.full(self.columns, -np.inf)
+        self.sketch.reset()
+
+    def _merge(self, count, mean, m2):
+        # Chan et al. pairwise update of count, mean and squared deviations
+        total = self.count + count
+        safe = np.maximum(total, 1)
+        delta = mean - self.mean
+        self.mean += delta * count / safe
+        self.m2 += m2 + delta * delta * self.count * count / safe
+        self.count = total
+
+    def add(self, block):
+        self.scans += len(block)
+        if np.isfinite(block).all():
+            count = np.full(self.columns, len(block), dtype=np.int64)
+            mean = block.mean(axis=0)
+            m2 = ((block - mean) ** 2).sum(axis=0)
+            self.minimum = np.minimum(self.minimum, block.min(axis=0))
+            self.maximum = np.maximum(self.maximum, block.max(axis=0))
+        else:
+            block = np.where(np.isfinite(block), block, np.nan)
+            count = (~np.isnan(block)).sum(axis=0)
+            mean = np.nansum(block, axis=0) / np.maximum(count, 1)
+            m2 = np.nansum((block - mean) ** 2, axis=0)
+            self.minimum = np.fmin(self.minimum, np.nanmin(block, axis=0, initial=np.inf))
+            self.maximum = np.fmax(self.maximum, np.nanmax(block, axis=0, initial=-np.inf))
+        self._merge(count, mean, m2)
+        self.sketch.add(block)
+
+    def add_window(self, other):
+        self.scans += other.scans
+        self._merge(other.count, other.mean, other.m2)
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.sketch.merge(other.sketch)
+
+    def summary(self, qs):
+        empty = self.count == 0
+        mean = np.where(empty, np.nan, self.mean)
+        std = np.where(self.count > 1, np.sqrt(self.m2 / np.maximum(self.count - 1, 1)), np.nan)
+        return Summary(self.seconds, self.first, self.scans, self.count.copy(), mean, std,
+                       np.where(empty, np.nan, self.minimum), np.where(empty, np.nan, self.maximum),
+                       self.sketch.quantiles(qs))
+
+
+class WindowStats:
+    """
+    Per-channel statistics of decoded blocks over nested time windows.
+
+    columns is the number of channels (e.g. plan.columns) and scan_rate the
+    scan rate of the blocks in Hz. windows lists window lengths in seconds,
+    shortest first, each a whole multiple of the one before. quantiles are
+    reported for every window with the given relative_accuracy. Pass blocks
+    to update() and store the Summaries it returns; flush() ends the
+    windows in progress.
+    """
+
+    def __init__(self, columns, scan_rate, windows=(1, 60, 3600), quantiles=(0.01, 0.5, 0.99),
+                 relative_accuracy=0.01):
+        self.columns = columns
+        self.scan_rate = scan_rate
+        self.quantiles = tuple(quantiles)
+        self._windows = []
+        for seconds in windows:
+            scans = int(round(seconds * scan_rate))
+            if scans < 1:
+                raise ValueError("window of " + str(seconds) + " s is shorter than one scan")
+            if self._windows and scans % self._windows[-1].length:
+                raise ValueError("each window must be a whole multiple of the one before")
+            self._windows.append(_Window(seconds, scans, columns,
+                                         QuantileSketch(columns, relative_accuracy)))
+        # Stream index of the next scan
+        self.scans = 0
+
+    def update(self, block):
+        """Add a block of decoded scans and return the Summaries of windows that closed."""
+        block = np.asarray(block, dtype=np.float64)
+        summaries = []
+        first = self._windows[0]
+        start = 0
+        while start < len(block):
+            count = min(len(block) - start, first.length - first.scans)
+            first.add(block[start:start + count])
+            start += count
+            self.scans += count
+            if first.scans == first.length:
+                self._close(0, summaries)
+        return summaries
+
+    def _close(self, level, summaries):
+        # Report a full window, fold it into the next longer one and start over
+        window = self._windows[level]
+        summaries.append(window.summary(self.quantiles))
+        if level + 1 < len(self._windows):
+            longer = self._windows[level + 1]
+            longer.add_window(window)
+            if longer.scans == longer.length:
+                self._close(level + 1, summaries)
+        window.reset(self.scans)
+
+    def flush(self):
+        """Return Summaries of the windows in progress, shortest first, and start over."""
+        summaries = []
+        for level, window in enumerate(self._windows):
+            if level + 1 < len(self._windows):
+                self._windows[level + 1].add_window(window)
+            if window.scans:
+                summaries.append(window.summary(self.quantiles))
+            window.reset(self.scans)
+        return summaries
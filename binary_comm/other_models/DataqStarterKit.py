@@ -16,9 +16,9 @@ Such attempts will fail.
 You'll need to uncomment the appropriate 
 
 slist
-analog_ranges
+model
 
-tuples for the instrument model you will use with this program.
+values for the instrument model you will use with this program.
 Prototypes are provided for each supported model, so it's a
 simple matter of commenting the ones that don't apply, and 
 uncommenting the one that does. In its as-delivered state
@@ -34,11 +34,21 @@ product page: Once there, click the DETAILS tab.
 """
 
 
+import os
+import sys
 import serial
 import serial.tools.list_ports
 import keyboard
 import time
 
+# The shared dataq package lives in the binary_comm folder, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dataq import starter_kit, tuning
+from dataq.commands import CommandEngine
+from dataq.display import Display
+from dataq.manager import AcquisitionConfig
+from dataq.reader import ScanReader
+
 """
 Uncomment the slist tuple depending upon the hardware model you're using. 
 You can modify the example tuples to change the measurement configuration
@@ -80,34 +90,29 @@ slist for model DI-4718B (untested, but should work)
 #slist = [0x0000,0x0001]
 
 """
-Uncomment an analog_ranges tuple depending upon the hardware model you're using. 
-Note that only one can be enabled at a time. 
-The first item in the tuple is the lowest gain code (e.g. ±100 V range = gain code 0)
-for the DI-4208. Some instrument models do not support programmable gain, so 
-their tuples contain only one value (e.g. model DI-2108.)
+Uncomment a model name depending upon the hardware model you're using. 
+Note that only one can be enabled at a time. The model selects the analog
+measurement ranges, which together with the rate ranges are defined in
+dataq/starter_kit.py. Some instrument models do not support programmable
+gain, so they have only one range (e.g. model DI-2108.)
 """
-# Analog ranges for models DI-4208 and -1120
-#analog_ranges = tuple((100,50,20,10,5,2))
-
-# Analog ranges for model DI-4108
-#analog_ranges = tuple((10,5,2,1,0.5,0.2))
-
-# Analog ranges for model DI-2108 (fixed ±10 V measurement range)
-analog_ranges = [10]
-
-# Analog ranges for model DI-4718B (fixed ±5 V measurement range)
-#analog_ranges = [5]
+#model = "DI-4208"
+#model = "DI-1120"
+#model = "DI-4108"
+model = "DI-2108"
+#model = "DI-4718B"
 
 """
-Define a tuple that contains an ordered list of rate measurement ranges supported by the hardware. 
-The first item in the list is the lowest gain code (e.g. 50 kHz range = gain code 1).
+Longest time in seconds from a scan being sampled to its display. The
+packet size ('ps') and host read size are chosen for it by dataq.tuning,
+as dataq.manager.configure() does, instead of a fixed 'ps 0' that sends
+a USB packet every few scans however fast the instrument scans.
 """
-rate_ranges = tuple((50000,20000,10000,5000,2000,1000,500,200,100,50,20,10))
-
-# This is a list of analog and rate ranges to apply in slist order
-range_table = list(())
+latency_budget = 0.1
 
 ser=serial.Serial()
+# Matches command echoes to commands, with per-command timeouts instead of fixed sleeps
+engine = CommandEngine(ser)
 
 # Define flag to indicate if acquiring is active 
 acquiring = False
@@ -141,53 +146,23 @@ def discovery():
 
 # Sends a passed command string after appending <cr>
 def send_cmd(command):
-    ser.write((command+'\r').encode())
-    time.sleep(.1)
-    if not(acquiring):
-        # Echo commands if not acquiring
-        while True:
-            if(ser.inWaiting() > 0):
-                while True:
-                    try:
-                        s = ser.readline().decode()
-                        s = s.strip('\n')
-                        s = s.strip('\r')
-                        s = s.strip(chr(0))
-                        break
-                    except:
-                        continue
-                if s != "":
-                    print (s)
-                    break
+    if acquiring:
+        # The background reader owns the port, so don't wait for the echo
+        ser.write((command+'\r').encode())
+        return
+    # Echo commands if not acquiring
+    response = engine.execute([command])[0]
+    if response:
+        print (response)
 
 # Configure the instrment's scan list
 def config_scn_lst():
-    # Scan list position must start with 0 and increment sequentially
-    position = 0 
-    for item in slist:
-        send_cmd("slist "+ str(position ) + " " + str(item))
-        position += 1
-        # Update the Range table
-        if ((item) & (0xf)) < 8:
-            # This is an analog channel. Refer to the slist prototype for your instrument
-            # as defined in the instrument protocol. 
-            range_table.append(analog_ranges[item >> 8])
-
-        elif ((item) & (0xf)) == 8:
-            # This is a dig in channel. No measurement range support. 
-            # Update range_table with any value to keep it aligned.
-            range_table.append(0) 
-
-        elif ((item) & (0xf)) == 9:
-            # This is a rate channel
-            # Rate ranges begin with 1, so subtract 1 to maintain zero-based index
-            # in the rate_ranges tuple
-            range_table.append(rate_ranges[(item >> 8)-1]) 
-
-        else:
-            # This is a count channel. No measurement range support.
-            # Update range_table with any value to keep it aligned.
-            range_table.append(0)
+    # Scan list position must start with 0 and increment sequentially. The
+    # commands are sent back to back and each echo is matched to its command
+    commands = ["slist " + str(position) + " " + str(item) for position, item in enumerate(slist)]
+    for response in engine.execute(commands):
+        if response:
+            print (response)
 
 while discovery() == False:
     discovery()
@@ -195,8 +170,11 @@ while discovery() == False:
 send_cmd("stop")
 # Define binary output mode
 send_cmd("encode 0")
-# Keep the packet size small for responsiveness
-send_cmd("ps 0")
+# Packet and read sizes that deliver scans within the latency budget at
+# the srate and dec sent below
+config = AcquisitionConfig(slist, srate=11718, dec=512, latency_budget=latency_budget)
+tuned = tuning.for_config(model, config)
+send_cmd("ps " + str(tuned.ps))
 # Configure the instrument's scan list
 config_scn_lst()
 # Define sample rate = 10 Hz:
@@ -208,18 +186,28 @@ print("Ready to acquire...")
 print ("")
 print("Press <g> to go, <s> to stop, <r> to reset counter, and <q> to quit:")
 
-# This is the slist position pointer. Ranges from 0 (first position)
-# to len(slist)
-slist_pointer = 0
-# This is the constructed output string
-output_string = ""
+# Compile slist once: per-column scaling, units and display formats
+plan = starter_kit.compile_plan(slist, model)
+scan_bytes = plan.scan_bytes
+
+# Background reader that drains the serial port while acquiring
+reader = None
+
+# Shows the latest scan at a fixed refresh rate, however fast scans arrive
+display = Display(plan)
+display.start()
 
 while True:
     # If key 'SPACE' start scanning
     if keyboard.is_pressed('g' or  'G'):
          keyboard.read_key()
-         acquiring = True
-         send_cmd("start")
+         # Ignored while acquiring, since only one reader may drain the port
+         if reader is None:
+             acquiring = True
+             send_cmd("start")
+             # Hand reading over to a background thread until stopped
+             reader = ScanReader(ser, scan_bytes, read_size=tuned.read_size)
+             reader.start()
     # If key 'r' reset counter
     if keyboard.is_pressed('r' or  'R'):
          keyboard.read_key()
@@ -227,53 +215,38 @@ while True:
     # If key 'esc' stop scanning
     if keyboard.is_pressed('s' or 'S'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          time.sleep(1)
          ser.flushInput()
+         # Drop the last snapshot so it cannot overwrite the messages below
+         display.clear()
          print ("")
          print ("stopped")
          acquiring = False
     # If key 'q' exit 
     if keyboard.is_pressed('q' or 'Q'):
          keyboard.read_key()
+         if reader is not None:
+             # Stop the background reader before the port is used for commands again
+             reader.stop()
+             reader = None
          send_cmd("stop")
          ser.flushInput()
          break
-    while (ser.inWaiting() > (2 * len(slist))):
-         for i in range(len(slist)):
-            # The four LSBs of slist determine measurement function
-            function = (slist[slist_pointer]) & (0xf)
-            # Always two bytes per sample...read them
-            bytes = ser.read(2)
-            if function < 8:
-                # Working with an Analog input channel
-                result = range_table[slist_pointer] * int.from_bytes(bytes,byteorder='little', signed=True) / 32768
-                output_string = output_string + "{: 3.5f}, ".format(result)
-
-            elif function == 8:
-                # Working with the Digital input channel 
-                result = (int.from_bytes(bytes,byteorder='big', signed=False)) & (0x007f)
-                output_string = output_string + "{: 3d}, ".format(result)
-
-            elif function == 9:
-                # Working with the Rate input channel
-                result = (int.from_bytes(bytes,byteorder='little', signed=True) + 32768) / 65535 * (range_table[slist_pointer])
-                output_string = output_string + "{: 3.1f}, ".format(result)
-
-            else:
-                # Working with the Counter input channel
-                result = (int.from_bytes(bytes,byteorder='little', signed=True)) + 32768
-                output_string = output_string + "{: 1d}, ".format(result)
-
-            # Get the next position in slist
-            slist_pointer += 1
-
-            if (slist_pointer + 1) > (len(slist)):
-                # End of a pass through slist items...output, reset, continue
-                print(output_string.rstrip(", ") + "           ", end="\r") 
-                output_string = ""
-                slist_pointer = 0
+    if reader is not None:
+         # Wait briefly for whole scans so the keys are still checked regularly
+         block = reader.get(timeout=0.05)
+         if len(block):
+             # Decode the whole block; only the latest scan is shown since
+             # the output line is overwritten in place
+             block = plan.decode(block)
+             display.show(block)
+    else:
+         time.sleep(0.05)
+display.stop()
 ser.close()
 SystemExit
-
-
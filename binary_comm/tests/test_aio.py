@@ -0,0 +1,110 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from dataq.aio import AsyncDevice
+from dataq.simulator import Simulator, constant
+
+SLIST = [0x0A00, 0x0B01, 0x0A02]
+LEVELS = [0.25, -0.5, 0.75]
+
+
+def _simulator():
+    waveforms = dict((position, constant(level)) for position, level in enumerate(LEVELS))
+    return Simulator("DI-2008", waveforms=waveforms)
+
+
+def _expected():
+    return np.round(np.array(LEVELS) * 32768) * np.array([10.0, 5.0, 10.0]) / 32768
+
+
+async def _take(device, scans):
+    # Blocks from the device until they hold at least scans scans
+    blocks = []
+    async for block in device:
+        blocks.append(block)
+        if sum(len(b) for b in blocks) >= scans:
+            return np.concatenate(blocks)
+
+
+def test_configure_and_acquire():
+    async def run(simulator):
+        async with AsyncDevice(simulator.port, "DI-2008", SLIST) as device:
+            await device.configure(srate=4, dec=1, ps=1)
+            assert await device.send_cmd("info 1") == "info 1 2008"
+            await device.start()
+            values = await asyncio.wait_for(_take(device, 200), 5)
+        return values
+
+    with _simulator() as simulator:
+        values = asyncio.run(run(simulator))
+        assert simulator.scan_list() == SLIST
+        assert (simulator.srate, simulator.dec, simulator.ps) == (4, 1, 1)
+        # Closing while acquiring stops the instrument
+        assert not simulator.scanning
+    np.testing.assert_allclose(values, np.broadcast_to(_expected(), values.shape))
+
+
+def test_stop_echo_after_scan_data():
+    # An instrument left scanning: the 'stop' echo follows binary data on its line
+    async def run(simulator):
+        async with AsyncDevice(simulator.port, "DI-2008", SLIST) as device:
+            for position, item in enumerate(SLIST):
+                await device.send_cmd("slist " + str(position) + " " + str(item))
+            device.ser.write(b"start\r")
+            await asyncio.sleep(0.2)
+            assert await device.send_cmd("stop") == "stop"
+            await device.configure(srate=4)
+
+    with _simulator() as simulator:
+        asyncio.run(run(simulator))
+        assert simulator.scans_sent > 0
+
+
+def test_noise_before_echo_is_skipped():
+    async def run(simulator):
+        async with AsyncDevice(simulator.port, "DI-2008", SLIST) as device:
+            # A line that contains the command word, but doesn't start with it
+            device._buffer += b"xsrate 9\r"
+            return await device.send_cmd("srate 4")
+
+    with _simulator() as simulator:
+        assert asyncio.run(run(simulator)) == "srate 4"
+
+
+def test_timeout_without_echo():
+    async def run(simulator):
+        async with AsyncDevice(simulator.port, "DI-2008", SLIST) as device:
+            with pytest.raises(asyncio.TimeoutError):
+                await device.send_cmd("srate 4", timeout=0.2)
+
+    # The simulator isn't started, so nothing answers
+    simulator = _simulator()
+    try:
+        asyncio.run(run(simulator))
+    finally:
+        simulator.close()
+
+
+def test_disconnect_ends_blocks_and_close_skips_stop():
+    async def run(simulator):
+        device = AsyncDevice(simulator.port, "DI-2008", SLIST)
+        await device.open()
+        try:
+            await device.configure(srate=4)
+            await device.start()
+            await asyncio.wait_for(_take(device, 10), 5)
+            simulator.close()
+            with pytest.raises(OSError):
+                await asyncio.wait_for(_take(device, 1 << 30), 5)
+            with pytest.raises(OSError):
+                await device.send_cmd("stop")
+        finally:
+            # Writing 'stop' to the dead port would raise here
+            await device.close()
+        assert device.ser is None
+
+    simulator = _simulator()
+    simulator.start()
+    asyncio.run(run(simulator))
@@ -0,0 +1,115 @@
+import queue
+import time
+
+import numpy as np
+import pytest
+
+from dataq import di_2008
+from dataq.capture import CaptureFull, CaptureWriter, Recorder, open_capture
+
+SLIST = [0x0A00, 0x0B01, 0x1302, 0x0709, 0x0008]
+
+
+class FakeSerial:
+    """A serial port whose reads return queued chunks, or b"" after timeout."""
+
+    def __init__(self):
+        self.timeout = 1.0
+        self.in_waiting = 0
+        self.chunks = queue.Queue()
+
+    def read(self, size):
+        try:
+            return self.chunks.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+
+def _raw(scans, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(-32768, 32768, (scans, len(SLIST))).astype("<i2").tobytes()
+
+
+def test_round_trip(tmp_path):
+    raw = _raw(3000)
+    path = tmp_path / "run.dqr"
+    with CaptureWriter(path, "DI-2008", SLIST, 1 << 20, srate=4, dec=2, ps=3) as writer:
+        writer.mark_start(1234.5)
+        # Writes that split scans
+        for start in range(0, len(raw), 4099):
+            writer.write(raw[start:start + 4099])
+        assert writer.remaining() == (1 << 20) - len(raw)
+    with open_capture(path) as capture:
+        assert (capture.model, capture.slist, capture.srate, capture.dec, capture.ps) == \
+            ("DI-2008", tuple(SLIST), 4, 2, 3)
+        assert capture.start_time == 1234.5
+        assert capture.scan_rate() == 100.0
+        assert len(capture) == 3000
+        assert capture.raw.tobytes() == raw
+        expected = di_2008.compile_plan(SLIST).decode(raw)
+        np.testing.assert_array_equal(capture[:], expected)
+        np.testing.assert_array_equal(np.concatenate(list(capture.blocks(700, 100, 2900))),
+                                      expected[100:2900])
+
+
+@pytest.mark.parametrize("index", [slice(None), slice(None, None, -1), slice(2000, 10, -3),
+                                   slice(-50, None), slice(5, 5), -1, 0, 1234])
+def test_indexing_matches_numpy(tmp_path, index):
+    raw = _raw(2500)
+    with CaptureWriter(tmp_path / "run.dqr", "DI-2008", SLIST, len(raw)) as writer:
+        writer.write(raw)
+    expected = di_2008.compile_plan(SLIST).decode(raw)
+    with open_capture(tmp_path / "run.dqr") as capture:
+        np.testing.assert_array_equal(capture[index], expected[index])
+        np.testing.assert_array_equal(capture[index, 2], expected[index, 2])
+
+
+def test_full_file_keeps_what_fits(tmp_path):
+    raw = _raw(100)
+    writer = CaptureWriter(tmp_path / "run.dqr", "DI-2008", SLIST, 505)
+    with pytest.raises(CaptureFull):
+        writer.write(raw)
+    assert writer.remaining() == 0
+    # Never closed: readable up to the last write, in whole scans
+    with open_capture(tmp_path / "run.dqr") as capture:
+        assert len(capture) == 50
+        assert capture.raw.tobytes() == raw[:500]
+        assert capture.start_time is None
+    writer.close()
+
+
+def test_recorder_writes_everything_read(tmp_path):
+    raw = _raw(1000)
+    ser = FakeSerial()
+    writer = CaptureWriter(tmp_path / "run.dqr", "DI-2008", SLIST, len(raw) + 1)
+    recorder = Recorder(ser, writer, timeout=0.01)
+    started = time.time()
+    recorder.start()
+    for start in range(0, len(raw), 333):
+        ser.chunks.put(raw[start:start + 333])
+    while recorder.bytes_read < len(raw):
+        time.sleep(0.005)
+    recorder.stop()
+    assert ser.timeout == 1.0
+    assert recorder.reads == -(-len(raw) // 333)
+    assert not recorder.full
+    writer.close()
+    with open_capture(tmp_path / "run.dqr") as capture:
+        assert capture.raw.tobytes() == raw
+        # Timed from the first bytes read
+        assert started <= capture.start_time <= time.time()
+
+
+def test_recorder_stops_when_full(tmp_path):
+    ser = FakeSerial()
+    writer = CaptureWriter(tmp_path / "run.dqr", "DI-2008", SLIST, 100)
+    recorder = Recorder(ser, writer, timeout=0.01)
+    recorder.start()
+    ser.chunks.put(_raw(20))
+    recorder.join(2)
+    assert not recorder.is_alive()
+    assert recorder.full
+    recorder.stop()
+    writer.close()
+    with open_capture(tmp_path / "run.dqr") as capture:
+        assert len(capture) == 10
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+from dataq import di_2008
+from dataq.change_events import ChangeDecoder, ChangeEncoder, event_columns
+from dataq.chunked import ChunkedWriter
+from dataq.columnar import ColumnarWriter, events_path_for
+
+# Analog, digital inputs, analog, counter
+SLIST = [0x0A00, 0x0008, 0x0B01, 0x000A]
+
+
+def _columns(scans, seed=0):
+    # Dense digital input and counter columns that hold each value for a while
+    rng = np.random.default_rng(seed)
+    columns = np.empty((scans, 2))
+    for position in range(2):
+        steps = rng.random(scans) < 0.01
+        columns[:, position] = np.cumsum(steps) % (128 if position == 0 else 65536)
+    return columns
+
+
+def _blocks(dense, sizes):
+    # Split dense into blocks of the given sizes, repeating them
+    position = 0
+    index = 0
+    while position < len(dense):
+        size = sizes[index % len(sizes)]
+        yield dense[position:position + size]
+        position += size
+        index += 1
+
+
+def test_event_columns():
+    assert event_columns(di_2008.compile_plan(SLIST)) == [1, 3]
+
+
+@pytest.mark.parametrize("sizes", [[1], [7, 0, 300], [5000]])
+def test_round_trip_across_blocks(sizes):
+    dense = _columns(5000)
+    encoder = ChangeEncoder([0, 1])
+    decoder = ChangeDecoder([0, 1])
+    decoded = []
+    for block in _blocks(dense, sizes):
+        events = encoder.encode(block)
+        for changes in events:
+            assert np.all(changes.indexes >= encoder.scans - len(block))
+            assert np.all(changes.indexes < encoder.scans)
+        decoded.append(decoder.decode(events, len(block)))
+    np.testing.assert_array_equal(np.concatenate(decoded), dense)
+    # One event for the first scan of each column, then one per change
+    changes = np.count_nonzero(np.diff(dense, axis=0))
+    assert encoder.events == 2 + changes
+    assert encoder.scans == decoder.scans == 5000
+
+
+def test_value_held_across_block_boundary():
+    encoder = ChangeEncoder([0])
+    first = encoder.encode(np.array([[3.0], [3.0], [5.0]]))
+    second = encoder.encode(np.array([[5.0], [5.0]]))
+    third = encoder.encode(np.array([[4.0]]))
+    assert first[0].indexes.tolist() == [0, 2]
+    assert first[0].values.tolist() == [3.0, 5.0]
+    assert len(second[0].indexes) == 0
+    assert third[0].indexes.tolist() == [5]
+    decoder = ChangeDecoder([0])
+    assert decoder.decode(first, 3)[:, 0].tolist() == [3.0, 3.0, 5.0]
+    assert decoder.decode(second, 2)[:, 0].tolist() == [5.0, 5.0]
+    assert decoder.decode(third, 1)[:, 0].tolist() == [4.0]
+
+
+def test_columnar_events_file_round_trip(tmp_path):
+    plan = di_2008.compile_plan(SLIST)
+    scans = 20000
+    dense = np.zeros((scans, len(SLIST)))
+    dense[:, [1, 3]] = _columns(scans, seed=1)
+    dense[:, 0] = np.sin(np.arange(scans) / 100)
+    path = str(tmp_path / "run.parquet")
+    with ColumnarWriter(path, plan, scan_rate=1000.0, start_time=0.0, row_group_scans=4096,
+                        compression="none", change_events=True) as writer:
+        for block in _blocks(dense, [999, 1, 3000]):
+            writer.write(block)
+
+    main = pq.read_table(path)
+    assert main.column_names == ["time", "ch0", "ch1"]
+    events = pq.read_table(events_path_for(path))
+    names = ["dig_in1", "counter3"]
+    assert sorted(set(events.column("channel").to_pylist())) == sorted(names)
+    # Expand the events of each channel back into its dense column
+    channel = np.array(events.column("channel").to_pylist())
+    scan = events.column("scan").to_numpy()
+    value = events.column("value").to_numpy()
+    assert np.all(np.diff(scan) >= 0)
+    times = events.column("time").cast("int64").to_numpy()
+    np.testing.assert_array_equal(times, scan * 1000)
+    for position, name in zip((1, 3), names):
+        rows = channel == name
+        latest = np.searchsorted(scan[rows], np.arange(scans), side="right") - 1
+        np.testing.assert_array_equal(value[rows][latest], dense[:, position])
+
+
+def test_chunked_recording_compresses_steady_words(tmp_path):
+    # The chunked path keeps dense words; its delta encoding makes a
+    # rarely changing digital input word nearly free
+    rng = np.random.default_rng(2)
+    scans = 200000
+    analog = np.cumsum(rng.integers(-40, 41, (scans, 2)), axis=0)
+    dig_in = np.repeat(rng.integers(0, 128, scans // 20000) << 8, 20000)[:, None]
+    sizes = []
+    for slist, words in (([0x0A00, 0x0B01], analog),
+                         ([0x0A00, 0x0B01, 0x0008], np.hstack((analog, dig_in)))):
+        path = tmp_path / ("run%d.dqc" % len(slist))
+        with ChunkedWriter(path, "DI-2008", slist, 65536, "zlib") as writer:
+            writer.write(words.astype("<i2").tobytes())
+        sizes.append(os.path.getsize(path))
+    assert sizes[1] - sizes[0] < 0.02 * scans
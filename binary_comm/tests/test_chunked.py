@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from dataq import di_2008
+from dataq.chunked import ChunkedWriter, open_recording
+
+SLIST = [0x0A00, 0x0B01, 0x1302, 0x0008]
+
+
+def _raw(scans, seed=0):
+    # Slowly varying words, as from real channels, with a few random jumps
+    rng = np.random.default_rng(seed)
+    words = np.cumsum(rng.integers(-40, 41, (scans, len(SLIST))), axis=0)
+    words[rng.integers(0, scans, 20)] = rng.integers(-32768, 32768, (20, len(SLIST)))
+    return words.astype("<i2").tobytes()
+
+
+def _record(path, raw, chunk_scans=1000, codec=None, sizes=(4097, 3, 12000)):
+    # Write raw in uneven pieces, splitting scans
+    with ChunkedWriter(path, "DI-2008", SLIST, chunk_scans, codec, srate=7, dec=1) as writer:
+        writer.mark_start(1000.0)
+        position = 0
+        index = 0
+        while position < len(raw):
+            size = sizes[index % len(sizes)]
+            writer.write(raw[position:position + size])
+            position += size
+            index += 1
+    return path
+
+
+@pytest.mark.parametrize("codec", [None, "zlib"])
+def test_round_trip_is_byte_exact(tmp_path, codec):
+    raw = _raw(10500)
+    with open_recording(_record(tmp_path / "run.dqc", raw, codec=codec)) as recording:
+        assert len(recording) == 10500
+        assert recording.raw_scans(0, len(recording)).tobytes() == raw
+        np.testing.assert_array_equal(recording[:], di_2008.compile_plan(SLIST).decode(raw))
+
+
+def test_unclosed_recording_reads_whole_chunks(tmp_path):
+    raw = _raw(2500)
+    writer = ChunkedWriter(tmp_path / "run.dqc", "DI-2008", SLIST, 1000)
+    writer.write(raw)
+    writer._file.flush()
+    with open_recording(tmp_path / "run.dqc") as recording:
+        assert len(recording) == 2000
+        assert recording.raw_scans(0, 2000).tobytes() == raw[:2000 * 8]
+    writer.close()
+
+
+@pytest.mark.parametrize("index", [
+    slice(None), slice(None, None, -1), slice(10, 3, -2), slice(5000, 100, -7),
+    slice(-1500, None, 3), slice(999, 1001), slice(3, 3), slice(8, 2), slice(None, None, 1000),
+    -5, 0, 4999,
+])
+def test_indexing_matches_numpy(tmp_path, index):
+    raw = _raw(5000)
+    expected = di_2008.compile_plan(SLIST).decode(raw)
+    with open_recording(_record(tmp_path / "run.dqc", raw)) as recording:
+        np.testing.assert_array_equal(recording[index], expected[index])
+        np.testing.assert_array_equal(recording[index, 1], expected[index, 1])
+
+
+def test_index_out_of_range(tmp_path):
+    with open_recording(_record(tmp_path / "run.dqc", _raw(10))) as recording:
+        with pytest.raises(IndexError):
+            recording[10]
+
+
+def test_time_range_returns_scans_in_interval(tmp_path):
+    raw = _raw(5000)
+    with open_recording(_record(tmp_path / "run.dqc", raw)) as recording:
+        rate = recording.scan_rate()
+        for first in range(0, 4000, 37):
+            start = 1000.0 + first / rate
+            scans = recording.time_range(start, start + 10 / rate)
+            np.testing.assert_array_equal(scans, recording[first:first + 10])
+        # Between scans: from the next scan on
+        assert len(recording.time_range(1000.0 + 0.5 / rate, 1000.0 + 10.5 / rate)) == 10
+        assert len(recording.time_range(900.0, 1000.0)) == 0
+
+
+def test_only_touched_chunks_are_decompressed(tmp_path):
+    with open_recording(_record(tmp_path / "run.dqc", _raw(5000))) as recording:
+        decompressed = []
+        decompress = recording._decompress
+        recording._decompress = lambda data: decompressed.append(1) or decompress(data)
+        recording[2500:2600]
+        assert len(decompressed) == 1
+        # The last chunk used stays cached
+        recording[2600:2700]
+        assert len(decompressed) == 1
+        recording[999:1001]
+        assert len(decompressed) == 3
+        recording[4999]
+        assert len(decompressed) == 4
+        assert sum(len(block) for block in recording.blocks(1500, 3500)) == 2000
+        assert len(decompressed) == 7
@@ -0,0 +1,107 @@
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from dataq import di_2008
+from dataq.columnar import ColumnarWriter, column_names
+from dataq.timestamps import TimedBlock
+
+# ±10 V, ±5 V, K-type TC, rate, counter, digital inputs
+SLIST = [0x0A00, 0x0B01, 0x1302, 0x0709, 0x000A, 0x0008]
+
+
+def _decoded(scans, seed=0):
+    # Decoded scans of random words, with TC error sentinels among them
+    rng = np.random.default_rng(seed)
+    words = rng.integers(-32768, 32768, (scans, len(SLIST))).astype("<i2")
+    words[:, 5] &= 0x7f00
+    words[::97, 2] = 32767
+    words[::89, 2] = -32768
+    return di_2008.compile_plan(SLIST).decode(words.tobytes())
+
+
+def _read(path, file_format):
+    if file_format == "parquet":
+        return pq.read_table(path)
+    with pa.ipc.open_file(path) as reader:
+        return reader.read_all()
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_round_trip(tmp_path, file_format):
+    plan = di_2008.compile_plan(SLIST)
+    decoded = _decoded(10000)
+    path = str(tmp_path / ("run." + file_format))
+    with ColumnarWriter(path, plan, scan_rate=200.0, start_time=1000.0, row_group_scans=3000,
+                        file_format=file_format, compression="zstd") as writer:
+        for start in range(0, len(decoded), 777):
+            writer.write(decoded[start:start + 777])
+    assert writer.scans_written == 10000
+    assert writer.row_groups == 4
+    if file_format == "parquet":
+        assert pq.ParquetFile(path).num_row_groups == 4
+
+    table = _read(path, file_format)
+    assert table.column_names == ["time"] + column_names(plan)
+    for column, name in enumerate(column_names(plan)):
+        # float32 holds every 16-bit reading; TC errors stay infinite
+        values = table.column(name).to_numpy()
+        np.testing.assert_array_equal(values, decoded[:, column].astype(values.dtype))
+    tc = table.column(column_names(plan)[2]).to_numpy()
+    assert np.isinf(tc).sum() == np.isinf(decoded[:, 2]).sum() > 0
+    times = table.column("time").cast("int64").to_numpy()
+    np.testing.assert_array_equal(times, np.round((1000.0 + np.arange(10000) / 200.0) * 1e6))
+
+
+def test_storage_types_and_metadata(tmp_path):
+    plan = di_2008.compile_plan(SLIST)
+    path = str(tmp_path / "run.parquet")
+    with ColumnarWriter(path, plan, scan_rate=200.0, start_time=0.0) as writer:
+        writer.write(_decoded(10))
+    schema = pq.read_schema(path)
+    names = column_names(plan)
+    assert [str(schema.field(name).type) for name in names] == \
+        ["float", "float", "float", "float", "uint16", "uint8"]
+    assert schema.field(names[1]).metadata[b"range"] == b"5"
+    assert schema.field(names[1]).metadata[b"slist"] == b"0xb01"
+    assert schema.field(names[2]).metadata[b"tc_type"] == b"K"
+    assert schema.field(names[2]).metadata[b"units"] == b"degC"
+    assert schema.metadata[b"model"] == b"DI-2008"
+    assert json.loads(schema.metadata[b"slist"]) == [hex(item) for item in SLIST]
+    assert json.loads(schema.metadata[b"scan_rate"]) == 200.0
+
+
+def test_timed_blocks_keep_their_times(tmp_path):
+    plan = di_2008.compile_plan(SLIST)
+    decoded = _decoded(500)
+    times = 5000.0 + np.sort(np.random.default_rng(1).random(500)) * 10
+    path = str(tmp_path / "run.parquet")
+    with ColumnarWriter(path, plan, row_group_scans=128) as writer:
+        writer.write(TimedBlock(decoded[:200], times[:200]))
+        writer.write(decoded[200:], times[200:])
+    table = pq.read_table(path)
+    np.testing.assert_array_equal(table.column("time").cast("int64").to_numpy(),
+                                  np.round(times * 1e6).astype(np.int64))
+    np.testing.assert_array_equal(table.column(column_names(plan)[0]).to_numpy(),
+                                  decoded[:, 0].astype(np.float32))
+
+
+def test_repeated_channels_get_unique_names():
+    plan = di_2008.compile_plan([0x0A00, 0x0B00, 0x0A01])
+    names = column_names(plan)
+    assert len(set(names)) == 3
+    assert names[1] == names[0] + "_1"
+
+
+def test_invalid_settings(tmp_path):
+    plan = di_2008.compile_plan(SLIST)
+    with pytest.raises(ValueError):
+        ColumnarWriter(str(tmp_path / "run.csv"), plan, file_format="csv")
+    writer = ColumnarWriter(str(tmp_path / "run.parquet"), plan)
+    with pytest.raises(ValueError):
+        # Neither timestamps nor a scan rate
+        writer.write(_decoded(5))
+    writer.close()
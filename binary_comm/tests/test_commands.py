@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+from dataq.commands import CommandEngine, CommandError, echo_start
+
+
+class FakePort:
+    """
+    A serial port that answers each command written with respond(command),
+    bytes queued for reading at once (b"" for no answer.)
+    """
+
+    def __init__(self, respond=None, noise=b""):
+        self.timeout = 1.0
+        self.respond = respond or (lambda command: (command + "\r").encode())
+        self.written = []
+        self.input = bytearray(noise)
+
+    @property
+    def in_waiting(self):
+        return len(self.input)
+
+    def write(self, data):
+        for command in data.decode().split("\r")[:-1]:
+            self.written.append(command)
+            self.input += self.respond(command)
+
+    def read(self, size):
+        if not self.input:
+            time.sleep(self.timeout)
+            return b""
+        data = bytes(self.input[:size])
+        del self.input[:size]
+        return data
+
+
+def test_pipelined_echoes_in_command_order():
+    port = FakePort()
+    engine = CommandEngine(port, window=4)
+    commands = ["slist " + str(position) + " " + str(2560 + position) for position in range(10)]
+    commands += ["srate 4", "start"]
+    responses = engine.execute(commands)
+    assert responses == commands[:-1] + [None]
+    assert port.written == commands
+    assert engine.commands_sent == 12
+    assert port.timeout == 1.0
+
+
+def test_window_limits_outstanding_commands():
+    writes = []
+    port = FakePort()
+    original = port.write
+    port.write = lambda data: (writes.append(data.count(b"\r")), original(data))
+    CommandEngine(port, window=3).execute(["ps 0"] * 7)
+    assert max(writes) == 3
+    assert sum(writes) == 7
+
+
+def test_noise_and_unrelated_lines_are_skipped():
+    # Leftover scan data, then a line that only mentions the command word
+    noise = bytes(range(1, 13)) + b"\r" + b"garbage srate 4\r"
+    port = FakePort(noise=noise)
+    assert CommandEngine(port).execute(["srate 4", "dec 1"]) == ["srate 4", "dec 1"]
+
+
+def test_stop_echo_after_scan_data():
+    # The echo of stop follows scan data on the same line
+    port = FakePort(respond=lambda command: b"\x81\x02stop\x7fAstop\r")
+    assert CommandEngine(port).execute(["stop"]) == ["stop"]
+    port = FakePort(respond=lambda command: b"\x81\x02stopped\r")
+    assert CommandEngine(port).execute(["stop"], timeout=0.05) == [None]
+
+
+def test_out_of_order_noise_between_echoes():
+    answers = {"slist 0 2560": b"slist 0 2560\r\x05\x06\r", "slist 1 2561": b"xx\rslist 1 2561\r"}
+    port = FakePort(respond=lambda command: answers[command])
+    responses = CommandEngine(port).execute(list(answers))
+    assert responses == list(answers)
+
+
+def test_timeout_gives_none_and_counts():
+    port = FakePort(respond=lambda command: b"" if command == "dec 1" else (command + "\r").encode())
+    engine = CommandEngine(port, timeouts={"dec": 0.05})
+    started = time.monotonic()
+    assert engine.execute(["srate 4", "dec 1", "ps 0"]) == ["srate 4", None, "ps 0"]
+    assert time.monotonic() - started < 0.5
+    assert engine.timeouts_expired == 1
+
+
+def test_confirm_raises_on_timeout_or_mismatch():
+    port = FakePort(respond=lambda command: b"" if command == "dec 1" else (command + "\r").encode())
+    with pytest.raises(CommandError, match="no response to 'dec 1'"):
+        CommandEngine(port).confirm(["srate 4", "dec 1"], timeout=0.05)
+    port = FakePort(respond=lambda command: b"srate 8\r")
+    with pytest.raises(CommandError, match="unexpected response"):
+        CommandEngine(port).confirm(["srate 4"])
+    port = FakePort(respond=lambda command: b"info 1 2008\r")
+    assert CommandEngine(port).confirm(["info 1"]) == ["info 1 2008"]
+
+
+def test_echo_start_is_anchored():
+    assert echo_start("srate 4", "srate 4") == 0
+    assert echo_start("srate", "srate 4") == 0
+    assert echo_start("xsrate 4", "srate 4") == -1
+    assert echo_start("dec 1 srate 4", "srate 4") == -1
+    assert echo_start("srates 4", "srate 4") == -1
+    assert echo_start("\x01\x02stop", "stop") == 2
+    assert echo_start("stop now", "stop") == -1
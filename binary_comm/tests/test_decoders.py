@@ -0,0 +1,259 @@
+"""
+The block decoders against the per-sample loops of the original example
+programs, on random words and on edge-case words.
+"""
+
+import numpy as np
+import pytest
+
+from dataq import di_1100, di_1110, di_2008, di_245, starter_kit
+
+EDGE_WORDS = [0x0000, 0x0001, 0x0002, 0x0003, 0x7ffe, 0x7fff, 0x8000, 0x8001,
+              0xfffc, 0xfffe, 0xffff, 0x00ff, 0xff00, 0x0080, 0x8080, 0x7f7f]
+
+
+def _stream(words, scans, seed=0):
+    # Random words, preceded by a scan of every edge-case word in every position
+    rng = np.random.default_rng(seed)
+    edge = np.array([[w] * words for w in EDGE_WORDS], dtype="<u2")
+    random = rng.integers(0, 65536, (scans, words)).astype("<u2")
+    return np.concatenate((edge, random)).tobytes()
+
+
+def _signed(data):
+    return int.from_bytes(data, byteorder='little', signed=True)
+
+
+def legacy_di_2008(raw, slist):
+    # The per-sample loop of the original di_2008.py, TC errors as +/-inf
+    rows = []
+    for start in range(0, len(raw), 2 * len(slist)):
+        row = []
+        for position, item in enumerate(slist):
+            function = item & 0xf
+            data = raw[start + 2 * position:start + 2 * position + 2]
+            if (function < 8) and not (item & 0x1000):
+                result = di_2008.analog_ranges[item >> 8] * _signed(data) / 32768
+            elif function < 8:
+                result = _signed(data)
+                if result == 32767:
+                    result = np.inf
+                elif result == -32768:
+                    result = -np.inf
+                else:
+                    tc_type = (item & 0x0700) >> 8
+                    result = di_2008.tc_m[tc_type] * result + di_2008.tc_b[tc_type]
+            elif function == 8:
+                result = int.from_bytes(data, byteorder='big', signed=False) & 0x007f
+            elif function == 9:
+                result = (_signed(data) + 32768) / 65535 * di_2008.rate_ranges[(item >> 8) - 1]
+            else:
+                result = _signed(data) + 32768
+            row.append(result)
+        rows.append(row)
+    return np.array(rows)
+
+
+def legacy_di_245(raw, slist, dig_inputs):
+    # The per-sample loop of the original DI_245.py, TC errors as +/-inf
+    width = 2 * (len(slist) + (1 if dig_inputs else 0))
+    rows = []
+    for start in range(0, len(raw), width):
+        row = []
+        for position, item in enumerate(slist):
+            data = raw[start + 2 * position:start + 2 * position + 2]
+            counts = int.from_bytes([data[0], data[1] ^ 0x80], byteorder='little', signed=True)
+            counts = counts >> 1
+            ls_byte = counts & 0x7F
+            counts = ((counts >> 8) << 7) | ls_byte
+            if item & 0x1000 == 0:
+                row.append(di_245.analog_ranges[item >> 8] * counts / 8192)
+            elif counts == 8191:
+                row.append(np.inf)
+            elif counts == -8192:
+                row.append(-np.inf)
+            else:
+                tc_type = (item & 0x0700) >> 8
+                row.append(di_245.tc_m[tc_type] * counts + di_245.tc_b[tc_type])
+        if dig_inputs:
+            data = raw[start + width - 2:start + width]
+            row.append(int.from_bytes([data[0], data[1] >> 1], byteorder='little', signed=False) >> 7)
+        rows.append(row)
+    return np.array(rows)
+
+
+def legacy_di_1100(raw, slist, decimation_factor):
+    # The decimation loop of the original DI_1100.py: volts of each position,
+    # then the digital inputs of the last scan in the window
+    rows = []
+    accumulation = [0] * len(slist)
+    dec_count = decimation_factor
+    for start in range(0, len(raw) - len(raw) % (2 * len(slist)), 2 * len(slist)):
+        for position in range(len(slist)):
+            result = _signed(raw[start + 2 * position:start + 2 * position + 2])
+            if position == 0:
+                dig_in = result & 0x3
+                result = (result >> 2) << 2
+            accumulation[position] += result
+        if dec_count == 1:
+            rows.append([a * 10 / 32768 / decimation_factor for a in accumulation] + [dig_in])
+            accumulation = [0] * len(slist)
+            dec_count = decimation_factor
+        else:
+            dec_count -= 1
+    return np.array(rows).reshape(-1, len(slist) + 1)
+
+
+def legacy_di_1110(raw, slist, decimation_factor):
+    # The decimation loop of the original DI_1110.py (one rate channel)
+    rows = []
+    accumulation = [0] * len(slist)
+    dec_count = decimation_factor
+    for start in range(0, len(raw) - len(raw) % (2 * len(slist)), 2 * len(slist)):
+        last = []
+        for position, item in enumerate(slist):
+            function = item & 0xf
+            data = raw[start + 2 * position:start + 2 * position + 2]
+            if function < 8:
+                accumulation[position] += _signed(data)
+                last.append(None)
+            elif function == 8:
+                last.append(int.from_bytes(data, byteorder='big', signed=False) & 0x007f)
+            elif function == 9:
+                accumulation[position] += _signed(data) + 32768
+                last.append(None)
+            else:
+                last.append(_signed(data) + 32768)
+        if dec_count == 1:
+            row = []
+            for position, item in enumerate(slist):
+                function = item & 0xf
+                if function < 8:
+                    row.append(accumulation[position] * 10 / 32768 / decimation_factor)
+                elif function == 9:
+                    rate_range = di_1110.rate_ranges[(item >> 8) - 1]
+                    row.append(accumulation[position] / 65535 * rate_range / decimation_factor)
+                else:
+                    row.append(last[position])
+            rows.append(row)
+            accumulation = [0] * len(slist)
+            dec_count = decimation_factor
+        else:
+            dec_count -= 1
+    return np.array(rows).reshape(-1, len(slist))
+
+
+def legacy_starter_kit(raw, slist, model):
+    # The per-sample loop of the original DataqStarterKit.py
+    analog_ranges = starter_kit.model_analog_ranges[model]
+    rows = []
+    for start in range(0, len(raw), 2 * len(slist)):
+        row = []
+        for position, item in enumerate(slist):
+            function = item & 0xf
+            data = raw[start + 2 * position:start + 2 * position + 2]
+            if function < 8:
+                row.append(analog_ranges[item >> 8] * _signed(data) / 32768)
+            elif function == 8:
+                row.append(int.from_bytes(data, byteorder='big', signed=False) & 0x007f)
+            elif function == 9:
+                row.append((_signed(data) + 32768) / 65535 * starter_kit.rate_ranges[(item >> 8) - 1])
+            else:
+                row.append(_signed(data) + 32768)
+        rows.append(row)
+    return np.array(rows)
+
+
+def _chunks(raw, scan_bytes, sizes):
+    # Whole scans of raw in blocks of the given numbers of scans, repeating sizes
+    position = 0
+    index = 0
+    while position < len(raw):
+        count = sizes[index % len(sizes)] * scan_bytes
+        yield raw[position:position + count]
+        position += count
+        index += 1
+
+
+@pytest.mark.parametrize("slist", [
+    [0x0A00, 0x0B01, 0x0002, 0x0D03, 0x0004, 0x0505],
+    [0x1702, 0x1303, 0x1004, 0x1105, 0x1206, 0x1407, 0x1500, 0x1601],
+    [0x0709, 0x0109, 0x000A, 0x0008, 0x0A00, 0x1303],
+])
+def test_di_2008_matches_legacy(slist):
+    raw = _stream(len(slist), 500)
+    np.testing.assert_allclose(di_2008.decode_block(raw, slist), legacy_di_2008(raw, slist), rtol=1e-9)
+
+
+@pytest.mark.parametrize("dig_inputs", [False, True])
+@pytest.mark.parametrize("slist", [
+    [0x0A00, 0x0B01, 0x0002, 0x0D03],
+    [0x1702, 0x1303, 0x1004, 0x1105, 0x1206, 0x1407, 0x1500, 0x1601],
+])
+def test_di_245_matches_legacy(slist, dig_inputs):
+    words = len(slist) + (1 if dig_inputs else 0)
+    raw = _stream(words, 500)
+    np.testing.assert_allclose(di_245.decode_block(raw, slist, dig_inputs),
+                               legacy_di_245(raw, slist, dig_inputs), rtol=1e-9)
+
+
+def test_di_245_sign_and_sync_bits():
+    # Full scale, zero and the TC sentinels, with every sync bit pattern
+    slist = [0x0A00, 0x1302]
+    for counts in (-8192, -8191, -1, 0, 1, 8190, 8191):
+        word = counts & 0x3fff
+        low = (word & 0x7f) << 1
+        high = ((word >> 7) << 1) ^ 0x80
+        for sync in range(4):
+            raw = bytes([low | (sync & 1), high | (sync >> 1)] * 2)
+            np.testing.assert_allclose(di_245.decode_block(raw, slist), legacy_di_245(raw, slist, False))
+
+
+@pytest.mark.parametrize("model, slist", [
+    ("DI-2108", [0x0000, 0x0001, 0x0709, 0x000A, 0x0008]),
+    ("DI-4108", [0x0300, 0x0401, 0x0502, 0x0109, 0x000A, 0x0008]),
+    ("DI-4208", [0x0000, 0x0101, 0x0202, 0x0303]),
+])
+def test_starter_kit_matches_legacy(model, slist):
+    raw = _stream(len(slist), 500)
+    np.testing.assert_allclose(starter_kit.decode_block(raw, slist, model),
+                               legacy_starter_kit(raw, slist, model), rtol=1e-9)
+
+
+@pytest.mark.parametrize("decimation_factor", [1, 7, 100])
+def test_di_1100_matches_legacy(decimation_factor):
+    slist = [0x0000, 0x0001, 0x0002]
+    raw = _stream(len(slist), 1000)
+    decoded = di_1100.Decoder(slist, decimation_factor).decode(raw)
+    np.testing.assert_allclose(decoded, legacy_di_1100(raw, slist, decimation_factor), rtol=1e-9)
+
+
+@pytest.mark.parametrize("decimation_factor", [1, 7, 100])
+def test_di_1110_matches_legacy(decimation_factor):
+    slist = [0x0000, 0x0001, 0x0709, 0x0008, 0x000A]
+    raw = _stream(len(slist), 1000)
+    decoded = di_1110.Decoder(slist, decimation_factor).decode(raw)
+    np.testing.assert_allclose(decoded, legacy_di_1110(raw, slist, decimation_factor), rtol=1e-9)
+
+
+@pytest.mark.parametrize("sizes", [[1], [3, 11, 2], [64, 5, 250, 1]])
+def test_decimation_carries_windows_across_reads(sizes):
+    # Uneven blocks give the same rows as one block of the whole stream
+    for decoder_class, slist in ((di_1100.Decoder, [0x0000, 0x0001]),
+                                 (di_1110.Decoder, [0x0000, 0x0709, 0x0008, 0x000A])):
+        raw = _stream(len(slist), 997)
+        whole = decoder_class(slist, 10).decode(raw)
+        decoder = decoder_class(slist, 10)
+        parts = [decoder.decode(chunk) for chunk in _chunks(raw, 2 * len(slist), sizes)]
+        np.testing.assert_allclose(np.concatenate(parts), whole, rtol=1e-9)
+        assert len(whole) == (len(raw) // (2 * len(slist))) // 10
+
+
+def test_decimation_reset_drops_partial_window():
+    slist = [0x0000, 0x0001]
+    raw = _stream(len(slist), 100)
+    decoder = di_1100.Decoder(slist, 10)
+    decoder.decode(raw[:4 * 5])
+    decoder.reset()
+    np.testing.assert_allclose(decoder.decode(raw[4 * 5:4 * 25]),
+                               di_1100.Decoder(slist, 10).decode(raw[4 * 5:4 * 25]))
@@ -0,0 +1,104 @@
+import io
+import threading
+import time
+
+import numpy as np
+
+from dataq import di_2008, scan_plan
+from dataq.display import Display
+from dataq.metrics import Metrics
+
+SLIST = [0x0A00, 0x0B01, 0x0008]
+
+
+class SlowStream(io.StringIO):
+    """A text stream whose writes take a while, like a slow terminal."""
+
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.writing = threading.Event()
+
+    def write(self, text):
+        self.writing.set()
+        time.sleep(self.delay)
+        return super().write(text)
+
+
+def _lines(stream):
+    return [line for line in stream.getvalue().split("\r") if line]
+
+
+def test_shows_latest_scan_at_refresh_rate():
+    plan = di_2008.compile_plan(SLIST)
+    stream = io.StringIO()
+    metrics = Metrics()
+    display = Display(plan, refresh_hz=20, stream=stream, padding="", metrics=metrics)
+    display.start()
+    try:
+        # Many more scans than refreshes: only the latest of each interval is printed
+        started = time.monotonic()
+        while time.monotonic() - started < 0.5:
+            display.show(np.array([[1.0, 2.0, 3.0], [time.monotonic() - started, 0.5, 7.0]]))
+            time.sleep(0.0005)
+        display.show(np.array([9.0, -1.0, 5.0]))
+        time.sleep(0.1)
+    finally:
+        display.stop()
+    lines = _lines(stream)
+    assert display.shown > 5 * len(lines)
+    assert 4 <= display.refreshes == len(lines) <= 15
+    assert lines[-1] == scan_plan.format_scan(plan, np.array([9.0, -1.0, 5.0]))
+    assert metrics.snapshot()["counters"]["print_blocks"] == display.refreshes
+
+
+def test_nothing_new_prints_nothing():
+    plan = di_2008.compile_plan(SLIST)
+    stream = io.StringIO()
+    display = Display(plan, refresh_hz=50, stream=stream, padding="")
+    display.start()
+    try:
+        display.show(np.empty((0, 3)))
+        time.sleep(0.1)
+        assert stream.getvalue() == ""
+        display.show(np.array([1.0, 2.0, 3.0]))
+        time.sleep(0.1)
+        # Shown once, not repeated on later refreshes
+        assert _lines(stream) == [scan_plan.format_scan(plan, np.array([1.0, 2.0, 3.0]))]
+    finally:
+        display.stop()
+
+
+def test_clear_waits_for_refresh_and_drops_pending_scan():
+    plan = di_2008.compile_plan(SLIST)
+    stream = SlowStream(delay=0.2)
+    display = Display(plan, refresh_hz=100, stream=stream, padding="")
+    display.start()
+    try:
+        display.show(np.array([1.0, 2.0, 3.0]))
+        assert stream.writing.wait(1)
+        # A scan shown during the slow write is dropped by clear()
+        display.show(np.array([4.0, 5.0, 6.0]))
+        display.clear()
+        assert len(_lines(stream)) == 1
+        time.sleep(0.1)
+        assert len(_lines(stream)) == 1
+    finally:
+        display.stop()
+
+
+def test_show_does_not_wait_for_slow_stream():
+    plan = di_2008.compile_plan(SLIST)
+    stream = SlowStream(delay=0.3)
+    display = Display(plan, refresh_hz=100, stream=stream)
+    display.start()
+    try:
+        display.show(np.array([1.0, 2.0, 3.0]))
+        assert stream.writing.wait(1)
+        started = time.monotonic()
+        for _ in range(1000):
+            display.show(np.array([1.0, 2.0, 3.0]))
+        assert time.monotonic() - started < 0.1
+    finally:
+        display.stop()
+    assert not display.is_alive()
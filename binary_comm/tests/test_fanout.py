@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from dataq import di_2008
+from dataq.fanout import LOCK_FILE, Publisher, Subscriber
+from dataq.timestamps import TimedBlock
+
+SLIST = [0x0A00, 0x0B01, 0x0008]
+PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _block(first, count):
+    # Scans numbered from first, with their number in every column
+    return np.repeat(np.arange(first, first + count, dtype=float), 3).reshape(count, 3)
+
+
+def _subscribe(name, attached, results):
+    # Subscriber process: read everything published, then report it
+    with Subscriber(name, start="oldest") as subscriber:
+        attached.set()
+        values, times = [], []
+        for block in subscriber.blocks():
+            values.append(block.values)
+            times.append(block.times)
+        results.put((np.concatenate(values), np.concatenate(times), subscriber.lost_scans))
+
+
+def _publish_and_die(connection):
+    # Publisher process that ends without closing its ring
+    publisher = Publisher(di_2008.compile_plan(SLIST), capacity=64)
+    publisher.publish(_block(0, 10))
+    connection.send(publisher.name)
+    os._exit(1)
+
+
+def _attach_and_exit(name):
+    # A subscriber in an unrelated Python process, with its own resource tracker
+    code = ("import sys; sys.path.insert(0, %r); from dataq.fanout import Subscriber; "
+            "s = Subscriber(%r, start='oldest'); print(len(s.read(100).values)); s.close()"
+            % (PACKAGE, name))
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+
+def test_publish_and_subscribe_across_processes():
+    attached = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    with Publisher(di_2008.compile_plan(SLIST), capacity=4096) as publisher:
+        process = multiprocessing.Process(target=_subscribe, args=(publisher.name, attached, results))
+        process.start()
+        assert attached.wait(10)
+        for first in range(0, 3000, 100):
+            times = np.arange(first, first + 100) / 1000
+            publisher.publish(TimedBlock(_block(first, 100), times))
+    values, times, lost = results.get(timeout=10)
+    process.join(10)
+    assert process.exitcode == 0
+    np.testing.assert_array_equal(values, _block(0, 3000))
+    np.testing.assert_allclose(times, np.arange(3000) / 1000)
+    assert lost == 0
+
+
+def test_overrun_subscriber_skips_to_oldest_scan():
+    with Publisher(di_2008.compile_plan(SLIST), capacity=100) as publisher:
+        subscriber = Subscriber(publisher.name)
+        publisher.publish(_block(0, 40))
+        publisher.publish(_block(40, 210))
+        assert subscriber.lag() == 250
+        block = subscriber.read(timeout=0)
+        assert block.sequence == 150
+        np.testing.assert_array_equal(block.values, _block(150, 100))
+        assert np.isnan(block.times).all()
+        assert subscriber.lost_scans == 150
+        assert subscriber.lag_events == 1
+        # Caught up: nothing more is lost
+        publisher.publish(_block(250, 30))
+        np.testing.assert_array_equal(subscriber.read(timeout=0).values, _block(250, 30))
+        assert subscriber.lost_scans == 150
+        subscriber.close()
+
+
+def test_views_are_invalid_once_overwritten():
+    with Publisher(di_2008.compile_plan(SLIST), capacity=100) as publisher:
+        subscriber = Subscriber(publisher.name)
+        publisher.publish(_block(0, 50))
+        block = subscriber.read(timeout=0, copy=False)
+        assert subscriber.valid(block)
+        publisher.publish(_block(50, 60))
+        assert not subscriber.valid(block)
+        block = None
+        subscriber.close()
+
+
+def test_close_removes_ring():
+    publisher = Publisher(di_2008.compile_plan(SLIST), capacity=64)
+    name = publisher.name
+    publisher.publish(_block(0, 10))
+    # A subscriber process exiting leaves the ring to its publisher
+    assert _attach_and_exit(name).stdout.strip() == "10"
+    with Subscriber(name, start="oldest") as subscriber:
+        assert len(subscriber.read(timeout=0).values) == 10
+    publisher.close()
+    assert not os.path.exists(LOCK_FILE.format(name))
+    with pytest.raises(FileNotFoundError):
+        Subscriber(name)
+
+
+def test_subscriber_removes_ring_of_dead_publisher():
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_publish_and_die, args=(sender,))
+    process.start()
+    assert receiver.poll(10)
+    name = receiver.recv()
+    process.join(10)
+    subscriber = Subscriber(name, start="oldest")
+    np.testing.assert_array_equal(subscriber.read(timeout=0).values, _block(0, 10))
+    subscriber.close()
+    assert not os.path.exists(LOCK_FILE.format(name))
+    with pytest.raises(FileNotFoundError):
+        Subscriber(name)
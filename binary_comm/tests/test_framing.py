@@ -0,0 +1,158 @@
+import numpy as np
+
+from dataq import di_2008, di_245
+from dataq.framing import FrameValidator
+from dataq.simulator import Simulator, constant
+
+# Digital inputs, then two analog positions carrying the scan's index
+CDC_SLIST = [0x0008, 0x0A01, 0x0A02]
+DI_245_SLIST = [0x0A00, 0x0B01]
+
+
+def _cdc_stream(scans):
+    # Scan i has states 1-127 and analog counts 2i+1 and -(2i+1), so no byte
+    # pair but the real digital input word has a zero low byte and bit 15 clear
+    index = np.arange(scans)
+    words = np.empty((scans, 3), dtype="<i2")
+    words[:, 0] = (index % 127 + 1) << 8
+    words[:, 1] = 2 * index + 1
+    words[:, 2] = -(2 * index + 1)
+    return words.tobytes()
+
+
+def _di_245_stream(scans):
+    counts = np.repeat(np.arange(scans) % 8192, 2).reshape(scans, 2)
+    low = (((counts & 0x7f) << 1) | 1).astype(np.uint8)
+    high = ((((counts >> 7) & 0x7f) << 1 | 1) ^ 0x80).astype(np.uint8)
+    low[:, 0] &= 0xfe
+    return np.stack((low, high), axis=-1).tobytes()
+
+
+def _feed(validator, raw, sizes):
+    # Feed raw in reads of the given sizes, repeating them
+    out = []
+    position = 0
+    index = 0
+    while position < len(raw):
+        size = sizes[index % len(sizes)]
+        out.append(validator.feed(raw[position:position + size]))
+        position += size
+        index += 1
+    return np.concatenate(out).tobytes()
+
+
+def _indexes(plan, data):
+    # The index of each scan, from its first analog position
+    if plan.model == "DI-245":
+        return np.round(plan.decode(data)[:, 0] * 8192 / 10).astype(int)
+    return (np.round(plan.decode(data)[:, 1] * 32768 / 10).astype(int) - 1) // 2
+
+
+def _check_recovery(plan, raw, deleted, sizes):
+    # Delete bytes at the given offsets; what comes out must be whole,
+    # aligned scans of the original stream, and every byte fed accounted for
+    damaged = np.delete(np.frombuffer(raw, dtype=np.uint8), deleted).tobytes()
+    validator = FrameValidator(plan)
+    data = _feed(validator, damaged, sizes)
+    scans = len(raw) // plan.scan_bytes
+    assert len(data) % plan.scan_bytes == 0
+    indexes = _indexes(plan, data)
+    assert np.all(np.diff(indexes) > 0)
+    assert set(indexes) <= set(range(scans))
+    assert validator.scans_out == len(indexes)
+    assert validator.bytes_in == len(damaged)
+    held = len(damaged) - validator.position()
+    assert validator.dropped_bytes == (scans - len(indexes)) * plan.scan_bytes - len(deleted) - held
+    return validator, indexes
+
+
+def test_passes_clean_stream():
+    plan = di_2008.compile_plan(CDC_SLIST)
+    raw = _cdc_stream(1000)
+    validator = FrameValidator(plan)
+    data = _feed(validator, raw, [7, 600, 1, 95])
+    # The last scan is held back until its successor checks out
+    assert data == raw[:-plan.scan_bytes]
+    assert validator.dropped_bytes == 0
+    assert validator.resync_events == 0
+
+
+def test_dig_in_check_recovers_from_lost_bytes():
+    plan = di_2008.compile_plan(CDC_SLIST)
+    raw = _cdc_stream(1000)
+    for deleted in ([1500], [1501, 3003], [6 * 500 + 5, 6 * 800]):
+        validator, indexes = _check_recovery(plan, raw, deleted, [64, 13, 1000])
+        assert validator.resync_events == len(deleted)
+        # Only the scans around each loss are dropped
+        assert len(indexes) >= 1000 - 1 - 4 * len(deleted)
+
+
+def test_di_245_sync_bits_recover_from_lost_bytes():
+    plan = di_245.compile_plan(DI_245_SLIST)
+    raw = _di_245_stream(1000)
+    for deleted in ([1000], [1003, 2001], [4 * 990 + 3]):
+        validator, indexes = _check_recovery(plan, raw, deleted, [64, 13, 1000])
+        assert validator.resync_events == len(deleted)
+        assert len(indexes) >= 1000 - 3 * len(deleted)
+
+
+def test_hold_back_one_scan():
+    # Only the DIG_IN word is checked, so once locked each scan waits for
+    # its successor to check out
+    plan = di_2008.compile_plan(CDC_SLIST)
+    raw = _cdc_stream(10)
+    validator = FrameValidator(plan, lock_scans=1)
+    assert len(validator.feed(raw[:12])) == 6
+    assert validator.feed(raw[12:18]).tobytes() == raw[6:12]
+    assert validator.feed(raw[18:24]).tobytes() == raw[12:18]
+    assert validator.position() == 18
+    # A byte lost from scan 4 may have been lost from scan 3, held until
+    # then, so that is dropped too
+    assert len(validator.feed(raw[25:36])) == 0
+    assert _indexes(plan, validator.feed(raw[36:])).tolist() == [5, 6, 7, 8]
+    assert validator.dropped_bytes == 6 + 5
+    assert validator.resync_events == 1
+
+
+def test_di_245_does_not_hold_back():
+    # Every byte carries a sync bit, so a scan passes as soon as it is checked
+    plan = di_245.compile_plan(DI_245_SLIST)
+    raw = _di_245_stream(4)
+    validator = FrameValidator(plan, lock_scans=1)
+    assert validator.feed(raw[:8]).tobytes() == raw[:8]
+    assert validator.feed(raw[8:12]).tobytes() == raw[8:12]
+    assert validator.feed(raw[12:]).tobytes() == raw[12:]
+    assert validator.position() == 16
+
+
+def test_unchecked_scan_list_passes_through():
+    plan = di_2008.compile_plan([0x0A00, 0x0B01])
+    validator = FrameValidator(plan)
+    assert not validator.checkable
+    assert validator.feed(b"\x01\x02\x03").tobytes() == b"\x01\x02\x03"
+
+
+def test_simulated_loss():
+    # Levels and states with no zero bytes, so only true alignment checks out
+    slist = [0x0008, 0x0A00, 0x0B01]
+    levels = [0.3, -0.55]
+    simulator = Simulator("DI-2008", waveforms={1: constant(levels[0]), 2: constant(levels[1])},
+                          dig_in=lambda t: np.full(len(t), 0x55), loss_probability=0.01, seed=1)
+    try:
+        simulator.slist = dict(enumerate(slist))
+        raw = simulator.encode(np.arange(20000) / 1000)
+    finally:
+        simulator.close()
+    assert simulator.bytes_dropped > 50
+
+    plan = di_2008.compile_plan(slist)
+    validator = FrameValidator(plan)
+    data = _feed(validator, raw, [512, 37, 4096])
+    values = plan.decode(data)
+    expected = [0x55] + list(np.round(np.array(levels) * 32768) * np.array([10.0, 5.0]) / 32768)
+    np.testing.assert_allclose(values, np.broadcast_to(expected, values.shape))
+    assert len(values) > 20000 - 4 * simulator.bytes_dropped
+    # Nearby losses can share a resync
+    assert 0 < validator.resync_events <= simulator.bytes_dropped
+    assert validator.dropped_bytes >= validator.resync_events * (plan.scan_bytes - 1)
+    assert validator.dropped_bytes + len(data) + len(raw) - validator.position() == len(raw)
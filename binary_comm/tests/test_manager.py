@@ -0,0 +1,36 @@
+import collections
+import os
+import tty
+
+from dataq import manager
+from dataq.simulator import Simulator
+
+Port = collections.namedtuple("Port", "device hwid serial_number")
+
+HWID = "USB VID:PID=0683:2008"
+
+
+def test_discover_skips_ports_that_fail(monkeypatch):
+    # A simulated device, a port that can't be opened, a port that never
+    # answers and a port that isn't a DATAQ Instruments device
+    silent, silent_slave = os.openpty()
+    tty.setraw(silent_slave)
+    with Simulator("DI-2008", serial_number="12345678") as simulator:
+        ports = [Port("/nonexistent/tty", HWID, "1"),
+                 Port(os.ttyname(silent_slave), HWID, "2"),
+                 Port(simulator.port, HWID, "12345678"),
+                 Port("/dev/null", "USB VID:PID=1234:5678", "3")]
+        monkeypatch.setattr(manager.serial.tools.list_ports, "comports", lambda: ports)
+        try:
+            devices = manager.discover()
+        finally:
+            os.close(silent)
+            os.close(silent_slave)
+    assert devices == [manager.DeviceInfo(simulator.port, "12345678", "DI-2008")]
+
+
+def test_model_from_info():
+    assert manager._model_from_info("info 1 2008") == "DI-2008"
+    assert manager._model_from_info("info 1 4718") == "DI-4718B"
+    for response in (None, "", "info 1", "info 1 ��", "info 1 2008 x", "stop"):
+        assert manager._model_from_info(response) is None
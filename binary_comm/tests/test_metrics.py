@@ -0,0 +1,55 @@
+from dataq.metrics import Metrics, render
+
+
+def _snapshot(**values):
+    # A snapshot with no metrics but those given
+    snapshot = {"uptime_s": 2.5, "counters": {}, "rates": {}, "gauges": {}, "peaks": {},
+                "histograms": {}}
+    snapshot.update(values)
+    return snapshot
+
+
+def test_render_labels_and_families():
+    text = render({"1234": _snapshot(counters={"scans_read": 10}, rates={"scans_read": 5.0}),
+                   "5678": _snapshot(counters={"scans_read": 20}, rates={"scans_read": 2.0})})
+    assert text.splitlines() == [
+        "# TYPE dataq_uptime_seconds gauge",
+        'dataq_uptime_seconds{device="1234"} 2.5',
+        'dataq_uptime_seconds{device="5678"} 2.5',
+        "# TYPE dataq_scans_read_total counter",
+        'dataq_scans_read_total{device="1234"} 10',
+        'dataq_scans_read_total{device="5678"} 20',
+        "# TYPE dataq_scans_read_per_second gauge",
+        'dataq_scans_read_per_second{device="1234"} 5.0',
+        'dataq_scans_read_per_second{device="5678"} 2.0',
+    ]
+    # No label for a single acquisition
+    assert render({None: _snapshot()}, prefix="x") == "# TYPE x_uptime_seconds gauge\nx_uptime_seconds 2.5\n"
+
+
+def test_render_escapes_label_values():
+    text = render({'a\\b"c\nd': _snapshot()}, label="port")
+    assert text.splitlines()[1] == 'dataq_uptime_seconds{port="a\\\\b\\"c\\nd"} 2.5'
+
+
+def test_render_special_values():
+    text = render({None: _snapshot(gauges={"a": float("inf"), "b": float("-inf"), "c": float("nan")})})
+    assert "dataq_a Inf" in text.splitlines()
+    assert "dataq_b -Inf" in text.splitlines()
+    assert "dataq_c NaN" in text.splitlines()
+
+
+def test_render_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for value in (1, 3, 3, 100):
+        metrics.observe("read_bytes", value, bounds=(2, 4))
+    text = render({None: metrics.snapshot()})
+    lines = text.splitlines()
+    start = lines.index("# TYPE dataq_read_bytes histogram")
+    assert lines[start + 1:start + 6] == [
+        'dataq_read_bytes_bucket{le="2.0"} 1',
+        'dataq_read_bytes_bucket{le="4.0"} 3',
+        'dataq_read_bytes_bucket{le="+Inf"} 4',
+        "dataq_read_bytes_sum 107.0",
+        "dataq_read_bytes_count 4",
+    ]
@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from dataq.metrics import Metrics
+from dataq.reader import ScanReader
+
+
+class FakeSerial:
+    """A serial port whose reads return queued chunks, or b"" after timeout."""
+
+    def __init__(self):
+        self.timeout = 1.0
+        self.chunks = queue.Queue()
+        self.fail = None
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def feed(self, data):
+        self.chunks.put(bytes(data))
+
+    def read(self, size):
+        if self.fail is not None:
+            raise self.fail
+        try:
+            return self.chunks.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+
+def _stream(count, start=0):
+    # Bytes start, start + 1, ... modulo 256
+    return (np.arange(start, start + count) % 256).astype(np.uint8).tobytes()
+
+
+def _wait_for(condition, seconds=2.0):
+    deadline = time.monotonic() + seconds
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_delivers_whole_scans():
+    ser = FakeSerial()
+    reader = ScanReader(ser, 6, timeout=0.01)
+    reader.start()
+    try:
+        raw = _stream(6 * 50 + 4)
+        # Reads that split scans anywhere
+        for start, end in ((0, 7), (7, 100), (100, 101), (101, len(raw))):
+            ser.feed(raw[start:end])
+        _wait_for(lambda: reader.bytes_read == len(raw))
+        block = reader.get(max_scans=20, timeout=1)
+        assert block.tobytes() == raw[:120]
+        block = reader.get(timeout=1)
+        # The partial scan at the end stays until the rest arrives
+        assert block.tobytes() == raw[120:300]
+        assert len(reader.get(timeout=0.05)) == 0
+        ser.feed(_stream(2, 304))
+        assert reader.get(timeout=1).tobytes() == raw[300:] + _stream(2, 304)
+        assert reader.blocks == 3
+        assert reader.last_arrival[0] == 51
+    finally:
+        reader.stop()
+
+
+def test_ring_wraps_around():
+    ser = FakeSerial()
+    reader = ScanReader(ser, 4, capacity=10, timeout=0.01)
+    reader.start()
+    try:
+        position = 0
+        # 7 scans at a time into a 10-scan ring, always consumed in time
+        for _ in range(20):
+            ser.feed(_stream(28, position))
+            assert reader.get(timeout=1).tobytes() == _stream(28, position)
+            position += 28
+        assert reader.overrun_scans == 0
+        assert reader.high_water == 28
+    finally:
+        reader.stop()
+
+
+def test_overrun_drops_oldest_whole_scans():
+    ser = FakeSerial()
+    metrics = Metrics()
+    reader = ScanReader(ser, 4, capacity=10, timeout=0.01, metrics=metrics)
+    reader.start()
+    try:
+        # 14 scans and 2 bytes into a 10-scan ring: the oldest 5 scans are overwritten
+        for start in (0, 20, 40):
+            ser.feed(_stream(20 if start < 40 else 18, start))
+        _wait_for(lambda: reader.bytes_read == 58)
+        assert reader.overrun_scans == 5
+        assert reader.overrun_events == 1
+        assert reader.get(timeout=1).tobytes() == _stream(36, 20)
+        ser.feed(_stream(2, 58))
+        assert reader.get(timeout=1).tobytes() == _stream(4, 56)
+        assert metrics.snapshot()["counters"]["overrun_scans"] == 5
+        stats = reader.stats()
+        assert stats["overrun_scans"] == 5
+        assert stats["capacity_bytes"] == 40
+    finally:
+        reader.stop()
+
+
+def test_stop_ends_thread_and_restores_timeout():
+    ser = FakeSerial()
+    reader = ScanReader(ser, 4, timeout=0.01)
+    reader.start()
+    ser.feed(_stream(8))
+    _wait_for(lambda: reader.bytes_read == 8)
+    reader.stop()
+    assert not reader.is_alive()
+    assert ser.timeout == 1.0
+    # Scans read before stopping can still be taken, then get() returns at once
+    assert reader.get(timeout=1).tobytes() == _stream(8)
+    started = time.monotonic()
+    assert len(reader.get()) == 0
+    assert time.monotonic() - started < 0.5
+    # Stopping again is harmless
+    reader.stop()
+
+
+def test_read_error_reaches_consumer():
+    ser = FakeSerial()
+    reader = ScanReader(ser, 4, timeout=0.01)
+    ser.fail = OSError("device disconnected")
+    reader.start()
+    with pytest.raises(OSError):
+        reader.get(timeout=1)
+    reader.stop()
+
+
+def test_get_wakes_on_data():
+    ser = FakeSerial()
+    reader = ScanReader(ser, 4, timeout=0.01)
+    reader.start()
+    try:
+        threading.Timer(0.05, ser.feed, (_stream(4),)).start()
+        started = time.monotonic()
+        assert reader.get(timeout=2).tobytes() == _stream(4)
+        assert time.monotonic() - started < 1
+    finally:
+        reader.stop()
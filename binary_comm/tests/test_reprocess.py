@@ -0,0 +1,49 @@
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+from dataq import di_2008, models
+from dataq.chunked import ChunkedWriter
+from dataq.decimation import PlanDecoder
+from dataq.reprocess import ranges, reprocess
+
+SLIST = [0x0A00, 0x0B01, 0x1302, 0x0008]
+COLUMNS = ["ch0", "ch1", "tc2_K", "dig_in3"]
+
+
+def _record(path, scans, seed=0):
+    # Random words, so that every block and row differs from the next
+    rng = np.random.default_rng(seed)
+    words = rng.integers(-32768, 32768, (scans, len(SLIST))).astype("<i2")
+    words[:, 3] &= 0x7f00
+    with ChunkedWriter(path, "DI-2008", SLIST, 1000, srate=7, dec=1) as writer:
+        writer.mark_start(1000.0)
+        writer.write(words.tobytes())
+    return words.tobytes()
+
+
+def test_ranges_are_whole_windows():
+    assert ranges(25, 10) == [(0, 10), (10, 20), (20, 25)]
+    assert ranges(25, 8, 3) == [(0, 6), (6, 12), (12, 18), (18, 24)]
+    assert ranges(5, 2, 10) == []
+
+
+@pytest.mark.parametrize("decimation_factor", [1, 10])
+def test_pool_matches_single_process_decode(tmp_path, decimation_factor):
+    raw = _record(tmp_path / "run.dqc", 4005)
+    written = reprocess(tmp_path / "run.dqc", tmp_path / "run.parquet", processes=3,
+                        block_scans=333, decimation_factor=decimation_factor, compression="none")
+    table = pq.read_table(tmp_path / "run.parquet")
+
+    # Decoded in one go, the partial window at the end left out
+    plan = di_2008.compile_plan(SLIST)
+    expected = PlanDecoder(plan, decimation_factor).decode(raw).astype(np.float32)
+    assert written == len(expected) == table.num_rows
+    values = np.column_stack([table.column(name).to_numpy() for name in COLUMNS])
+    np.testing.assert_array_equal(values, expected)
+
+    # Each row at the middle of its window, as BlockStamper times it online
+    rate = models.scan_rate("DI-2008", 7, 1, None)
+    middle = np.arange(len(expected)) * decimation_factor + (decimation_factor - 1) / 2
+    times = table.column("time").cast("int64").to_numpy()
+    np.testing.assert_array_equal(times, np.round((1000.0 + middle / rate) * 1e6).astype(np.int64))
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import numpy as np
+
+from dataq.manager import AcquisitionConfig
+from dataq.session import Gap, Session
+from dataq.simulator import Simulator, constant
+
+SLIST = [0x0A00, 0x0B01, 0x0008]
+LEVELS = [0.25, -0.5]
+CONFIG = AcquisitionConfig(SLIST, srate=4, dec=1, latency_budget=0.05)
+
+
+def _simulator():
+    waveforms = dict((position, constant(level)) for position, level in enumerate(LEVELS))
+    return Simulator("DI-2008", serial_number="ABC", waveforms=waveforms,
+                     dig_in=lambda t: np.full(len(t), 0x55))
+
+
+def _collect(session, seconds):
+    # Blocks and gaps until seconds have passed
+    items = []
+    deadline = time.monotonic() + seconds
+    for item in session.blocks(timeout=1):
+        items.append(item)
+        if time.monotonic() > deadline:
+            break
+    return items
+
+
+def _check_values(blocks):
+    values = np.concatenate([block.values for block in blocks])
+    expected = np.round(np.array(LEVELS) * 32768) * np.array([10.0, 5.0]) / 32768
+    np.testing.assert_allclose(values, np.broadcast_to(list(expected) + [0x55], values.shape))
+    # One scan period apart within a block; the clock's corrections can
+    # shift times between blocks
+    for block in blocks:
+        np.testing.assert_allclose(np.diff(block.times), 1 / 200, rtol=1e-3)
+
+
+def test_reconnects_after_unplug():
+    current = {"simulator": _simulator()}
+    current["simulator"].start()
+
+    def locate(serial_number):
+        simulator = current["simulator"]
+        return simulator.port if simulator is not None and serial_number == "ABC" else None
+
+    def unplug():
+        # The unit drops off for a while, then comes back on a new port
+        time.sleep(0.8)
+        simulator, current["simulator"] = current["simulator"], None
+        simulator.close()
+        time.sleep(0.3)
+        replacement = _simulator()
+        replacement.start()
+        current["simulator"] = replacement
+
+    session = Session("ABC", "DI-2008", CONFIG, locate=locate)
+    session.start()
+    threading.Thread(target=unplug).start()
+    try:
+        items = _collect(session, 2.5)
+    finally:
+        session.stop()
+        current["simulator"].close()
+
+    assert session.error is None
+    gaps = [index for index, item in enumerate(items) if isinstance(item, Gap)]
+    assert len(gaps) == 1
+    before, gap, after = items[:gaps[0]], items[gaps[0]], items[gaps[0] + 1:]
+    assert len(before) and len(after)
+    _check_values(before)
+    _check_values(after)
+    # The gap spans the time without data, at the configured scan rate
+    assert 0.3 <= gap.end - gap.start < 1.5
+    assert gap.scans == round((gap.end - gap.start) * 200)
+    assert before[-1].times[-1] <= gap.start + 0.5
+    assert after[0].times[0] >= gap.end - 0.5
+    assert session.reconnects == 1
+    assert 0.3 <= session.last_recovery < 1.5
+    assert session.gap_seconds == gap.end - gap.start
+    # The configuration was replayed to the unit that came back
+    assert current["simulator"].scan_list() == SLIST
+    assert current["simulator"].srate == 4
+
+
+def test_waits_for_missing_unit():
+    simulator = _simulator()
+    simulator.start()
+    appeared = threading.Event()
+    threading.Timer(0.3, appeared.set).start()
+    session = Session("ABC", "DI-2008", CONFIG,
+                      locate=lambda serial_number: simulator.port if appeared.is_set() else None)
+    session.start()
+    try:
+        items = _collect(session, 0.8)
+    finally:
+        session.stop()
+        simulator.close()
+    # Not found at first is not an interruption
+    assert not any(isinstance(item, Gap) for item in items)
+    assert session.reconnects == 0
+    _check_values(items)
+    # stop() ends the stream after the blocks still queued
+    assert not session.is_alive()
+    assert all(not isinstance(item, Gap) for item in session.blocks())
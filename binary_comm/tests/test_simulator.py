@@ -0,0 +1,53 @@
+import os
+import select
+import time
+
+import numpy as np
+
+from dataq import di_2008
+from dataq.simulator import Simulator, constant
+
+SLIST = [0x0A00, 0x0B01, 0x0A02]
+LEVELS = [0.25, -0.5, 0.75]
+
+
+def _command(fd, command):
+    os.write(fd, (command + "\r").encode())
+    time.sleep(0.02)
+
+
+def _drain(fd, seconds):
+    data = bytearray()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if select.select([fd], [], [], 0.01)[0]:
+            data += os.read(fd, 65536)
+    return bytes(data)
+
+
+def test_overflow_drops_whole_scans():
+    # 1000 bytes is not a whole number of 6-byte scans
+    waveforms = dict((position, constant(level)) for position, level in enumerate(LEVELS))
+    with Simulator("DI-2008", waveforms=waveforms, rate_multiplier=20, buffer_limit=1000) as simulator:
+        fd = os.open(simulator.port, os.O_RDWR | os.O_NOCTTY)
+        try:
+            for position, item in enumerate(SLIST):
+                _command(fd, "slist " + str(position) + " " + str(item))
+            _command(fd, "srate 4")
+            _command(fd, "dec 1")
+            _drain(fd, 0.1)
+            _command(fd, "start")
+            # Not reading lets the pty fill, then the simulated FIFO overflows
+            time.sleep(1.0)
+            data = _drain(fd, 0.5)
+            _command(fd, "stop")
+        finally:
+            os.close(fd)
+        assert simulator.overflow_bytes > 0
+
+    scan_bytes = 2 * len(SLIST)
+    values = di_2008.decode_block(data[:len(data) // scan_bytes * scan_bytes], SLIST)
+    ranges = np.array([10.0, 5.0, 10.0])
+    expected = np.round(np.array(LEVELS) * 32768) * ranges / 32768
+    assert len(values) > 100
+    np.testing.assert_allclose(values, np.broadcast_to(expected, values.shape))
@@ -0,0 +1,115 @@
+"""
+The thermocouple tables against reference points of the NIST ITS-90
+tables (NIST Monograph 175), which list EMF in mV to 1 uV.
+"""
+
+import numpy as np
+import pytest
+
+from dataq import di_2008, di_245, thermocouple
+
+# (degC, mV) from the NIST ITS-90 thermocouple tables, reference junction at 0 degC
+NIST_POINTS = {
+    "B": [(100, 0.033), (500, 1.242), (1000, 4.834), (1820, 13.820)],
+    "E": [(-200, -8.825), (-100, -5.237), (100, 6.319), (500, 37.005), (1000, 76.373)],
+    "J": [(-210, -8.095), (-100, -4.633), (100, 5.269), (200, 10.779), (500, 27.393),
+          (1000, 57.953), (1200, 69.553)],
+    "K": [(-200, -5.891), (-100, -3.554), (0, 0.0), (100, 4.096), (200, 8.138), (300, 12.209),
+          (500, 20.644), (1000, 41.276), (1372, 54.886)],
+    "N": [(-100, -2.407), (100, 2.774), (500, 16.748), (1000, 36.256), (1300, 47.513)],
+    "R": [(100, 0.647), (500, 4.471), (1000, 10.506), (1768.1, 21.103)],
+    "S": [(100, 0.646), (500, 4.233), (1000, 9.587), (1768.1, 18.693)],
+    "T": [(-270, -6.258), (-200, -5.603), (-100, -3.379), (100, 4.279), (200, 9.288),
+          (400, 20.872)],
+}
+
+# Half the tables' 1 uV resolution, and a little for rounding at the half
+TABLE_TOLERANCE = 0.0006
+
+
+def _di_245_stream(scans):
+    # One-position DI-245 scans of every 14-bit code in turn, with the sync
+    # bits set as in test_framing
+    counts = np.arange(scans) % 16384
+    low = (((counts & 0x7f) << 1) & 0xfe).astype(np.uint8)
+    high = ((((counts >> 7) & 0x7f) << 1 | 1) ^ 0x80).astype(np.uint8)
+    return np.stack((low, high), axis=-1).tobytes()
+
+
+def _interior(tc_type):
+    # Reference points strictly inside the type's range
+    low, high = thermocouple.TEMPERATURE_RANGES[tc_type]
+    return [(t, mv) for t, mv in NIST_POINTS[tc_type] if low < t < high]
+
+
+@pytest.mark.parametrize("tc_type", sorted(NIST_POINTS))
+def test_emf_matches_nist_tables(tc_type):
+    temperatures, millivolts = zip(*NIST_POINTS[tc_type])
+    np.testing.assert_allclose(thermocouple.emf(tc_type, temperatures), millivolts,
+                               rtol=0, atol=TABLE_TOLERANCE)
+
+
+@pytest.mark.parametrize("tc_type", sorted(NIST_POINTS))
+def test_temperature_inverts_emf(tc_type):
+    temperatures = np.array([t for t, _ in _interior(tc_type)], dtype=float)
+    # Exact inverse of the reference function, up to the 0.01 degC grid
+    inverted = thermocouple.temperature(tc_type, thermocouple.emf(tc_type, temperatures))
+    np.testing.assert_allclose(inverted, temperatures, rtol=0, atol=0.01)
+    # The tables' rounded EMFs give their temperatures to within the rounding
+    temperatures, millivolts = zip(*_interior(tc_type))
+    sensitivity = np.gradient(thermocouple.emf(tc_type, np.add.outer(temperatures, [-0.5, 0.5])),
+                              axis=1)[:, 0]
+    np.testing.assert_array_less(
+        np.abs(thermocouple.temperature(tc_type, millivolts) - temperatures),
+        TABLE_TOLERANCE / sensitivity + 0.01)
+
+
+def test_outside_range_is_nan():
+    assert np.isnan(thermocouple.temperature("K", 60.0))
+    assert np.isnan(thermocouple.temperature("T", -7.0))
+    low, high = thermocouple.TEMPERATURE_RANGES["J"]
+    edges = thermocouple.emf("J", [low, high])
+    np.testing.assert_allclose(thermocouple.temperature("J", edges), [low, high], atol=0.01)
+
+
+def test_nist_table_with_cold_junction():
+    # A K-type TC at 100 and 500 degC, terminals at 25 degC, on the ±100 mV range
+    volts_per_count = 0.1 / 32768
+    table = thermocouple.nist_table("K", volts_per_count, 65536, 25.0)
+    for hot in (100.0, 500.0):
+        millivolts = thermocouple.emf("K", hot) - thermocouple.emf("K", 25.0)
+        counts = int(round(millivolts / 1000 / volts_per_count))
+        # One count is about 0.075 degC here
+        assert table[counts + 32768] == pytest.approx(hot, abs=0.1)
+    assert not table.flags.writeable
+    assert thermocouple.nist_table("K", volts_per_count, 65536, 25.0) is table
+
+
+def test_di_2008_decodes_through_nist_table():
+    slist = [0x0200, 0x1301]
+    plan = di_2008.compile_plan(slist, nist={0: ("J", 22.0)})
+    millivolts = thermocouple.emf("J", [22.0, 150.0, 400.0]) - thermocouple.emf("J", 22.0)
+    words = np.zeros((3, 2), dtype="<i2")
+    words[:, 0] = np.round(millivolts / 100 * 32768)
+    values = plan.decode(words.tobytes())
+    np.testing.assert_allclose(values[:, 0], [22.0, 150.0, 400.0], atol=0.1)
+    # TC-mode positions keep the instrument's linear constants
+    np.testing.assert_allclose(values[:, 1], 586)
+
+
+def test_di_245_decodes_through_nist_table():
+    # The same stream on the ±100 mV range as volts, then through a T-type table
+    raw = _di_245_stream(16384)
+    counts = np.round(di_245.compile_plan([0x0200]).decode(raw)[:, 0] / 0.1 * 8192).astype(int)
+    values = di_245.compile_plan([0x0200], nist={0: ("T", 20.0)}).decode(raw)[:, 0]
+    table = thermocouple.nist_table("T", 0.1 / 8192, 16384, 20.0)
+    np.testing.assert_array_equal(values, table[counts + 8192])
+    assert table[8192] == pytest.approx(20.0, abs=0.01)
+
+
+def test_linear_table_sentinels():
+    table = thermocouple.linear_table(0.023987, 586, 65536, 32767, -32768)
+    assert table[32768] == 586
+    assert table[32768 + 1000] == pytest.approx(586 + 23.987)
+    assert table[65535] == np.inf
+    assert table[0] == -np.inf
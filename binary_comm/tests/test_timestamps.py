@@ -0,0 +1,44 @@
+import collections
+
+import numpy as np
+
+from dataq import di_2008
+from dataq.framing import FrameValidator
+from dataq.timestamps import BlockStamper, ScanClock
+
+SLIST = [0x0A00, 0x0B01]
+
+FakeReader = collections.namedtuple("FakeReader", "last_arrival overrun_scans")
+
+
+def test_stamper_times_decimated_blocks_on_the_scan_clock():
+    plan = di_2008.compile_plan(SLIST)
+    framing = FrameValidator(plan)
+    clock = ScanClock(100.0, start_time=1000.0)
+    stamper = BlockStamper(clock, FakeReader(None, 0), framing, decimation_factor=4)
+    times = []
+    total = 0
+    # Uneven reads leave partial decimation windows between blocks
+    for scans in (3, 7, 1, 9, 4):
+        raw = framing.feed(bytes(scans * plan.scan_bytes))
+        fed = len(raw) // plan.scan_bytes
+        windows = (total + fed) // 4 - total // 4
+        total += fed
+        block = stamper.stamp(fed, np.zeros((windows, plan.columns)))
+        assert len(block.times) == windows
+        times.append(block.times)
+    times = np.concatenate(times)
+    # Window k covers scans 4k to 4k + 3, timed at its middle
+    np.testing.assert_allclose(times, 1000.0 + (np.arange(len(times)) * 4 + 1.5) / 100.0)
+
+
+def test_stamper_counts_overwritten_scans():
+    plan = di_2008.compile_plan(SLIST)
+    framing = FrameValidator(plan)
+    clock = ScanClock(100.0, start_time=1000.0)
+    stamper = BlockStamper(clock, FakeReader(None, 0), framing)
+    stamper.stamp(len(framing.feed(bytes(5 * plan.scan_bytes))) // plan.scan_bytes, np.zeros((5, 2)))
+    stamper.reader = FakeReader(None, 10)
+    block = stamper.stamp(len(framing.feed(bytes(2 * plan.scan_bytes))) // plan.scan_bytes,
+                          np.zeros((2, 2)))
+    np.testing.assert_allclose(block.times, 1000.0 + np.array([15, 16]) / 100.0)
@@ -0,0 +1,192 @@
+import numpy as np
+import pytest
+
+from dataq import trigger
+from dataq.trigger import TriggeredRecorder
+
+
+def _stream(scans, seed=0):
+    # A noisy sine in column 0 and each scan's stream index in column 1
+    rng = np.random.default_rng(seed)
+    t = np.arange(scans)
+    signal = np.sin(t / 40.0) + rng.normal(0, 0.05, scans)
+    return np.column_stack((signal, t.astype(float)))
+
+
+def _reference_hits(condition, x):
+    # One scan at a time, as the conditions are described
+    result = []
+    for index, value in enumerate(x):
+        before = x[index - 1] if index else value
+        if condition.kind == trigger.LEVEL:
+            if condition.slope == "rising":
+                hit = value >= condition.level
+            else:
+                hit = value <= condition.level
+        elif condition.kind == trigger.WINDOW:
+            inside = condition.level <= value <= condition.upper
+            hit = not inside if condition.slope == "exit" else inside
+        else:
+            up = before < condition.level <= value
+            down = before > condition.level >= value
+            hit = {"rising": up, "falling": down, "either": up or down}[condition.slope]
+        result.append(hit)
+    return np.array(result)
+
+
+def _reference_segments(fired, pre_scans, post_scans, holdoff_scans):
+    # (trigger, first, end) of the segments of a whole stream, flushed at its end
+    segments = []
+    next_allowed = last_end = 0
+    while True:
+        candidates = np.flatnonzero(fired[next_allowed:])
+        if not len(candidates):
+            return segments
+        at = next_allowed + int(candidates[0])
+        first = max(at - pre_scans, last_end)
+        last_end = min(at + post_scans, len(fired))
+        segments.append((at, first, last_end))
+        next_allowed = last_end + holdoff_scans
+
+
+def _record(values, sizes, conditions, **kwargs):
+    # Events from feeding values in blocks of the given sizes in turn, then flushing
+    events = []
+    recorder = TriggeredRecorder(values.shape[1], conditions, events.append, **kwargs)
+    start = 0
+    while start < len(values):
+        for size in sizes:
+            recorder.update(values[start:start + size])
+            start += size
+    recorder.flush()
+    return recorder, events
+
+
+CONDITIONS = [trigger.level(0, 0.9), trigger.level(0, -0.95, "falling"),
+              trigger.edge(0, 0.5), trigger.edge(0, -0.2, "falling"),
+              trigger.edge(0, 0.0, "either"),
+              trigger.window(0, -0.5, 0.5), trigger.window(0, 0.2, 0.3, "enter")]
+
+
+@pytest.mark.parametrize("condition", CONDITIONS)
+def test_hits_match_per_scan_reference(condition):
+    values = _stream(3000)
+    expected = _reference_hits(condition, values[:, 0])
+    np.testing.assert_array_equal(trigger.hits(condition, values), expected)
+    # Split anywhere, with the scan before each block remembered
+    for split in (1, 17, 1500, 2999):
+        np.testing.assert_array_equal(
+            trigger.hits(condition, values[split:], values[split - 1]), expected[split:])
+
+
+@pytest.mark.parametrize("condition", CONDITIONS)
+@pytest.mark.parametrize("sizes", [[3000], [1, 7, 64], [250], [9, 1000, 33]])
+def test_segments_match_reference(condition, sizes):
+    values = _stream(3000)
+    recorder, events = _record(values, sizes, [condition], pre_scans=60, post_scans=45,
+                               holdoff_scans=20)
+    expected = _reference_segments(_reference_hits(condition, values[:, 0]), 60, 45, 20)
+    assert len(expected) > 3
+    assert [(event.trigger, event.first, event.first + len(event.values)) for event in events] \
+        == expected
+    for event in events:
+        # Whole scans in stream order: pre-trigger history, then from the trigger on
+        np.testing.assert_array_equal(event.values,
+                                      values[event.first:event.first + len(event.values)])
+        assert event.condition == 0
+    assert recorder.events == len(events)
+    assert recorder.scans_kept == sum(len(event.values) for event in events)
+    assert recorder.scans == 3000
+
+
+def test_pre_trigger_window_from_earlier_blocks():
+    # An edge well after the start, fed in blocks much smaller than the history
+    values = np.zeros((500, 2))
+    values[:, 1] = np.arange(500)
+    values[300:, 0] = 1.0
+    recorder, events = _record(values, [7], [trigger.edge(0, 0.5)], pre_scans=100, post_scans=50)
+    event, = events
+    assert (event.trigger, event.first) == (300, 200)
+    np.testing.assert_array_equal(event.values[:, 1], np.arange(200, 350))
+    # The trigger scan is the first post-trigger scan
+    assert event.values[100, 0] == 1.0 and event.values[99, 0] == 0.0
+
+
+def test_short_history_at_start():
+    values = np.column_stack((np.ones(40), np.arange(40.0)))
+    _, events = _record(values, [40], [trigger.level(0, 1.0)], pre_scans=100, post_scans=10)
+    assert (events[0].trigger, events[0].first, len(events[0].values)) == (0, 0, 10)
+
+
+def test_edge_between_blocks():
+    events = []
+    recorder = TriggeredRecorder(1, [trigger.edge(0, 0.0, "either")], events.append, pre_scans=2,
+                                 post_scans=1)
+    recorder.update(np.array([[-1.0], [-1.0]]))
+    recorder.update(np.array([[1.0], [1.0]]))
+    recorder.update(np.array([[1.0], [-1.0]]))
+    assert [(event.trigger, event.first) for event in events] == [(2, 0), (5, 3)]
+    # No edge at the very first scan
+    recorder = TriggeredRecorder(1, [trigger.edge(0, 0.0)], events.append)
+    recorder.update(np.array([[1.0], [1.0]]))
+    assert recorder.events == 0
+
+
+def test_first_condition_that_fires_is_reported():
+    values = np.column_stack((np.r_[np.zeros(10), np.ones(10)], np.r_[np.zeros(15), np.ones(5)]))
+    conditions = [trigger.level(1, 0.5), trigger.edge(0, 0.5), trigger.level(0, 0.5)]
+    _, events = _record(values, [20], conditions, pre_scans=0, post_scans=1)
+    assert [(event.trigger, event.condition) for event in events[:2]] == [(10, 1), (11, 2)]
+    assert events[5].condition == 0
+
+
+def test_rearm_false_waits_for_arm():
+    values = np.ones((100, 1))
+    events = []
+    recorder = TriggeredRecorder(1, [trigger.level(0, 0.5)], events.append, pre_scans=5,
+                                 post_scans=10, rearm=False)
+    recorder.update(values[:30])
+    assert len(events) == 1 and not recorder.armed
+    recorder.update(values[30:60])
+    assert len(events) == 1
+    recorder.arm()
+    recorder.update(values[60:])
+    # Fires at the first scan after arm(), with history from before it
+    assert [(event.trigger, event.first) for event in events] == [(0, 0), (60, 55)]
+
+
+def test_flush_passes_short_segment():
+    values = np.column_stack((np.r_[np.zeros(50), np.ones(20)], np.arange(70.0)))
+    events = []
+    recorder = TriggeredRecorder(2, [trigger.edge(0, 0.5)], events.append, pre_scans=10,
+                                 post_scans=100)
+    recorder.update(values)
+    assert events == []
+    recorder.flush()
+    event, = events
+    np.testing.assert_array_equal(event.values[:, 1], np.arange(40, 70))
+    recorder.flush()
+    assert len(events) == 1
+
+
+def test_segments_keep_copies_of_reused_buffers():
+    buffer = np.zeros((10, 1))
+    events = []
+    recorder = TriggeredRecorder(1, [trigger.level(0, 0.5)], events.append, pre_scans=5,
+                                 post_scans=15)
+    recorder.update(buffer)
+    buffer[:] = 1.0
+    recorder.update(buffer)
+    buffer[:] = 2.0
+    recorder.update(buffer)
+    event, = events
+    np.testing.assert_array_equal(event.values[:, 0], [0.0] * 5 + [1.0] * 10 + [2.0] * 5)
+
+
+def test_invalid_slopes():
+    with pytest.raises(ValueError):
+        trigger.level(0, 1.0, "either")
+    with pytest.raises(ValueError):
+        trigger.edge(0, 1.0, "exit")
+    with pytest.raises(ValueError):
+        trigger.window(0, 0.0, 1.0, "rising")
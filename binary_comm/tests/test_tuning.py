@@ -0,0 +1,63 @@
+import pytest
+import serial
+
+from dataq import manager, tuning
+from dataq.manager import AcquisitionConfig
+from dataq.simulator import Simulator
+
+SLIST = [0x0A00, 0x0B01, 0x0A02]
+
+
+@pytest.mark.parametrize("scan_rate", [10, 1000, 20000, 200000])
+@pytest.mark.parametrize("latency_budget", [0.005, 0.05, 1.0])
+def test_choose_meets_budget_with_largest_packet(scan_rate, latency_budget):
+    tuned = tuning.choose(scan_rate, 6, latency_budget)
+    fill_rate = scan_rate * 6
+    assert tuned.packet_bytes == tuning.PACKET_SIZES[tuned.ps]
+    assert tuned.read_size % 6 == 0
+    assert tuned.read_size >= tuned.packet_bytes
+    assert tuned.packet_interval == pytest.approx(tuned.packet_bytes / fill_rate)
+    assert tuned.expected_latency == pytest.approx(tuned.packet_interval + tuned.read_size / fill_rate)
+    if tuned.packet_interval <= latency_budget * tuning.DEVICE_SHARE:
+        # The next size up would take too long to fill
+        if tuned.ps < len(tuning.PACKET_SIZES) - 1:
+            assert tuning.PACKET_SIZES[tuned.ps + 1] / fill_rate > latency_budget * tuning.DEVICE_SHARE
+    assert tuned.meets_latency == (tuned.expected_latency <= latency_budget)
+
+
+def test_choose_examples():
+    # 1 kHz of 8-byte scans with 100 ms: 256-byte packets fill in 32 ms
+    tuned = tuning.choose(1000, 8, 0.1)
+    assert (tuned.ps, tuned.packet_bytes, tuned.read_size) == (4, 256, 272)
+    assert tuned.meets_latency
+    # Bulk logging at 200 kHz with a second to spare takes the largest packet
+    assert tuning.choose(200000, 8, 1.0).ps == 7
+
+
+def test_unmeetable_budget_keeps_packet_rate_down():
+    # Even 16 bytes take 2 ms to fill at 1 kHz of 8-byte scans
+    assert tuning.choose(1000, 8, 0.001).ps == 0
+    tuned = tuning.choose(1000, 8, 0.001, throughput=100000, max_packets_per_s=1000)
+    assert not tuned.meets_latency
+    assert 100000 * 8 / tuned.packet_bytes <= 1000
+    assert 100000 * 8 / tuning.PACKET_SIZES[tuned.ps - 1] > 1000
+
+
+def test_for_config():
+    config = AcquisitionConfig([0x0000, 0x0001, 0x0002, 0x0003], srate=60000, latency_budget=0.1)
+    assert tuning.for_config("DI-1100", config) == tuning.choose(1000, 8, 0.1)
+    # Without a budget the configured ps is kept
+    tuned = tuning.for_config("DI-2008", AcquisitionConfig(SLIST, srate=4, dec=20, ps=2))
+    assert (tuned.ps, tuned.packet_bytes, tuned.read_size) == (2, 64, 64 * 6)
+    with pytest.raises(ValueError):
+        tuning.for_config("DI-245", AcquisitionConfig(SLIST, srate=4))
+
+
+def test_configure_sends_tuned_packet_size():
+    config = AcquisitionConfig(SLIST, srate=4, dec=1, latency_budget=0.2)
+    with Simulator("DI-2008") as simulator:
+        with serial.Serial(simulator.port, 115200, timeout=0.5) as ser:
+            tuned = manager.configure(ser, "DI-2008", config)
+        assert tuned == tuning.for_config("DI-2008", config)
+        assert simulator.ps == tuned.ps == 2
+        assert simulator.scan_list() == SLIST
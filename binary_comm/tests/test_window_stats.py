@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from dataq.window_stats import QuantileSketch, WindowStats
+
+QUANTILES = (0.01, 0.25, 0.5, 0.9, 0.99)
+
+
+def _blocks(values, sizes):
+    # values split into blocks of the given sizes in turn
+    start = 0
+    while start < len(values):
+        for size in sizes:
+            yield values[start:start + size]
+            start += size
+
+
+def _check(summary, values, relative_accuracy):
+    # A Summary against numpy over the scans it covered
+    np.testing.assert_array_equal(summary.count, np.isfinite(values).sum(axis=0))
+    np.testing.assert_allclose(summary.mean, values.mean(axis=0), rtol=1e-12)
+    # About what float64 leaves of a 1e-3 spread on a 1e6 offset; summing
+    # squares directly would lose it entirely
+    np.testing.assert_allclose(summary.std, values.std(axis=0, ddof=1), rtol=1e-6)
+    np.testing.assert_array_equal(summary.minimum, values.min(axis=0))
+    np.testing.assert_array_equal(summary.maximum, values.max(axis=0))
+    # The sketch reports the value of rank ceil(q * n) to within its accuracy
+    exact = np.quantile(values, QUANTILES, axis=0, method="inverted_cdf")
+    np.testing.assert_array_less(np.abs(summary.quantiles - exact),
+                                 relative_accuracy * np.abs(exact) + 1e-12)
+
+
+def test_nested_windows_match_numpy():
+    rng = np.random.default_rng(0)
+    # Large offsets and small spread, where naive sums of squares lose precision
+    values = np.column_stack((1e6 + rng.normal(0, 1e-3, 6000), rng.normal(0, 5, 6000),
+                              -rng.lognormal(0, 2, 6000)))
+    stats = WindowStats(3, 100.0, windows=(2, 10, 30), quantiles=QUANTILES,
+                        relative_accuracy=0.01)
+    summaries = []
+    for block in _blocks(values, [1, 37, 499, 1024]):
+        summaries.extend(stats.update(block))
+
+    assert stats.scans == 6000
+    by_window = dict((seconds, [s for s in summaries if s.window == seconds])
+                     for seconds in (2, 10, 30))
+    assert [len(by_window[seconds]) for seconds in (2, 10, 30)] == [30, 6, 2]
+    for seconds, closed in by_window.items():
+        for index, summary in enumerate(closed):
+            scans = int(seconds * 100)
+            assert (summary.first, summary.scans) == (index * scans, scans)
+            _check(summary, values[summary.first:summary.first + scans], 0.01)
+    # Each longer window follows the shorter ones it was merged from
+    assert [s.window for s in summaries[:7]] == [2, 2, 2, 2, 2, 10, 2]
+    assert stats.flush() == []
+
+
+def test_flush_reports_partial_windows():
+    rng = np.random.default_rng(1)
+    values = rng.normal(10, 2, (1234, 2))
+    stats = WindowStats(2, 100.0, windows=(1, 5), quantiles=QUANTILES)
+    closed = stats.update(values)
+    assert [s.window for s in closed] == [1] * 5 + [5] + [1] * 5 + [5] + [1] * 2
+    flushed = stats.flush()
+    assert [(s.window, s.first, s.scans) for s in flushed] == [(1, 1200, 34), (5, 1000, 234)]
+    _check(flushed[0], values[1200:], 0.01)
+    _check(flushed[1], values[1000:], 0.01)
+    # Windows start over from the stream index reached
+    more = rng.normal(0, 1, (100, 2))
+    assert stats.update(more)[0].first == 1234
+    assert [(s.window, s.first, s.scans) for s in stats.flush()] == [(5, 1234, 100)]
+
+
+def test_non_finite_readings_are_left_out():
+    values = np.array([[1.0, np.inf, np.inf], [np.inf, 2.0, -np.inf], [3.0, 4.0, np.inf],
+                       [5.0, np.nan, -np.inf]])
+    stats = WindowStats(3, 4.0, windows=(1,), quantiles=(0.5,))
+    summary, = stats.update(values)
+    assert summary.scans == 4
+    np.testing.assert_array_equal(summary.count, [3, 2, 0])
+    np.testing.assert_allclose(summary.mean[:2], [3.0, 3.0])
+    np.testing.assert_allclose(summary.std[:2], [2.0, np.sqrt(2.0)])
+    np.testing.assert_array_equal(summary.minimum[:2], [1.0, 2.0])
+    np.testing.assert_array_equal(summary.maximum[:2], [5.0, 4.0])
+    # A channel with no finite readings reports NaN throughout
+    assert np.isnan([summary.mean[2], summary.std[2], summary.minimum[2], summary.maximum[2],
+                     summary.quantiles[0, 2]]).all()
+
+
+def test_one_reading_has_no_std():
+    stats = WindowStats(1, 1.0, windows=(1,))
+    summary, = stats.update([[7.5]])
+    assert summary.mean[0] == 7.5
+    assert np.isnan(summary.std[0])
+
+
+def test_sketch_merge_equals_single_sketch():
+    rng = np.random.default_rng(2)
+    values = np.column_stack((rng.normal(0, 100, 5000), rng.exponential(1e-3, 5000)))
+    values[::50] = 0.0
+    whole = QuantileSketch(2, 0.005)
+    whole.add(values)
+    merged = QuantileSketch(2, 0.005)
+    for part in np.array_split(values, 7):
+        sketch = QuantileSketch(2, 0.005)
+        sketch.add(part)
+        merged.merge(sketch)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    result = merged.quantiles(QUANTILES)
+    exact = np.quantile(values, QUANTILES, axis=0, method="inverted_cdf")
+    np.testing.assert_array_less(np.abs(result - exact), 0.005 * np.abs(exact) + 1e-12)
+
+
+def test_sketch_limits():
+    sketch = QuantileSketch(1, 0.01, min_value=1e-6, max_value=1e3)
+    sketch.add([[1e-8], [-1e-8], [5e6], [-5e6]])
+    result = sketch.quantiles([0.0, 0.5, 0.75, 1.0])[:, 0]
+    # Tiny magnitudes count as zero, huge ones as max_value
+    assert result[1] == result[2] == 0.0
+    assert result[0] == pytest.approx(-1e3, rel=0.01)
+    assert result[3] == pytest.approx(1e3, rel=0.01)
+    sketch.reset()
+    assert np.isnan(sketch.quantiles([0.5])).all()
+
+
+def test_invalid_windows():
+    with pytest.raises(ValueError):
+        WindowStats(1, 10.0, windows=(0.01,))
+    with pytest.raises(ValueError):
+        WindowStats(1, 10.0, windows=(1, 2.5))